@@ -3,8 +3,8 @@ API 数据模型定义
 
 API data models definition
 """
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Union
 from datetime import datetime
 
 # ==================== 请求模型 ====================
@@ -16,7 +16,15 @@ class TestSubmitRequest(BaseModel):
     Submit test task request
     """
     case_ids: List[int]
-    config_id: Optional[int] = None
+    config_id: Optional[Union[str, int]] = None  # 使用指定的模型配置（为空时使用当前激活的配置，兼容数字ID）
+    config_ids: Optional[List[Union[str, int]]] = None  # 同时在多个模型配置上运行（优先于 config_id）
+    prefetch_images: bool = False  # 是否预取图片到本地缓存并以 data URL 发送（失效图片不调用模型）
+    image_profiles: Optional[List[str]] = None  # 图片预处理方案（缩放/重新编码），多个方案时各执行一次并对比
+    precheck_mode: str = "sequential"  # 节点1-3调用方式：sequential 顺序调用，speculative 同时发起（延迟更低、调用更多），fused 合并为一次调用
+    concurrency: int = Field(default=1, ge=1, le=512)  # 并发执行的用例数量（线程池模式最多32）
+    async_mode: bool = False  # 是否使用异步模型客户端执行（适合高并发）
+    bypass_cache: bool = False  # 是否跳过响应缓存和历史输出复用（强制重新调用模型）
+    reuse_history: bool = False  # 是否复用历史运行中上游提示词一致的节点输出（默认关闭，调整单个节点提示词时开启）
 
 # ==================== 响应模型 ====================
 
@@ -51,7 +59,23 @@ class TaskStatusResponse(BaseModel):
     task_id: str
     status: str  # pending/running/completed/failed/cancelled
     progress: TaskProgress
+    concurrency: int = 1
+    async_mode: bool = False
+    bypass_cache: bool = False
+    config_ids: List[str] = []
+    prefetch_images: bool = False
+    image_failures: Dict[str, str] = {}  # 预取失败的图片 {url: 原因}
+    image_profiles: List[str] = []
+    image_preprocess: Dict[str, Any] = {}  # 各预处理方案的处理统计
+    precheck_mode: str = "sequential"
+    circuit_breaker: Dict[str, Any] = {}  # 熔断暂停中的服务端点 {endpoint: 熔断器状态}，为空表示未暂停
+    adaptive_concurrency: Dict[str, Any] = {}  # 自适应并发限制器状态 {config_id: 当前上限、进行中请求数等}
     results: List[Dict[str, Any]]
+    history_ids: List[str] = []  # 每个配置一份历史记录
+    comparison: Optional[Dict[str, Any]] = None  # 多配置对比报告
+    fingerprint: Optional[str] = None  # 提示词/参考图/模型配置指纹（续跑时校验）
+    resume_count: int = 0  # 续跑次数
+    checkpoint_cases: int = 0  # 最近一次续跑从检查点恢复的用例数
     submitted_at: datetime
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
@@ -67,5 +91,6 @@ class TaskListItem(BaseModel):
     status: str
     total_cases: int
     completed_cases: int
+    paused: bool = False  # 模型服务熔断，任务暂停中
     submitted_at: datetime
     completed_at: Optional[datetime] = None
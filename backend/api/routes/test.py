@@ -11,8 +11,14 @@ from backend.api.models import (
     TaskStatusResponse,
     TaskListItem
 )
-from backend.tasks.manager import TaskManager
-from backend.tasks.executor import execute_test_task
+from backend.tasks.manager import TaskManager, RESUMABLE_STATUSES
+from backend.tasks.executor import execute_test_task, get_task_fingerprint
+from src import response_cache as rc
+from src import config_manager as cm
+from src import image_preprocess as ip
+from src import workflow_engine as we
+from src import circuit_breaker as cb
+from src import client_pool as cp
 from datetime import datetime
 
 router = APIRouter()
@@ -34,17 +40,130 @@ async def submit_test(request: TestSubmitRequest, background_tasks: BackgroundTa
     Returns:
         TestSubmitResponse: 任务提交响应
     """
+    # 解析模型配置（config_ids 优先，其次 config_id，都为空时使用激活的配置）
+    config_ids = request.config_ids or ([request.config_id] if request.config_id is not None else [])
+    config_ids = list(dict.fromkeys(str(cid) for cid in config_ids))
+    for cid in config_ids:
+        try:
+            cm.get_config(cid)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # 解析图片预处理方案
+    image_profiles = list(dict.fromkeys(request.image_profiles or []))
+    for name in image_profiles:
+        try:
+            ip.check_supported(ip.get_profile(name))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    # 校验节点1-3调用方式
+    if request.precheck_mode not in we.PRECHECK_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"未知的节点1-3调用方式: {request.precheck_mode}（可选: {', '.join(we.PRECHECK_MODES)}）"
+        )
+    
     # 创建任务
-    task_id = task_manager.create_task(request.case_ids)
+    task_id = task_manager.create_task(
+        request.case_ids,
+        concurrency=request.concurrency,
+        async_mode=request.async_mode,
+        bypass_cache=request.bypass_cache,
+        reuse_history=request.reuse_history,
+        config_ids=config_ids,
+        prefetch_images=request.prefetch_images,
+        image_profiles=image_profiles,
+        precheck_mode=request.precheck_mode
+    )
     
     # 添加后台任务
-    background_tasks.add_task(execute_test_task, task_id, request.case_ids)
+    background_tasks.add_task(
+        execute_test_task,
+        task_id,
+        request.case_ids,
+        concurrency=request.concurrency,
+        async_mode=request.async_mode,
+        bypass_cache=request.bypass_cache,
+        reuse_history=request.reuse_history,
+        config_ids=config_ids,
+        prefetch_images=request.prefetch_images,
+        image_profiles=image_profiles,
+        precheck_mode=request.precheck_mode
+    )
     
     return TestSubmitResponse(
         task_id=task_id,
         status="pending",
         submitted_at=datetime.now(),
-        total_cases=len(request.case_ids)
+        total_cases=len(request.case_ids) * max(1, len(config_ids)) * max(1, len(image_profiles))
+    )
+
+# ==================== 续跑任务 ====================
+
+@router.post("/resume/{task_id}", response_model=TestSubmitResponse)
+async def resume_test(task_id: str, background_tasks: BackgroundTasks):
+    """
+    续跑已结束（取消、失败或中断）的任务
+    
+    Resume a finished (cancelled, failed or interrupted) task
+    
+    只重新执行缺失或结果为 error 的用例，其余用例使用检查点中的结果，合并为一份历史记录；
+    提示词、参考图或模型配置与任务指纹不一致时拒绝续跑
+    
+    Args:
+        task_id: 任务ID
+        background_tasks: FastAPI 后台任务
+    
+    Returns:
+        TestSubmitResponse: 任务提交响应
+    
+    Raises:
+        HTTPException: 任务不存在时抛出 404，任务正在执行或指纹不一致时抛出 409
+    """
+    task = task_manager.get_task(task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Task not found")
+    # 执行进程已退出但仍显示为执行中的任务先标记为 failed，再续跑
+    if task["status"] not in RESUMABLE_STATUSES and task_id in task_manager.recover_interrupted():
+        task = task_manager.get_task(task_id)
+    if task["status"] not in RESUMABLE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"任务状态为 {task['status']}，无法续跑")
+    
+    try:
+        fingerprint = get_task_fingerprint(task["config_ids"], task["image_profiles"], task["precheck_mode"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # 没有指纹的任务（执行前即失败）没有可合并的结果，可以直接续跑
+    if (task.get("fingerprint") or task["results"]) and task.get("fingerprint") != fingerprint:
+        raise HTTPException(
+            status_code=409,
+            detail="提示词、参考图或模型配置已变化，检查点中的结果无法合并，请重新提交任务"
+        )
+    
+    if not task_manager.resume_task(task_id, task.get("resume_count", 0) + 1):
+        raise HTTPException(status_code=409, detail="任务正在执行，无法续跑")
+    
+    background_tasks.add_task(
+        execute_test_task,
+        task_id,
+        task["case_ids"],
+        concurrency=task["concurrency"],
+        async_mode=task["async_mode"],
+        bypass_cache=task["bypass_cache"],
+        reuse_history=task["reuse_history"],
+        config_ids=task["config_ids"],
+        prefetch_images=task["prefetch_images"],
+        image_profiles=task["image_profiles"],
+        precheck_mode=task["precheck_mode"],
+        resume=True
+    )
+    
+    return TestSubmitResponse(
+        task_id=task_id,
+        status="pending",
+        submitted_at=task["submitted_at"],
+        total_cases=task["progress"]["total"]
     )
 
 # ==================== 查询任务状态 ====================
@@ -119,6 +238,7 @@ async def list_tasks(status: Optional[str] = None, limit: int = 10):
             "status": task["status"],
             "total_cases": task["progress"]["total"],
             "completed_cases": task["progress"]["completed"],
+            "paused": bool(task.get("circuit_breaker")),
             "submitted_at": task["submitted_at"],
             "completed_at": task.get("completed_at")
         })
@@ -140,15 +260,75 @@ async def get_stats():
     Returns:
         dict: 统计信息
     """
-    all_tasks = task_manager.list_tasks(limit=1000)
+    counts = task_manager.count_by_status()
+    running_tasks = task_manager.list_tasks(status="running", limit=1000)
     
     stats = {
-        "total": len(all_tasks),
-        "pending": len([t for t in all_tasks if t["status"] == "pending"]),
-        "running": len([t for t in all_tasks if t["status"] == "running"]),
-        "completed": len([t for t in all_tasks if t["status"] == "completed"]),
-        "failed": len([t for t in all_tasks if t["status"] == "failed"]),
-        "cancelled": len([t for t in all_tasks if t["status"] == "cancelled"])
+        "total": sum(counts.values()),
+        "pending": counts.get("pending", 0),
+        "running": counts.get("running", 0),
+        "completed": counts.get("completed", 0),
+        "failed": counts.get("failed", 0),
+        "cancelled": counts.get("cancelled", 0),
+        "paused": len([t for t in running_tasks if t.get("circuit_breaker")])
     }
     
     return stats
+
+# ==================== 响应缓存 ====================
+
+@router.get("/cache")
+async def get_cache_stats():
+    """
+    获取模型响应缓存统计
+    
+    Get model response cache statistics
+    
+    Returns:
+        dict: 缓存统计（命中/未命中次数、命中率、条目数、大小）
+    """
+    cache = rc.get_response_cache()
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.get_stats()}
+
+@router.delete("/cache")
+async def clear_cache():
+    """
+    清空模型响应缓存
+    
+    Clear model response cache
+    
+    Returns:
+        dict: 清空结果
+    """
+    cache = rc.get_response_cache()
+    if cache is not None:
+        cache.clear()
+    return {"message": "Cache cleared successfully"}
+
+# ==================== 熔断器 ====================
+
+@router.get("/circuit")
+async def get_circuit_stats():
+    """
+    获取各模型服务端点的熔断器状态
+    
+    Get circuit breaker state of each model endpoint
+    
+    Returns:
+        dict: 熔断器列表（状态、连续失败次数、打开次数、距离探测的秒数、最近错误）
+    """
+    return {"breakers": cb.get_all_stats()}
+
+@router.get("/pools")
+async def get_pool_stats():
+    """
+    获取客户端池中各配置的请求分配和健康状态
+    
+    Get request distribution and health of each config in the client pools
+    
+    Returns:
+        dict: 客户端池列表（选择策略，各配置的权重、进行中请求数、请求数、失败数、是否可用）
+    """
+    return {"pools": cp.get_all_stats()}
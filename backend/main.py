@@ -7,7 +7,10 @@ Provides test task management API
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from backend.api.routes import test
+from backend.tasks.manager import TaskManager
+from src import metrics
 
 app = FastAPI(
     title="VLM Test API",
@@ -25,6 +28,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ==================== 运行指标 ====================
+TASK_STATUSES = ("pending", "running", "completed", "failed", "cancelled")
+TASKS = metrics.REGISTRY.gauge("vlm_tasks", "按状态统计的任务数（pending 即任务队列深度）", ("status",))
+
+
+def _collect_task_counts():
+    """刷新任务数指标"""
+    counts = TaskManager().count_by_status()
+    for status in TASK_STATUSES:
+        TASKS.set(counts.get(status, 0), status=status)
+
+
+metrics.REGISTRY.add_collector(_collect_task_counts)
+
 # ==================== 注册路由 ====================
 app.include_router(test.router, prefix="/api/test", tags=["test"])
 
@@ -42,3 +59,8 @@ def root():
 def health():
     """健康检查"""
     return {"status": "ok"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus 指标（文本格式）"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
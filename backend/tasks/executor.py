@@ -7,29 +7,715 @@ Responsible for actually executing test tasks
 """
 import sys
 import os
+import copy
+import json
+import time
+import hashlib
+import asyncio
 from datetime import datetime
+from threading import Lock
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 添加项目根目录到路径
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, PROJECT_ROOT)
 
 from src import data_manager as dm
+from src import config_manager as cm
+from src import model_client as mc
+from src import node_memo as nm
 from src import workflow_engine as we
+from src import metrics
+from src import image_cache as ic
+from src import image_preprocess as ip
+from src import ref_registry as rr
+from src import retry_policy as rp
+from src import circuit_breaker as cb
+from src import call_context as cc
 from backend.tasks.manager import TaskManager
 
 task_manager = TaskManager()
 
-def execute_test_task(task_id: str, case_ids: list):
+# ==================== 并发配置 ====================
+DEFAULT_CONCURRENCY = 1  # 默认并发数（串行执行）
+MAX_CONCURRENCY = 32  # 线程池模式下单个任务允许的最大并发数
+MAX_ASYNC_CONCURRENCY = 512  # 异步模式下单个任务允许的最大并发数（不占用线程）
+
+# ==================== 熔断暂停配置 ====================
+MAX_CIRCUIT_PAUSE = 600  # 模型服务熔断后任务最长暂停时间（秒），超过后任务失败
+CIRCUIT_POLL_INTERVAL = 1.0  # 暂停期间检查熔断器状态和任务取消的间隔（秒）
+
+
+def _is_cancelled(task_id: str) -> bool:
     """
-    执行测试任务
-    在后台线程中运行
+    检查任务是否已被取消
+
+    Check whether the task has been cancelled
+
+    Args:
+        task_id: 任务ID
+
+    Returns:
+        bool: 是否已取消
+    """
+    return task_manager.get_status(task_id) == "cancelled"
+
+
+def _evaluate_result(result: dict, case_info: dict, tag_node_map: dict) -> dict:
+    """
+    补充用例信息并判断正确性、精准度
+
+    Attach case information and evaluate correctness and precision
+
+    Args:
+        result: 工作流返回结果
+        case_info: 测试用例信息
+        tag_node_map: 标签到预期节点的映射
+
+    Returns:
+        dict: 补充后的结果
+    """
+    # 添加用例信息
+    result["case_id"] = case_info["case_id"]
+    result["car"] = case_info["car"]
+    result["case_type"] = case_info["case_type"]
+    result["problem_tag"] = case_info.get("problem_tag", "")
+    result["case_url"] = case_info["case_url"]
+
+    # 判断正确性
+    if case_info["case_type"] == "badcase":
+        is_correct = (result["final_pass"] == "no")
+    else:
+        is_correct = (result["final_pass"] == "yes")
+    result["is_correct"] = is_correct
+
+    # 计算精准度
+    is_precise = False
+    if case_info["case_type"] == "badcase":
+        problem_tag = case_info.get("problem_tag", "")
+        expected_node = tag_node_map.get(problem_tag, 0)
+        actual_node = result.get("finish_at_step", 0)
+        is_precise = (result["final_pass"] == "no" and expected_node == actual_node)
+    else:
+        is_precise = (result["final_pass"] == "yes" and result.get("finish_at_step", 0) == 5)
+    result["is_precise"] = is_precise
+
+    return result
+
+
+async def _run_jobs_async(jobs: list, concurrency: int, run_job):
+    """
+    在当前事件循环中并发执行用例
+
+    Run cases concurrently on the current event loop
+
+    Args:
+        jobs: (idx, case_info, ref_set) 列表
+        concurrency: 最大同时执行的用例数
+        run_job: 单个用例的协程函数
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _guarded(job):
+        async with semaphore:
+            await run_job(*job)
+
+    try:
+        await asyncio.gather(*(_guarded(job) for job in jobs))
+    finally:
+        # 事件循环结束前关闭共享连接池
+        await mc.close_async_pool()
+
+
+def _prefetch_images(jobs: list, registry: rr.RefSetRegistry):
+    """
+    并行预取任务中的所有图片，剔除失效图片
+
+    Prefetch every image of the task in parallel and drop dead URLs
+
+    生成图失效的用例不再调用模型；失效的参考图从参考图集合中移除（每个集合只处理一次），
+    节点4只使用剩余参考图
+
+    Args:
+        jobs: (idx, case_info, ref_set) 列表
+        registry: 任务的参考图集合注册表
+
+    Returns:
+        tuple: (可执行的 jobs, {idx: (case_info, 失败原因)}, {url: 失败原因})
+    """
+    cache = ic.get_image_cache()
+    failures = registry.prefetch(cache)
+    failures.update(cache.prefetch([case_info["case_url"] for _, case_info, _ in jobs]))
     
-    Execute test task
-    Runs in background thread
+    runnable = []
+    dead_cases = {}
+    for idx, case_info, ref_set in jobs:
+        if case_info["case_url"] in failures:
+            dead_cases[idx] = (case_info, failures[case_info["case_url"]])
+            continue
+        runnable.append((idx, case_info, ref_set))
+    return runnable, dead_cases, failures
+
+
+def _node_images(jobs: list, registry: rr.RefSetRegistry) -> list:
+    """
+    列出每个节点会发送的图片，用于按节点预处理
+
+    List the images each node sends, for per-node preprocessing
+
+    Args:
+        jobs: (idx, case_info, ref_set) 列表
+        registry: 任务的参考图集合注册表
+
+    Returns:
+        list: [(url, node, role)]，role 为 gen（生成图）或 ref（参考图）
+    """
+    images = []
+    for node in we.WORKFLOW_NODES:
+        for _, case_info, _ in jobs:
+            images.append((case_info["case_url"], node.index, "gen"))
+        # 参考图按集合列出，每个集合只列一次
+        if node.call_kind != "single":
+            for ref_set in registry.ref_sets():
+                images.extend((url, node.index, "ref") for url in ref_set)
+    return images
+
+
+def _group_by_car(jobs: list) -> list:
+    """
+    按车型分组排列用例（组内保持提交顺序），同一车型的用例连续执行，
+    共用的参考图前缀更容易命中模型服务端的前缀缓存
+
+    Order jobs grouped by car (keeping submission order within a group), so that
+    the shared reference prefix is more likely to hit the provider-side prefix cache
+
+    Args:
+        jobs: (idx, case_info, ref_set) 列表
+
+    Returns:
+        list: 重新排列后的 jobs
+    """
+    first_seen = {}
+    for idx, case_info, _ in jobs:
+        first_seen.setdefault(case_info["car"], idx)
+    return sorted(jobs, key=lambda job: (first_seen[job[1]["car"]], job[0]))
+
+
+def _dedupe_jobs(jobs: list):
+    """
+    合并同一车型下图片相同（case_url 相同）的用例，每组只执行一次工作流
+
+    Collapse cases sharing the same car and case_url so that each group runs the workflow once
+
+    Args:
+        jobs: (idx, case_info, ref_set) 列表
+
+    Returns:
+        tuple: (需要执行的 jobs, {执行用例的 idx: [(重复用例的 idx, case_info), ...]})
+    """
+    primaries = {}
+    unique_jobs = []
+    duplicates = {}
+    for job in jobs:
+        idx, case_info, _ = job
+        key = (case_info["car"], case_info["case_url"])
+        primary = primaries.get(key)
+        if primary is None:
+            primaries[key] = idx
+            unique_jobs.append(job)
+        else:
+            duplicates.setdefault(primary, []).append((idx, case_info))
+    return unique_jobs, duplicates
+
+
+def _duplicate_result(result: dict, primary_case_id) -> dict:
+    """
+    为重复用例复制执行用例的工作流结果
+
+    调用统计和节点指标清零（模型调用只发生一次，已计入执行用例），duplicate_of 记录执行用例ID
+
+    Copy the workflow result of the executed case for a duplicate case; call stats and node
+    metrics are reset so the single set of model calls is not counted twice
+
+    Args:
+        result: 执行用例的工作流结果（补充用例信息前）
+        primary_case_id: 执行用例ID
+
+    Returns:
+        dict: 重复用例的工作流结果
+    """
+    duplicate = copy.deepcopy(result)
+    duplicate["call_stats"] = cc.CallContext().to_dict()
+    duplicate["node_metrics"] = {}
+    duplicate["duplicate_of"] = primary_case_id
+    return duplicate
+
+
+# ==================== 检查点与续跑 ====================
+
+def _load_prompts(precheck_mode: str) -> dict:
+    """
+    加载提示词（节点1-3合并调用时优先使用专用合并提示词，不存在时由节点1-3提示词拼接）
+
+    Load prompts (the dedicated fused prompt is added in fused mode when present)
+    """
+    prompts = dm.get_prompts()
+    if precheck_mode == we.PRECHECK_FUSED:
+        fused_prompt = dm.get_fused_prompt()
+        if fused_prompt is not None:
+            prompts[we.FUSED_PROMPT_KEY] = fused_prompt
+    return prompts
+
+
+def _load_clients(config_ids: Optional[List[str]]) -> list:
+    """
+    每个配置一个客户端（按配置ID复用，重新加载以使用最新配置）
+
+    One client per config (reused by config id, reloaded to pick up the latest config)
+    """
+    if config_ids:
+        return [mc.get_client(force_reload=True, config_id=cid) for cid in config_ids]
+    return [mc.get_client()]
+
+
+def _client_configs(config_ids: Optional[List[str]]) -> list:
+    """
+    读取各配置对应客户端的配置（池化配置按池整体归类，与 ClientPool.config 一致），不创建客户端
+
+    Read the config each client would use (pooled configs are keyed by pool, as in ClientPool.config)
+    without building clients
+
+    Raises:
+        ValueError: 配置不存在或池中模型不一致
+    """
+    configs = []
+    for config in ([cm.get_config(cid) for cid in config_ids] if config_ids else [cm.get_active_config()]):
+        pool = cm.get_pool_name(config)
+        configs.append(config if pool is None else dict(cm.get_pool_configs(pool)[0], config_id=pool))
+    return configs
+
+
+def _task_fingerprint(prompts: dict, refs_df, configs: list, profiles: list, precheck_mode: str) -> str:
+    """
+    任务指纹：提示词、参考图、模型配置、图片预处理方案和节点1-3调用方式的哈希
+
+    指纹相同时检查点中的结果与重新执行的结果可比，续跑后可以合并为一份历史记录
+
+    Task fingerprint over prompts, reference images, model configs, image profiles and precheck mode;
+    checkpointed results are only merged with new ones when the fingerprint is unchanged
+
+    Returns:
+        str: 16位十六进制哈希
+    """
+    payload = {
+        "prompts": nm.get_prompt_hashes(prompts),
+        "refs": nm.prompt_hash(refs_df.to_json(orient="records", force_ascii=False)),
+        "configs": [we.get_model_config(config) for config in configs],
+        "image_profiles": [[profile.name, profile.key] for profile in profiles],
+        "precheck_mode": precheck_mode
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def get_task_fingerprint(config_ids: Optional[List[str]] = None, image_profiles: Optional[List[str]] = None,
+                         precheck_mode: str = we.PRECHECK_SEQUENTIAL) -> str:
+    """
+    按当前的提示词、参考图和模型配置计算任务指纹（续跑前与任务记录的指纹比较）
+
+    Compute the task fingerprint from the current prompts, references and configs
+    (compared with the recorded fingerprint before resuming)
+
+    Args:
+        config_ids: 模型配置ID列表，为空时使用当前激活的配置
+        image_profiles: 图片预处理方案名称列表
+        precheck_mode: 节点1-3调用方式
+
+    Returns:
+        str: 任务指纹
+
+    Raises:
+        ValueError: 配置或图片预处理方案不存在
+    """
+    # 只读取配置，不重建进程内缓存的客户端（重新加载由 execute_test_task 在执行时进行）
+    profiles = [ip.get_profile(name) for name in (image_profiles or [ip.DEFAULT_PROFILE])]
+    return _task_fingerprint(
+        _load_prompts(precheck_mode), dm.get_refs(), _client_configs(config_ids), profiles, precheck_mode
+    )
+
+
+def _load_checkpoints(results: list) -> dict:
+    """
+    索引任务已保存的用例结果（检查点），final_pass 为 error 的结果需要重新执行
+
+    Index the saved case results of a task; errored results are re-run
+
+    Args:
+        results: 任务存储中的用例结果
+
+    Returns:
+        dict: {(config_id, image_profile, case_id): 结果}
+    """
+    checkpoints = {}
+    for result in results:
+        if result.get("final_pass") == "error":
+            continue
+        key = (str(result.get("config_id")), result.get("image_profile"), result.get("case_id"))
+        checkpoints.setdefault(key, result)
+    return checkpoints
+
+
+def _variant_checkpoints(jobs: list, checkpoints: dict, client, profile) -> dict:
+    """
+    一个 (配置, 图片方案) 组合中已完成的用例
+
+    Returns:
+        dict: {idx: 检查点中的结果}
+    """
+    config_id = we.get_model_config(client.config)["config_id"]
+    done = {}
+    for idx, case_info, _ in jobs:
+        result = checkpoints.get((config_id, profile.name, case_info["case_id"]))
+        if result is not None:
+            done[idx] = result
+    return done
+
+
+class _ProgressTracker:
+    """
+    任务进度（多个配置共享，线程安全）
+
+    Task progress shared by all configs of a task (thread-safe)
+    """
+
+    def __init__(self, task_id: str, total: int, queued: int, limiters: Optional[list] = None):
+        """
+        Args:
+            task_id: 任务ID
+            total: 用例总数（用例数 × 配置数）
+            queued: 实际排队执行的用例数
+            limiters: 任务使用的自适应并发限制器（状态随进度一起更新）
+        """
+        self.task_id = task_id
+        self.total = total
+        self.queued = queued
+        self.limiters = limiters or []
+        self.finished = []
+        self.failed = 0
+        # 熔断暂停中的服务端点 {endpoint: 开始暂停时间}
+        self.paused_since = {}
+        self.lock = Lock()
+
+    def _update(self, current_case_id, new_results=None):
+        # 调用方需持有 lock
+        task_manager.update_task(self.task_id, {
+            "progress": {
+                "total": self.total,
+                "completed": len(self.finished),
+                "failed": self.failed,
+                "current_case_id": current_case_id
+            },
+            "adaptive_concurrency": self.adaptive_stats()
+        }, new_results=new_results)
+
+    def adaptive_stats(self):
+        """
+        自适应并发限制器的当前状态
+
+        Current state of the adaptive concurrency limiters
+
+        Returns:
+            dict: {config_id: 限制器状态}
+        """
+        return {limiter.key[0]: limiter.get_stats() for limiter in self.limiters}
+
+    def restore(self, results):
+        """计入从检查点恢复的用例（结果已在任务存储中）"""
+        with self.lock:
+            self.finished.extend(results)
+            self.failed += len([r for r in results if not r.get("is_correct", False)])
+
+    def start(self, case_id):
+        """用例出队，返回开始时间；任务已取消时返回 None"""
+        with self.lock:
+            self.queued -= 1
+        metrics.CASES_QUEUED.dec()
+        # 检查是否被取消（已开始的用例会执行完，未开始的直接跳过）
+        if _is_cancelled(self.task_id):
+            return None
+        with self.lock:
+            self._update(case_id)
+        return time.perf_counter()
+
+    def finish(self, case_id, result):
+        """记录完成的用例（结果立即写入任务存储）"""
+        with self.lock:
+            self.finished.append(result)
+            if not result.get("is_correct", False):
+                self.failed += 1
+            self._update(case_id, new_results=[result])
+
+    def check_circuit(self, breakers):
+        """
+        检查客户端的熔断状态，所有服务端点都熔断时把任务标记为暂停
+
+        Check the client's circuit breakers and mark the task as paused while all of them are open
+
+        Args:
+            breakers: 客户端请求经过的熔断器列表（客户端池时为池中每个配置一个）
+
+        Returns:
+            bool: 是否可以发出请求（False 时调用方等待后重新检查）
+
+        Raises:
+            CircuitOpenError: 暂停时间超过 MAX_CIRCUIT_PAUSE
+        """
+        closed = any(breaker.state == cb.CLOSED for breaker in breakers)
+        available = closed or any(breaker.available() for breaker in breakers)
+        now = time.monotonic()
+        with self.lock:
+            if closed:
+                resumed = [self.paused_since.pop(b.endpoint, None) for b in breakers]
+                if any(since is not None for since in resumed):
+                    self._update_circuit()
+                return True
+            for breaker in breakers:
+                self.paused_since.setdefault(breaker.endpoint, now)
+            since = min(self.paused_since[breaker.endpoint] for breaker in breakers)
+            self._update_circuit()
+        if now - since > MAX_CIRCUIT_PAUSE:
+            endpoints = ", ".join(breaker.endpoint for breaker in breakers)
+            raise rp.CircuitOpenError(
+                f"模型服务 {endpoints} 持续不可用超过 {MAX_CIRCUIT_PAUSE}s，任务终止：{breakers[0].last_error}"
+            )
+        return available
+
+    def _update_circuit(self):
+        # 调用方需持有 lock
+        now = time.monotonic()
+        breakers = {}
+        for endpoint, since in self.paused_since.items():
+            breakers[endpoint] = {"paused_s": round(now - since, 1)}
+        for stats in cb.get_all_stats():
+            if stats["endpoint"] in breakers:
+                breakers[stats["endpoint"]].update(stats)
+        task_manager.update_task(self.task_id, {"circuit_breaker": breakers})
+
+
+def _circuit_rejected(result: dict) -> bool:
+    """
+    用例是否因服务端点熔断而未执行完（熔断恢复后重新执行）
+
+    Whether the case was cut short by an open circuit breaker (rerun after recovery)
+    """
+    parse_output = result.get("parse_output")
+    return (result.get("final_pass") == "error" and isinstance(parse_output, dict)
+            and parse_output.get("error_type") == rp.CircuitOpenError.kind)
+
+
+def _wait_for_circuit(breakers: list, progress: _ProgressTracker) -> bool:
+    """
+    熔断期间阻塞等待，直到熔断器放行请求
+
+    Block while the circuit is open until a breaker admits requests
+
+    Args:
+        breakers: 客户端请求经过的熔断器列表（未启用熔断时为空）
+        progress: 任务进度
+
+    Returns:
+        bool: 可以继续执行返回 True，等待期间任务被取消返回 False
+    """
+    if not breakers:
+        return True
+    while not progress.check_circuit(breakers):
+        if _is_cancelled(progress.task_id):
+            return False
+        breakers[0].wait(min(CIRCUIT_POLL_INTERVAL, max(0.05, min(b.retry_in() for b in breakers))))
+    return True
+
+
+async def _wait_for_circuit_async(breakers: list, progress: _ProgressTracker) -> bool:
+    """
+    熔断期间异步等待（逻辑与 _wait_for_circuit 一致，轮询不阻塞事件循环）
+
+    Wait asynchronously while the circuit is open (polls without blocking the event loop)
+    """
+    if not breakers:
+        return True
+    while not progress.check_circuit(breakers):
+        if _is_cancelled(progress.task_id):
+            return False
+        await asyncio.sleep(min(CIRCUIT_POLL_INTERVAL, max(0.05, min(b.retry_in() for b in breakers))))
+    return True
+
+
+def _run_case_set(jobs: list, prompts: dict, tag_node_map: dict, client, memo, image_profile,
+                  concurrency: int, async_mode: bool, bypass_cache: bool,
+                  progress: _ProgressTracker, dead_cases: dict, inline_images: bool,
+                  precheck_mode: str, checkpoints: Optional[dict] = None) -> list:
+    """
+    使用一个模型配置执行整个用例集
+
+    Run the whole case set against one model config
+
+    模型服务熔断期间暂停执行（任务进度中标记 circuit_breaker），恢复后继续；
+    因熔断未执行完的用例在恢复后重新执行；
+    同一车型下 case_url 相同的用例只执行一次，结果分发给每个 case_id；
+    检查点中已完成的用例（续跑）不再执行，直接使用保存的结果
+
+    Args:
+        jobs: (idx, case_info, ref_set) 列表
+        prompts: 提示词字典
+        tag_node_map: 标签到预期节点的映射
+        client: 该配置的模型客户端（ModelClient）
+        memo: 节点输出复用索引（NodeMemo 或 None）
+        image_profile: 图片预处理方案（ImageProfile）
+        concurrency: 该配置的并发数
+        async_mode: 是否使用异步模型客户端执行
+        bypass_cache: 是否跳过响应缓存
+        progress: 任务进度
+        dead_cases: 生成图失效的用例 {idx: (case_info, 失败原因)}，直接记为 error
+        inline_images: 是否以本地缓存图片的 data URL 发送图片
+        precheck_mode: 节点1-3调用方式（顺序 / 投机并行）
+        checkpoints: 该组合已完成的用例 {idx: 结果}（续跑），已计入任务进度
+
+    Returns:
+        list: 按提交顺序排列的结果（含检查点中的结果）
+    """
+    # 结果按提交顺序存放，保证并发执行时结果顺序不变
+    checkpoints = checkpoints or {}
+    results_by_index = dict(checkpoints)
+    dispatched_at = time.perf_counter()
+    jobs, duplicates = _dedupe_jobs([job for job in jobs if job[0] not in checkpoints])
+    
+    def _finish_job(idx, case_info, result, started):
+        copies = [
+            (dup_idx, dup_info, _duplicate_result(result, case_info["case_id"]))
+            for dup_idx, dup_info in duplicates.get(idx, ())
+        ]
+        _record_job(idx, case_info, result, started)
+        # 重复用例出队后直接使用执行用例的结果（任务已取消时跳过）
+        for dup_idx, dup_info, dup_result in copies:
+            if progress.start(dup_info["case_id"]) is None:
+                continue
+            _record_job(dup_idx, dup_info, dup_result, started)
+    
+    def _record_job(idx, case_info, result, started):
+        # 用例级耗时：排队等待（等待空闲并发槽位）和执行耗时
+        result["case_queue_wait_ms"] = round((started - dispatched_at) * 1000, 1)
+        result["case_latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        metrics.record_case(result.get("final_pass"), result["case_latency_ms"] / 1000)
+        result = _evaluate_result(result, case_info, tag_node_map)
+        result["config_id"] = result["model_config"].get("config_id")
+        results_by_index[idx] = result
+        progress.finish(case_info["case_id"], result)
     
+    for idx, (case_info, reason) in dead_cases.items():
+        if idx in checkpoints:
+            continue
+        result = we.image_unavailable_result(reason, client, image_profile)
+        _finish_job(idx, case_info, result, dispatched_at)
+    
+    if async_mode:
+        async def _run_job_async(idx, case_info, ref_set):
+            started = progress.start(case_info["case_id"])
+            if started is None:
+                return
+            while True:
+                if not await _wait_for_circuit_async(client.circuit_breakers(), progress):
+                    return
+                metrics.CASES_RUNNING.inc()
+                try:
+                    result = await we.run_workflow_for_case_async(
+                        case_info, ref_set, prompts, bypass_cache=bypass_cache, memo=memo, client=client,
+                        inline_images=inline_images, image_profile=image_profile, precheck_mode=precheck_mode
+                    )
+                finally:
+                    metrics.CASES_RUNNING.dec()
+                if not _circuit_rejected(result):
+                    break
+            _finish_job(idx, case_info, result, started)
+        
+        asyncio.run(_run_jobs_async(jobs, concurrency, _run_job_async))
+    else:
+        def _run_job(idx, case_info, ref_set):
+            started = progress.start(case_info["case_id"])
+            if started is None:
+                return
+            while True:
+                if not _wait_for_circuit(client.circuit_breakers(), progress):
+                    return
+                metrics.CASES_RUNNING.inc()
+                try:
+                    result = we.run_workflow_for_case(
+                        case_info, ref_set, prompts, bypass_cache=bypass_cache, memo=memo, client=client,
+                        inline_images=inline_images, image_profile=image_profile, precheck_mode=precheck_mode
+                    )
+                finally:
+                    metrics.CASES_RUNNING.dec()
+                if not _circuit_rejected(result):
+                    break
+            _finish_job(idx, case_info, result, started)
+        
+        # 并发执行测试用例
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="case") as pool:
+            futures = [pool.submit(_run_job, *job) for job in jobs]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                # 任一用例抛出异常时放弃尚未开始的用例
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+    
+    return [results_by_index[idx] for idx in sorted(results_by_index)]
+
+
+def execute_test_task(task_id: str, case_ids: list, concurrency: int = DEFAULT_CONCURRENCY,
+                      async_mode: bool = False, bypass_cache: bool = False,
+                      reuse_history: bool = False, config_ids: Optional[List[str]] = None,
+                      prefetch_images: bool = False, image_profiles: Optional[List[str]] = None,
+                      precheck_mode: str = we.PRECHECK_SEQUENTIAL, resume: bool = False):
+    """
+    执行测试任务
+    在后台线程中运行，用例通过有界线程池并发执行；
+    异步模式下在独立事件循环中用信号量限制并发，所有请求共享一个长连接池；
+    指定多个配置（或多个图片预处理方案）时，同一用例集在各组合上并行执行
+    （每个配置独立的客户端、限流器和并发数），每个组合保存一份历史记录，并生成一份对比报告
+    模型服务熔断时任务暂停（状态仍为 running，circuit_breaker 字段列出熔断中的服务端点），
+    探测成功后自动继续；暂停超过 MAX_CIRCUIT_PAUSE 秒时任务失败；
+    同一车型下 case_url 相同的用例只执行一次工作流，结果（duplicate_of 标记执行用例）分发给每个 case_id；
+    每个用例完成时结果写入任务存储（检查点），续跑时只执行缺失或结果为 error 的用例，
+    与检查点中的结果合并为一份历史记录（替换之前保存的部分历史记录）
+
+    Execute test task
+    Runs in background thread, cases are executed by a bounded worker pool;
+    in async mode cases run on a dedicated event loop bounded by a semaphore,
+    sharing one keep-alive connection pool; with several configs the same case set
+    runs against each config (or image profile) in parallel (own client, rate limiter
+    and concurrency), saving one history record per run plus a comparison report
+    while the model endpoint's circuit breaker is open the task pauses (status stays running,
+    circuit_breaker lists the affected endpoints) and resumes after a successful probe;
+    pausing longer than MAX_CIRCUIT_PAUSE seconds fails the task;
+    cases sharing the same car and case_url run the workflow once and the result is fanned out;
+    every finished case is checkpointed in the task store, and a resumed task only runs the missing
+    or errored cases, merging them with the checkpoints into one history record
+
     Args:
         task_id: 任务ID
         case_ids: 测试用例ID列表
+        concurrency: 每个配置并发执行的用例数量（1 表示串行）；配置开启自适应并发时作为上限，
+            同时进行中的模型请求数由限制器自动调整
+        async_mode: 是否使用异步模型客户端执行
+        bypass_cache: 是否跳过响应缓存和历史输出复用（强制重新调用模型）
+        reuse_history: 是否复用历史运行中上游一致的节点输出（默认关闭）
+        config_ids: 模型配置ID列表，为空时使用当前激活的配置
+        prefetch_images: 是否预取图片到本地缓存，并以 data URL 发送（失效图片不再调用模型）
+        image_profiles: 图片预处理方案名称列表，为空时原图发送；多个方案时每个方案各执行一次并生成对比报告
+        precheck_mode: 节点1-3调用方式，sequential 顺序调用，speculative 同时发起（延迟更低、调用更多），
+            fused 合并为一次调用（调用和图片令牌最少）
+        resume: 是否续跑（复用任务检查点中的结果，提示词和配置须与任务指纹一致）
     """
     try:
         # 更新状态为 running
@@ -41,7 +727,7 @@ def execute_test_task(task_id: str, case_ids: list):
         # 加载数据
         cases_df = dm.get_test_cases()
         refs_df = dm.get_refs()
-        prompts = dm.get_prompts()
+        prompts = _load_prompts(precheck_mode)
         tags_df = dm.get_problem_tags()
         
         # 构建标签映射
@@ -50,87 +736,148 @@ def execute_test_task(task_id: str, case_ids: list):
             for _, row in tags_df.iterrows():
                 tag_node_map[row["tag_content"]] = int(row["expected_filter_node"])
         
-        results = []
+        # 预先解析用例和参考图，缺失的用例直接跳过；
+        # 同一车型的参考图集合只准备一次（校验、预取、编码），所有用例共用
+        registry = rr.RefSetRegistry()
+        # 先按 case_id / car 建立索引（同一ID有多行时取第一行），避免每个用例扫描整张表
+        cases_by_id = {}
+        for case_info in cases_df.to_dict("records"):
+            cases_by_id.setdefault(case_info["case_id"], case_info)
+        refs_by_car = {}
+        for ref_data in refs_df.to_dict("records"):
+            refs_by_car.setdefault(ref_data["car"], ref_data)
         
-        # 逐个执行测试用例
+        jobs = []
         for idx, case_id in enumerate(case_ids):
-            # 检查是否被取消
-            task = task_manager.get_task(task_id)
-            if task and task["status"] == "cancelled":
-                break
-            
-            # 更新当前进度
-            task_manager.update_task(task_id, {
-                "progress": {
-                    "total": len(case_ids),
-                    "completed": idx,
-                    "failed": len([r for r in results if not r.get("is_correct", False)]),
-                    "current_case_id": case_id
-                }
-            })
-            
-            # 获取用例信息
-            case_row = cases_df[cases_df["case_id"] == case_id]
-            if case_row.empty:
+            case_info = cases_by_id.get(case_id)
+            if case_info is None:
                 continue
             
-            case_info = case_row.iloc[0].to_dict()
-            
-            # 获取参考图
-            ref_row = refs_df[refs_df["car"] == case_info["car"]]
-            if ref_row.empty:
+            ref_data = refs_by_car.get(case_info["car"])
+            if ref_data is None:
                 continue
             
-            ref_data = ref_row.iloc[0].to_dict()
-            
-            # 执行工作流
-            result = we.run_workflow_for_case(case_info, ref_data, prompts)
-            
-            # 添加用例信息
-            result["case_id"] = case_info["case_id"]
-            result["car"] = case_info["car"]
-            result["case_type"] = case_info["case_type"]
-            result["problem_tag"] = case_info.get("problem_tag", "")
-            result["case_url"] = case_info["case_url"]
-            
-            # 判断正确性
-            if case_info["case_type"] == "badcase":
-                is_correct = (result["final_pass"] == "no")
-            else:
-                is_correct = (result["final_pass"] == "yes")
-            result["is_correct"] = is_correct
-            
-            # 计算精准度
-            is_precise = False
-            if case_info["case_type"] == "badcase":
-                problem_tag = case_info.get("problem_tag", "")
-                expected_node = tag_node_map.get(problem_tag, 0)
-                actual_node = result.get("finish_at_step", 0)
-                is_precise = (result["final_pass"] == "no" and expected_node == actual_node)
+            jobs.append((idx, dict(case_info), registry.get(case_info["car"], ref_data)))
+        jobs = _group_by_car(jobs)
+        
+        # 图片预处理方案（每个方案在每个配置上各执行一次）
+        profiles = [ip.get_profile(name) for name in (image_profiles or [ip.DEFAULT_PROFILE])]
+        # 缺少 Pillow 时需要处理图片的方案直接失败，不能把原图的结果记为该方案的结果
+        for profile in profiles:
+            ip.check_supported(profile)
+        # 缩放/重新编码需要本地图片，自动开启预取
+        if any(p.transforms_image for p in profiles):
+            prefetch_images = True
+        
+        # 每个配置一个客户端（按配置ID复用，任务开始时重新加载以使用最新配置）
+        clients = _load_clients(config_ids)
+        
+        # 任务指纹：续跑时提示词、参考图和配置必须与首次执行时一致，检查点中的结果才能合并
+        fingerprint = _task_fingerprint(
+            prompts, refs_df, [client.config for client in clients], profiles, precheck_mode
+        )
+        checkpoints = {}
+        previous_history_ids = []
+        if resume:
+            task = task_manager.get_task(task_id)
+            if task["fingerprint"] and task["fingerprint"] != fingerprint:
+                raise ValueError("提示词、参考图或模型配置已变化，检查点中的结果无法合并，请重新提交任务")
+            checkpoints = _load_checkpoints(task["results"])
+            previous_history_ids = task["history_ids"]
+        task_manager.update_task(task_id, {"fingerprint": fingerprint})
+        
+        # 建立历史节点输出索引（只需修改过的节点及其下游重新调用）
+        memos = [None] * len(clients)
+        if reuse_history and not bypass_cache:
+            memos = [nm.NodeMemo.from_history(we.get_model_config(c.config)) for c in clients]
+        
+        max_concurrency = MAX_ASYNC_CONCURRENCY if async_mode else MAX_CONCURRENCY
+        concurrency = max(1, min(int(concurrency or DEFAULT_CONCURRENCY), max_concurrency))
+        
+        # 每个 (配置, 图片方案) 组合完整执行一次用例集
+        variants = [
+            (client, memo, profile)
+            for client, memo in zip(clients, memos)
+            for profile in profiles
+        ]
+        
+        # 各组合检查点中已完成的用例；所有组合都已完成的用例不再预取图片
+        variant_checkpoints = [_variant_checkpoints(jobs, checkpoints, client, profile) for client, _, profile in variants]
+        restored = [result for done in variant_checkpoints for result in done.values()]
+        if resume:
+            # 只保留可复用的结果，重新执行的用例完成时再逐条写入
+            task_manager.update_task(task_id, {"results": restored, "checkpoint_cases": len(restored)})
+            jobs = [job for job in jobs if any(job[0] not in done for done in variant_checkpoints)]
+        
+        # 预取图片（所有配置共用），生成图失效的用例不调用模型
+        dead_cases = {}
+        if prefetch_images:
+            jobs, dead_cases, image_failures = _prefetch_images(jobs, registry)
+            task_manager.update_task(task_id, {"image_failures": image_failures})
+            image_stats = {p.name: ip.preprocess_images(_node_images(jobs, registry), p) for p in profiles if not p.is_identity}
+            if image_stats:
+                task_manager.update_task(task_id, {"image_preprocess": image_stats})
+        
+        # 排队中的用例数（提交后尚未开始），任务异常结束时剩余部分在 finally 中扣除
+        # 自适应并发限制器（同一配置的多个组合共用一个）
+        limiters = list({id(l): l for c in clients for l in c.adaptive_limiters()}.values())
+        queued = sum(len([job for job in jobs if job[0] not in done]) for done in variant_checkpoints)
+        progress = _ProgressTracker(task_id, len(case_ids) * len(variants), queued, limiters)
+        progress.restore(restored)
+        metrics.CASES_QUEUED.inc(progress.queued)
+        try:
+            if len(variants) == 1:
+                client, memo, profile = variants[0]
+                runs = [_run_case_set(
+                    jobs, prompts, tag_node_map, client, memo, profile,
+                    concurrency, async_mode, bypass_cache, progress, dead_cases, prefetch_images,
+                    precheck_mode, variant_checkpoints[0]
+                )]
             else:
-                is_precise = (result["final_pass"] == "yes" and result.get("finish_at_step", 0) == 5)
-            result["is_precise"] = is_precise
-            
-            results.append(result)
+                # 各组合并行执行，每个组合独立占用 concurrency 个并发槽位
+                with ThreadPoolExecutor(max_workers=len(variants), thread_name_prefix=f"task-{task_id}") as pool:
+                    futures = [
+                        pool.submit(
+                            _run_case_set, jobs, prompts, tag_node_map, client, memo, profile,
+                            concurrency, async_mode, bypass_cache, progress, dead_cases, prefetch_images,
+                            precheck_mode, done
+                        )
+                        for (client, memo, profile), done in zip(variants, variant_checkpoints)
+                    ]
+                    runs = [future.result() for future in futures]
+        finally:
+            metrics.CASES_QUEUED.dec(progress.queued)
         
-        # 更新最终状态
+        results = [r for run in runs for r in run]
+        
+        # 保存到历史记录（每个配置一份）
+        from src import history_manager as hm
+        history_ids = [hm.save_test_history(run, tag_node_map) for run in runs if run]
+        comparison = None
+        if len(runs) > 1 and all(runs):
+            comparison = hm.save_comparison_report(runs, history_ids)
+        # 续跑前保存的部分历史记录已合并到新的历史记录中
+        for history_id in previous_history_ids:
+            hm.delete_test_history(history_id)
+        
+        # 更新最终状态（被取消的任务保留 cancelled 状态），用例结果按提交顺序整体替换
+        final_status = "cancelled" if _is_cancelled(task_id) else "completed"
         task_manager.update_task(task_id, {
-            "status": "completed",
+            "status": final_status,
             "completed_at": datetime.now(),
             "results": results,
+            "history_ids": history_ids,
+            "comparison": comparison,
+            "circuit_breaker": {},
+            "adaptive_concurrency": progress.adaptive_stats(),
             "progress": {
-                "total": len(case_ids),
+                "total": progress.total,
                 "completed": len(results),
                 "failed": len([r for r in results if not r.get("is_correct", False)]),
                 "current_case_id": None
             }
         })
         
-        # 保存到历史记录
-        if results:
-            from src import history_manager as hm
-            hm.save_test_history(results, tag_node_map)
-        
     except Exception as e:
         # 更新错误状态
         task_manager.update_task(task_id, {
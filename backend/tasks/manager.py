@@ -9,28 +9,48 @@ import uuid
 from datetime import datetime
 from typing import Dict, List, Optional
 from threading import Lock
+from backend.tasks import store as ts
+
+# ==================== 续跑配置 ====================
+RESUMABLE_STATUSES = ("completed", "failed", "cancelled")  # 可以续跑的任务状态
 
 class TaskManager:
     """
-    任务管理器（内存存储）
+    任务管理器（任务保存在任务存储中，默认 SQLite，见 backend.tasks.store）
     
-    Task manager (in-memory storage)
+    Task manager (tasks are kept in a task store, SQLite by default)
     """
     
     _instance = None
     _lock = Lock()
     
     def __new__(cls):
-        """单例模式"""
+        """单例模式（首次创建时把上次退出时中断的任务标记为 failed）"""
         if cls._instance is None:
             with cls._lock:
                 if cls._instance is None:
-                    cls._instance = super().__new__(cls)
-                    cls._instance.tasks = {}
-                    cls._instance.task_lock = Lock()
+                    instance = super().__new__(cls)
+                    instance.use_store(ts.create_task_store())
+                    cls._instance = instance
         return cls._instance
     
-    def create_task(self, case_ids: List[int]) -> str:
+    def use_store(self, store: ts.TaskStore):
+        """
+        切换任务存储后端
+        
+        Switch task store backend
+        
+        Args:
+            store: 任务存储
+        """
+        store.recover_interrupted()
+        self.store = store
+    
+    def create_task(self, case_ids: List[int], concurrency: int = 1, async_mode: bool = False,
+                    bypass_cache: bool = False, reuse_history: bool = False,
+                    config_ids: Optional[List[str]] = None, prefetch_images: bool = False,
+                    image_profiles: Optional[List[str]] = None,
+                    precheck_mode: str = "sequential") -> str:
         """
         创建新任务
         
@@ -38,37 +58,61 @@ class TaskManager:
         
         Args:
             case_ids: 测试用例ID列表
+            concurrency: 并发执行的用例数量
+            async_mode: 是否使用异步模型客户端执行
+            bypass_cache: 是否跳过响应缓存
+            reuse_history: 是否复用历史节点输出（默认关闭）
+            config_ids: 模型配置ID列表，为空时使用当前激活的配置
+            prefetch_images: 是否预取图片
+            image_profiles: 图片预处理方案名称列表，为空时原图发送
+            precheck_mode: 节点1-3调用方式（sequential / speculative / fused）
         
         Returns:
             str: 任务ID
         """
         task_id = str(uuid.uuid4())[:8]
         
-        with self.task_lock:
-            self.tasks[task_id] = {
-                "task_id": task_id,
-                "status": "pending",
-                "progress": {
-                    "total": len(case_ids),
-                    "completed": 0,
-                    "failed": 0,
-                    "current_case_id": None
-                },
-                "results": [],
-                "submitted_at": datetime.now(),
-                "started_at": None,
-                "completed_at": None,
-                "error": None,
-                "case_ids": case_ids
-            }
+        self.store.create({
+            "task_id": task_id,
+            "status": "pending",
+            "progress": {
+                "total": len(case_ids) * max(1, len(config_ids or [])) * max(1, len(image_profiles or [])),
+                "completed": 0,
+                "failed": 0,
+                "current_case_id": None
+            },
+            "results": [],
+            "submitted_at": datetime.now(),
+            "started_at": None,
+            "completed_at": None,
+            "error": None,
+            "case_ids": case_ids,
+            "concurrency": concurrency,
+            "async_mode": async_mode,
+            "bypass_cache": bypass_cache,
+            "reuse_history": reuse_history,
+            "config_ids": list(config_ids or []),
+            "prefetch_images": prefetch_images,
+            "image_failures": {},
+            "image_profiles": list(image_profiles or []),
+            "image_preprocess": {},
+            "precheck_mode": precheck_mode,
+            "circuit_breaker": {},
+            "adaptive_concurrency": {},
+            "history_ids": [],
+            "comparison": None,
+            "fingerprint": None,
+            "resume_count": 0,
+            "checkpoint_cases": 0
+        })
         
         return task_id
     
     def get_task(self, task_id: str) -> Optional[dict]:
         """
-        获取任务信息
+        获取任务信息（含已完成用例的结果）
         
-        Get task information
+        Get task information (including results of finished cases)
         
         Args:
             task_id: 任务ID
@@ -76,10 +120,23 @@ class TaskManager:
         Returns:
             dict: 任务信息，不存在返回 None
         """
-        with self.task_lock:
-            return self.tasks.get(task_id)
+        return self.store.get(task_id)
     
-    def update_task(self, task_id: str, updates: dict):
+    def get_status(self, task_id: str) -> Optional[str]:
+        """
+        获取任务状态（不读取用例结果）
+        
+        Get task status (without loading case results)
+        
+        Args:
+            task_id: 任务ID
+        
+        Returns:
+            str: 任务状态，不存在返回 None
+        """
+        return self.store.get_status(task_id)
+    
+    def update_task(self, task_id: str, updates: dict, new_results: Optional[list] = None):
         """
         更新任务信息
         
@@ -87,17 +144,17 @@ class TaskManager:
         
         Args:
             task_id: 任务ID
-            updates: 要更新的字段
+            updates: 要更新的字段，包含 results 时整体替换用例结果
+            new_results: 追加的用例结果（用例完成时逐条写入，重启后仍可查询）
         """
-        with self.task_lock:
-            if task_id in self.tasks:
-                self.tasks[task_id].update(updates)
+        self.store.update(task_id, updates, new_results)
     
     def cancel_task(self, task_id: str) -> bool:
         """
-        取消任务
+        取消任务（任务可能在其他 worker 进程中执行，执行进程在下一个用例开始前检查状态）
         
-        Cancel task
+        Cancel task (the task may run in another worker process, which checks the status
+        before starting each case)
         
         Args:
             task_id: 任务ID
@@ -105,17 +162,44 @@ class TaskManager:
         Returns:
             bool: 是否成功取消
         """
-        with self.task_lock:
-            if task_id in self.tasks:
-                self.tasks[task_id]["status"] = "cancelled"
-                return True
-        return False
+        return self.store.update(task_id, {"status": "cancelled"})
+    
+    def recover_interrupted(self) -> List[str]:
+        """
+        把执行进程已退出的 pending/running 任务标记为 failed
+        
+        Mark pending/running tasks whose owner process is gone as failed
+        
+        Returns:
+            List[str]: 被标记的任务ID
+        """
+        return self.store.recover_interrupted()
+    
+    def resume_task(self, task_id: str, resume_count: int) -> bool:
+        """
+        把已结束的任务重新置为 pending（续跑），任务正在执行时不做修改
+        
+        Put a finished task back to pending for resuming; running tasks are left untouched
+        
+        Args:
+            task_id: 任务ID
+            resume_count: 续跑次数（含本次）
+        
+        Returns:
+            bool: 是否已置为 pending（任务不存在或正在执行时返回 False）
+        """
+        return self.store.update(task_id, {
+            "status": "pending",
+            "completed_at": None,
+            "error": None,
+            "resume_count": resume_count
+        }, if_status=RESUMABLE_STATUSES)
     
     def list_tasks(self, status: Optional[str] = None, limit: int = 10) -> List[dict]:
         """
-        获取任务列表
+        获取任务列表（按提交时间倒序，不含用例结果）
         
-        Get task list
+        Get task list (newest first, without case results)
         
         Args:
             status: 筛选状态（可选）
@@ -124,13 +208,7 @@ class TaskManager:
         Returns:
             List[dict]: 任务列表
         """
-        with self.task_lock:
-            tasks = list(self.tasks.values())
-            if status:
-                tasks = [t for t in tasks if t["status"] == status]
-            # 按提交时间倒序
-            tasks.sort(key=lambda x: x["submitted_at"], reverse=True)
-            return tasks[:limit]
+        return self.store.list(status=status, limit=limit)
     
     def get_task_count(self) -> int:
         """
@@ -141,5 +219,15 @@ class TaskManager:
         Returns:
             int: 任务总数
         """
-        with self.task_lock:
-            return len(self.tasks)
+        return sum(self.store.count_by_status().values())
+    
+    def count_by_status(self) -> Dict[str, int]:
+        """
+        按状态统计任务数
+        
+        Count tasks by status
+        
+        Returns:
+            Dict[str, int]: {状态: 任务数}
+        """
+        return self.store.count_by_status()
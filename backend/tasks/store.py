@@ -0,0 +1,467 @@
+"""
+任务存储
+任务元数据、进度和每个用例的结果的持久化存储，TaskManager 通过存储后端读写任务
+
+- SQLiteTaskStore（默认）：任务和结果写入 SQLite 文件，后端重启后任务仍可查询；
+  进程内不保留任务，内存占用不随任务数增长；WAL 模式下多个 uvicorn worker 共用同一个文件，
+  任一 worker 都能查询、取消其他 worker 执行的任务
+- MemoryTaskStore：进程内字典（不持久化），只保留最近 MAX_MEMORY_TASKS 个已结束的任务
+
+用例结果在完成时逐条追加（append），任务结束时按提交顺序整体替换；
+执行进程退出（如后端重启）时仍为 pending/running 的任务，在下次启动时标记为 failed。
+执行进程以 主机名:进程号:启动ID 标识，并定期写入心跳（task_owners 表）；
+心跳超过 OWNER_STALE_SECONDS 未更新的进程视为已退出（进程号被复用或进程在其他主机上时同样适用）
+
+Task store
+Persistent storage of task metadata, progress and per-case results used by TaskManager.
+SQLiteTaskStore (default) survives backend restarts, keeps no tasks in process memory and is
+shared safely by several uvicorn workers (WAL); MemoryTaskStore keeps a bounded in-process dict.
+Case results are appended as they finish; tasks left pending/running by a dead process are
+marked failed on the next start. Owners carry a random per-process boot id and write a periodic
+heartbeat; an owner whose heartbeat is stale is treated as dead
+"""
+import os
+import abc
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ==================== 存储配置 ====================
+TASK_STORE_BACKEND = "sqlite"  # 任务存储后端（sqlite / memory）
+TASK_DB_FILE = os.path.join(PROJECT_ROOT, "data", "tasks", "tasks.sqlite")
+MAX_MEMORY_TASKS = 200  # 内存存储保留的已结束任务数
+ACTIVE_STATUSES = ("pending", "running")
+DATETIME_FIELDS = ("submitted_at", "started_at", "completed_at")
+INTERRUPTED_ERROR = "任务中断：执行任务的进程已退出（如后端重启）"
+HEARTBEAT_INTERVAL = 10.0  # 执行进程写入心跳的间隔（秒）
+OWNER_STALE_SECONDS = 60.0  # 心跳超过该时间未更新的执行进程视为已退出（秒）
+
+# 进程启动ID：进程号被复用时区分新旧进程
+_BOOT_ID = uuid.uuid4().hex[:12]
+
+
+def _owner() -> str:
+    """当前进程的标识（主机名:进程号:启动ID），用于判断任务的执行进程是否仍存活"""
+    return f"{socket.gethostname()}:{os.getpid()}:{_BOOT_ID}"
+
+
+def _json_default(value):
+    """JSON 编码不支持的类型（datetime、numpy 标量等）"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, default=_json_default)
+
+
+def _restore_datetimes(task: dict) -> dict:
+    """把时间字段从 ISO 字符串还原为 datetime（原地修改）"""
+    for field in DATETIME_FIELDS:
+        if isinstance(task.get(field), str):
+            task[field] = datetime.fromisoformat(task[field])
+    return task
+
+
+class TaskStore(abc.ABC):
+    """
+    任务存储后端接口
+
+    Task store backend interface
+
+    任务为字典（字段见 TaskManager.create_task），results 为用例结果列表
+    """
+
+    @abc.abstractmethod
+    def create(self, task: dict):
+        """
+        保存新任务
+
+        Args:
+            task: 任务字典
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, task_id: str, with_results: bool = True) -> Optional[dict]:
+        """
+        读取任务
+
+        Args:
+            task_id: 任务ID
+            with_results: 是否读取用例结果（否则 results 为空列表）
+
+        Returns:
+            dict: 任务字典（副本），不存在返回 None
+        """
+        raise NotImplementedError
+
+    def get_status(self, task_id: str) -> Optional[str]:
+        """
+        读取任务状态
+
+        Args:
+            task_id: 任务ID
+
+        Returns:
+            str: 任务状态，不存在返回 None
+        """
+        task = self.get(task_id, with_results=False)
+        return task["status"] if task else None
+
+    @abc.abstractmethod
+    def update(self, task_id: str, updates: dict, new_results: Optional[list] = None,
+               if_status: Optional[tuple] = None) -> bool:
+        """
+        更新任务字段并追加用例结果
+
+        Args:
+            task_id: 任务ID
+            updates: 要更新的字段，包含 results 时整体替换用例结果
+            new_results: 追加的用例结果
+            if_status: 只在任务处于这些状态时更新（检查和更新是原子的）
+
+        Returns:
+            bool: 是否已更新（任务不存在或状态不符时返回 False）
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def list(self, status: Optional[str] = None, limit: int = 10) -> List[dict]:
+        """
+        按提交时间倒序列出任务（不含用例结果）
+
+        Args:
+            status: 筛选状态（可选）
+            limit: 返回数量限制
+
+        Returns:
+            List[dict]: 任务字典列表
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def count_by_status(self) -> Dict[str, int]:
+        """
+        按状态统计任务数
+
+        Returns:
+            Dict[str, int]: {状态: 任务数}
+        """
+        raise NotImplementedError
+
+    def recover_interrupted(self) -> List[str]:
+        """
+        把执行进程已退出的 pending/running 任务标记为 failed
+
+        启动时调用；续跑仍为 pending/running 的任务前也会调用，执行进程已退出的任务因此可以续跑
+
+        Returns:
+            List[str]: 被标记的任务ID
+        """
+        return []
+
+
+class MemoryTaskStore(TaskStore):
+    """
+    进程内任务存储（不持久化，线程安全）
+
+    In-process task store (not persisted, thread-safe)
+    """
+
+    def __init__(self, max_tasks: int = MAX_MEMORY_TASKS):
+        """
+        Args:
+            max_tasks: 保留的已结束任务数，超过时丢弃最早提交的已结束任务
+        """
+        self.max_tasks = max_tasks
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def _prune(self):
+        """丢弃超出数量的已结束任务（调用方需持有锁）"""
+        finished = [t for t in self._tasks.values() if t["status"] not in ACTIVE_STATUSES]
+        if len(finished) <= self.max_tasks:
+            return
+        finished.sort(key=lambda t: t["submitted_at"])
+        for task in finished[:len(finished) - self.max_tasks]:
+            del self._tasks[task["task_id"]]
+
+    def create(self, task: dict):
+        with self._lock:
+            self._tasks[task["task_id"]] = dict(task, results=list(task.get("results") or []))
+            self._prune()
+
+    def get(self, task_id: str, with_results: bool = True) -> Optional[dict]:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None:
+                return None
+            return dict(task, results=list(task["results"]) if with_results else [])
+
+    def update(self, task_id: str, updates: dict, new_results: Optional[list] = None,
+               if_status: Optional[tuple] = None) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or (if_status is not None and task["status"] not in if_status):
+                return False
+            task.update(updates)
+            if "results" in updates:
+                task["results"] = list(updates["results"])
+            if new_results:
+                task["results"].extend(new_results)
+            return True
+
+    def list(self, status: Optional[str] = None, limit: int = 10) -> List[dict]:
+        with self._lock:
+            tasks = [dict(t, results=[]) for t in self._tasks.values() if not status or t["status"] == status]
+        tasks.sort(key=lambda t: t["submitted_at"], reverse=True)
+        return tasks[:limit]
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {}
+            for task in self._tasks.values():
+                counts[task["status"]] = counts.get(task["status"], 0) + 1
+            return counts
+
+
+class SQLiteTaskStore(TaskStore):
+    """
+    SQLite 任务存储（线程安全、多进程共享）
+
+    SQLite task store (thread-safe, shared by several processes)
+
+    tasks 表每个任务一行：状态、提交时间和执行进程单独成列（用于筛选排序），其余字段存为 JSON；
+    task_results 表每个用例结果一行，按写入顺序（id）读取；
+    task_owners 表记录每个执行进程的最近心跳时间，后台线程每 HEARTBEAT_INTERVAL 秒更新一次
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path: SQLite 文件路径，默认 TASK_DB_FILE
+        """
+        path = path or TASK_DB_FILE
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        # 自动提交模式，写操作显式使用 BEGIN IMMEDIATE（读-改-写期间持有写锁，多进程不会互相覆盖）
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                submitted_at TEXT NOT NULL,
+                owner TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS task_results (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id TEXT NOT NULL,
+                result TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS task_owners (
+                owner TEXT PRIMARY KEY,
+                heartbeat_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_submitted_at ON tasks(submitted_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_task_results_task ON task_results(task_id, id)")
+        self._heartbeat()
+        threading.Thread(target=self._heartbeat_loop, name="task-store-heartbeat", daemon=True).start()
+
+    def _heartbeat(self):
+        """写入当前进程的心跳，并清理早已停止心跳的执行进程"""
+        now = time.time()
+
+        def _beat(conn):
+            conn.execute(
+                "INSERT INTO task_owners (owner, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT(owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (_owner(), now)
+            )
+            conn.execute("DELETE FROM task_owners WHERE heartbeat_at < ?", (now - 10 * OWNER_STALE_SECONDS,))
+
+        self._write(_beat)
+
+    def _heartbeat_loop(self):
+        """后台心跳线程"""
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self._heartbeat()
+            except sqlite3.Error:
+                # 数据库暂时不可写（如被锁），下一次心跳重试
+                pass
+
+    def _write(self, fn):
+        """在写事务中执行 fn(conn)，返回 fn 的返回值"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    @staticmethod
+    def _row_to_task(row) -> dict:
+        """(status, data) 行转换为任务字典"""
+        task = json.loads(row[1])
+        task["status"] = row[0]
+        task["results"] = []
+        return _restore_datetimes(task)
+
+    @staticmethod
+    def _insert_results(conn, task_id: str, results: list):
+        conn.executemany(
+            "INSERT INTO task_results (task_id, result) VALUES (?, ?)",
+            [(task_id, _dumps(result)) for result in results]
+        )
+
+    def create(self, task: dict):
+        data = {k: v for k, v in task.items() if k not in ("status", "results")}
+
+        def _create(conn):
+            conn.execute(
+                "INSERT INTO tasks (task_id, status, submitted_at, owner, data) VALUES (?, ?, ?, ?, ?)",
+                (task["task_id"], task["status"], task["submitted_at"].isoformat(), _owner(), _dumps(data))
+            )
+            self._insert_results(conn, task["task_id"], task.get("results") or [])
+
+        self._write(_create)
+
+    def get(self, task_id: str, with_results: bool = True) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT status, data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+            if row is None:
+                return None
+            task = self._row_to_task(row)
+            if with_results:
+                task["results"] = [json.loads(r[0]) for r in self._conn.execute(
+                    "SELECT result FROM task_results WHERE task_id = ? ORDER BY id", (task_id,)
+                )]
+            return task
+
+    def get_status(self, task_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return row[0] if row else None
+
+    def _apply(self, conn, task_id: str, updates: dict, new_results: Optional[list] = None,
+               if_status: Optional[tuple] = None) -> bool:
+        """更新任务（调用方需在写事务中）"""
+        row = conn.execute("SELECT status, data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None or (if_status is not None and row[0] not in if_status):
+            return False
+        fields = {k: v for k, v in updates.items() if k not in ("status", "results")}
+        if fields:
+            data = json.loads(row[1])
+            data.update(json.loads(_dumps(fields)))
+            conn.execute("UPDATE tasks SET data = ? WHERE task_id = ?", (_dumps(data), task_id))
+        if "status" in updates:
+            # 开始执行的进程成为任务的执行进程
+            owner = _owner() if updates["status"] == "running" else None
+            conn.execute(
+                "UPDATE tasks SET status = ?, owner = COALESCE(?, owner) WHERE task_id = ?",
+                (updates["status"], owner, task_id)
+            )
+        if "results" in updates:
+            conn.execute("DELETE FROM task_results WHERE task_id = ?", (task_id,))
+            self._insert_results(conn, task_id, updates["results"])
+        if new_results:
+            self._insert_results(conn, task_id, new_results)
+        return True
+
+    def update(self, task_id: str, updates: dict, new_results: Optional[list] = None,
+               if_status: Optional[tuple] = None) -> bool:
+        return self._write(lambda conn: self._apply(conn, task_id, updates, new_results, if_status))
+
+    def list(self, status: Optional[str] = None, limit: int = 10) -> List[dict]:
+        sql = "SELECT status, data FROM tasks"
+        params = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY submitted_at DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [self._row_to_task(row) for row in rows]
+
+    def count_by_status(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def recover_interrupted(self) -> List[str]:
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        updates = {
+            "status": "failed",
+            "completed_at": datetime.now(),
+            "error": INTERRUPTED_ERROR,
+            "circuit_breaker": {}
+        }
+
+        def _recover(conn):
+            # 心跳仍在更新的执行进程（含当前进程）视为存活，其余（包括旧格式的进程标识）视为已退出
+            live = {row[0] for row in conn.execute(
+                "SELECT owner FROM task_owners WHERE heartbeat_at >= ?", (time.time() - OWNER_STALE_SECONDS,)
+            )}
+            live.add(_owner())
+            rows = conn.execute(
+                f"SELECT task_id, owner FROM tasks WHERE status IN ({placeholders})", ACTIVE_STATUSES
+            ).fetchall()
+            interrupted = [task_id for task_id, owner in rows if owner not in live]
+            for task_id in interrupted:
+                self._apply(conn, task_id, updates)
+            return interrupted
+
+        return self._write(_recover)
+
+
+# ==================== 存储后端注册表 ====================
+TASK_STORE_BACKENDS = {
+    "sqlite": SQLiteTaskStore,
+    "memory": MemoryTaskStore,
+}
+
+
+def create_task_store(backend: str = None) -> TaskStore:
+    """
+    创建任务存储
+
+    Create task store
+
+    Args:
+        backend: 存储后端名称（TASK_STORE_BACKENDS 的键），默认 TASK_STORE_BACKEND
+
+    Returns:
+        TaskStore: 任务存储
+
+    Raises:
+        ValueError: 未知的存储后端
+    """
+    backend = backend or TASK_STORE_BACKEND
+    if backend not in TASK_STORE_BACKENDS:
+        raise ValueError(f"未知的任务存储后端: {backend}（可选: {', '.join(TASK_STORE_BACKENDS)}）")
+    return TASK_STORE_BACKENDS[backend]()
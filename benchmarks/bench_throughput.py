@@ -0,0 +1,275 @@
+"""
+执行器吞吐量基准测试
+
+在临时数据目录中生成合成用例（用例、参考图、问题标签、模型配置），模型配置指向本地模拟服务
+（mock_server，独立进程），分别驱动 execute_test_task 或 /api/test/* 接口执行，报告：
+- cases/s: 每秒完成的用例数
+- p50 / p99: 单个用例执行耗时（毫秒，不含排队）
+- peak RSS: 执行进程的峰值常驻内存（MB）
+
+每个规模在独立子进程中执行，峰值内存互不影响；不读写真实数据目录和响应缓存
+
+用法：
+    python benchmarks/bench_throughput.py --cases 100,1000,10000 --concurrency 32
+    python benchmarks/bench_throughput.py --cases 100000 --async-mode --concurrency 512 --latency lognormal:0.05,0.5
+    python benchmarks/bench_throughput.py --cases 1000 --via-api --rate-limit-rate 0.02 --error-rate 0.01
+    python benchmarks/bench_throughput.py --cases 2000 --async-mode --concurrency 256 --capacity 40 --adaptive
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import tempfile
+import resource
+import threading
+import subprocess
+
+import pandas as pd
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+import mock_server
+
+# ==================== 合成数据配置 ====================
+DEFAULT_CARS = 50  # 合成车型数
+REFS_PER_CAR = 5  # 每个车型的参考图数
+# 问题标签 -> 预期过滤节点
+SYNTHETIC_TAGS = {"非汽车": 1, "车身裁切": 2, "车牌有字": 3, "视角不一致": 4, "细节不一致": 5}
+POLL_INTERVAL = 0.5  # 接口模式下轮询任务状态的间隔（秒）
+
+
+# ==================== 合成数据 ====================
+
+def build_workspace(root, cases, cars, base_url, stream, adaptive=False):
+    """
+    生成合成数据目录，并把各模块的数据路径指向该目录
+
+    Args:
+        root: 临时目录
+        cases: 用例数
+        cars: 车型数
+        base_url: 模拟服务地址
+        stream: 是否开启流式调用
+        adaptive: 是否开启自适应并发
+
+    Returns:
+        list: 用例ID列表
+    """
+    from src import data_manager as dm
+    from src import config_manager as cm
+    from src import history_manager as hm
+    from src import response_cache as rc
+    from backend.tasks import store as ts
+
+    tags = list(SYNTHETIC_TAGS)
+    pd.DataFrame([{
+        "case_id": i,
+        "car": f"car{i % cars}",
+        "case_type": "badcase" if i % 3 == 0 else "goodcase",
+        "problem_tag": tags[i % len(tags)] if i % 3 == 0 else "",
+        "case_url": f"http://mock.local/gen/{i}.png"
+    } for i in range(1, cases + 1)]).to_csv(os.path.join(root, "test_cases.csv"), index=False)
+    pd.DataFrame([{
+        "ref_id": c,
+        "car": f"car{c}",
+        **{f"ref_url_{k}": f"http://mock.local/ref/{c}_{k}.png" for k in range(1, REFS_PER_CAR + 1)}
+    } for c in range(cars)]).to_csv(os.path.join(root, "ref.csv"), index=False)
+    pd.DataFrame([
+        {"tag_id": i, "tag_content": tag, "expected_filter_node": node}
+        for i, (tag, node) in enumerate(SYNTHETIC_TAGS.items(), start=1)
+    ]).to_csv(os.path.join(root, "problem_tags.csv"), index=False)
+    # 使用真实提示词，请求体大小与实际一致
+    shutil.copytree(os.path.join(PROJECT_ROOT, "data", "prompts"), os.path.join(root, "prompts"))
+    pd.DataFrame([{
+        "config_id": "mock",
+        "model_id": "mock",
+        "api_key": "mock",
+        "thinking_mode": "disabled",
+        "base_url": base_url,
+        **cm.OPTIONAL_COLUMNS,
+        "stream": int(stream),
+        "adaptive_concurrency": int(adaptive)
+    }]).to_csv(os.path.join(root, "model_config.csv"), index=False)
+
+    dm.DATA_DIR = root
+    cm.DATA_DIR = root
+    cm.CONFIG_FILE = os.path.join(root, "model_config.csv")
+    hm.HISTORY_DIR = os.path.join(root, "test_history")
+    hm.COMPARISON_DIR = os.path.join(root, "comparison_reports")
+    os.makedirs(hm.HISTORY_DIR, exist_ok=True)
+    rc.CACHE_ENABLED = False
+    ts.TASK_DB_FILE = os.path.join(root, "tasks.sqlite")
+    return list(range(1, cases + 1))
+
+
+# ==================== 执行 ====================
+
+def run_executor(case_ids, args):
+    """直接调用 execute_test_task，返回任务信息"""
+    from backend.tasks.manager import TaskManager
+    from backend.tasks.executor import execute_test_task
+
+    task_manager = TaskManager()
+    task_id = task_manager.create_task(
+        case_ids, concurrency=args.concurrency, async_mode=args.async_mode, reuse_history=False
+    )
+    execute_test_task(
+        task_id, case_ids, concurrency=args.concurrency, async_mode=args.async_mode, reuse_history=False
+    )
+    return task_manager.get_task(task_id)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def run_api(case_ids, args):
+    """在进程内启动后端，经 /api/test/submit 提交并轮询任务状态，返回任务信息"""
+    import uvicorn
+    from backend.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    api = f"http://127.0.0.1:{port}/api/test"
+    while not server.started:
+        time.sleep(0.05)
+
+    try:
+        response = requests.post(f"{api}/submit", json={
+            "case_ids": case_ids,
+            "concurrency": args.concurrency,
+            "async_mode": args.async_mode,
+            "reuse_history": False
+        }, timeout=60)
+        response.raise_for_status()
+        task_id = response.json()["task_id"]
+        # 轮询精简的任务列表，完成后再取一次完整状态（含所有结果）
+        while True:
+            tasks = requests.get(f"{api}/tasks", params={"limit": 1}, timeout=60).json()["tasks"]
+            if tasks and tasks[0]["status"] not in ("pending", "running"):
+                break
+            time.sleep(POLL_INTERVAL)
+        return requests.get(f"{api}/status/{task_id}", timeout=600).json()
+    finally:
+        server.should_exit = True
+
+
+def worker(args):
+    """单个规模的基准测试（在子进程中执行），结果以 JSON 输出到最后一行"""
+    from src import history_manager as hm
+
+    root = tempfile.mkdtemp(prefix="vlm-bench-")
+    try:
+        case_ids = build_workspace(root, args.cases, args.cars, args.base_url, args.stream, args.adaptive)
+        start = time.perf_counter()
+        task = run_api(case_ids, args) if args.via_api else run_executor(case_ids, args)
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    results = task.get("results") or []
+    latencies = [r["case_latency_ms"] for r in results if r.get("case_latency_ms") is not None]
+    print(json.dumps({
+        "cases": args.cases,
+        "status": task.get("status"),
+        "error": task.get("error"),
+        "completed": len(results),
+        "errors": sum(1 for r in results if r.get("final_pass") == "error"),
+        "limit": ",".join(str(l["limit"]) for l in (task.get("adaptive_concurrency") or {}).values()) or "-",
+        "seconds": round(elapsed, 2),
+        "cases_per_second": round(len(results) / elapsed, 1) if elapsed > 0 else 0,
+        "p50_ms": hm._percentile(latencies, 50),
+        "p99_ms": hm._percentile(latencies, 99),
+        # Linux 下 ru_maxrss 单位为 KB
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }), flush=True)
+
+
+# ==================== 主流程 ====================
+
+def start_mock(args):
+    """
+    以独立进程启动模拟服务，返回 (进程, base_url)
+
+    Raises:
+        RuntimeError: 模拟服务启动失败（附子进程的错误输出）
+    """
+    port = _free_port()
+    command = [
+        sys.executable, os.path.join(BENCH_DIR, "mock_server.py"), "--port", str(port),
+        "--latency", args.latency, "--token-delay", str(args.token_delay),
+        "--trailing-tokens", str(args.trailing_tokens), "--error-rate", str(args.error_rate),
+        "--rate-limit-rate", str(args.rate_limit_rate), "--pass-rate", str(args.pass_rate),
+        "--capacity", str(args.capacity), "--malformed-rate", str(args.malformed_rate)
+    ]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    # 错误输出写入临时文件（写入管道而不读取时，服务运行期间管道可能写满）
+    stderr = tempfile.TemporaryFile(mode="w+")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr, text=True)
+    # 启动成功时输出一行监听地址；子进程退出时 readline 返回空字符串
+    if not process.stdout.readline() or process.poll() is not None:
+        process.wait()
+        stderr.seek(0)
+        raise RuntimeError(f"模拟服务启动失败（退出码 {process.returncode}）：\n{stderr.read().strip()}")
+    return process, f"http://127.0.0.1:{port}/api/v3"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="执行器吞吐量基准测试")
+    parser.add_argument("--cases", default="100,1000,10000", help="用例规模，逗号分隔")
+    parser.add_argument("--cars", type=int, default=DEFAULT_CARS, help="合成车型数")
+    parser.add_argument("--concurrency", type=int, default=32, help="任务并发数")
+    parser.add_argument("--async-mode", action="store_true", help="使用异步执行")
+    parser.add_argument("--stream", action="store_true", help="节点1-3使用流式调用")
+    parser.add_argument("--adaptive", action="store_true", help="开启自适应并发（并发数作为上限）")
+    parser.add_argument("--via-api", action="store_true", help="经 /api/test/* 接口提交任务")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    mock_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.cases = int(args.cases)
+        worker(args)
+        return
+
+    try:
+        mock, base_url = start_mock(args)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    try:
+        mode = "api" if args.via_api else ("async" if args.async_mode else "thread")
+        print(f"mode={mode} concurrency={args.concurrency} latency={args.latency} "
+              f"error_rate={args.error_rate} rate_limit_rate={args.rate_limit_rate} stream={args.stream} "
+              f"capacity={args.capacity} adaptive={args.adaptive}")
+        print(f"{'cases':>8}{'status':>11}{'errors':>8}{'seconds':>10}{'cases/s':>10}"
+              f"{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>9}{'limit':>8}")
+        for size in [int(s) for s in args.cases.split(",") if s.strip()]:
+            # 子进程沿用全部命令行参数，后出现的 --cases 覆盖规模列表
+            command = [sys.executable, os.path.abspath(__file__), *sys.argv[1:],
+                       "--worker", "--cases", str(size), "--base-url", base_url]
+            output = subprocess.run(command, capture_output=True, text=True)
+            lines = output.stdout.strip().splitlines()
+            if output.returncode != 0 or not lines:
+                print(f"{size:>8}  failed: {output.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(lines[-1])
+            print(f"{r['cases']:>8}{r['status']:>11}{r['errors']:>8}{r['seconds']:>10}{r['cases_per_second']:>10}"
+                  f"{r['p50_ms']:>10}{r['p99_ms']:>10}{r['peak_rss_mb']:>9}{r['limit']:>8}")
+    finally:
+        mock.terminate()
+
+
+if __name__ == "__main__":
+    main()
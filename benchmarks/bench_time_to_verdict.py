@@ -0,0 +1,84 @@
+"""
+流式提前结束基准测试：time-to-verdict
+
+对本地模拟服务（mock_server）分别以非流式和流式（stream=1）调用节点1，
+测量拿到可判定输出的耗时，以及被取消的生成次数
+
+用法：
+    python benchmarks/bench_time_to_verdict.py --requests 20 --latency const:0.3 --token-delay 0.02
+"""
+import os
+import sys
+import time
+import argparse
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src import model_client as mc
+from src import response_cache as rc
+from src import history_manager as hm
+from src.call_context import CallContext
+import mock_server
+
+PROMPT = "判断图片中是否存在可用汽车，输出JSON：{\"car\": \"yes/no\"}"
+IMAGE_URL = "http://127.0.0.1/mock.jpg"
+
+
+def run(client, requests, verdict_keys):
+    """
+    串行发起请求，返回每次拿到判定的耗时（毫秒）
+
+    Args:
+        client: ModelClient
+        requests: 请求次数
+        verdict_keys: 节点判定字段
+
+    Returns:
+        list: 耗时列表
+    """
+    latencies = []
+    for _ in range(requests):
+        ctx = CallContext(bypass_cache=True).for_node(1, verdict_keys)
+        start = time.perf_counter()
+        text = client.call_single(PROMPT, IMAGE_URL, ctx=ctx)
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert client.parse_json_response(text).get("car") in ("yes", "no")
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式提前结束 time-to-verdict 基准测试")
+    parser.add_argument("--requests", type=int, default=20, help="每种模式的请求次数")
+    mock_server.add_arguments(parser)
+    args = parser.parse_args()
+
+    # 基准测试不读写响应缓存
+    rc.CACHE_ENABLED = False
+    server, state, base_url = mock_server.start_server(**mock_server.state_kwargs(args))
+    try:
+        print(f"mock server: {base_url}  latency={args.latency}  token_delay={args.token_delay}s  "
+              f"trailing_tokens={args.trailing_tokens}")
+        print(f"{'mode':<10}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}  (ms)")
+        for mode, stream in (("full", 0), ("stream", 1)):
+            config = {
+                "config_id": f"bench-{mode}",
+                "model_id": "mock",
+                "api_key": "mock",
+                "base_url": base_url,
+                "thinking_mode": "disabled",
+                "stream": stream
+            }
+            latencies = run(mc.ModelClient(config), args.requests, ("car",))
+            dist = hm._distribution(latencies)
+            print(f"{mode:<10}{dist['mean']:>10}{dist['p50']:>10}{dist['p95']:>10}{dist['max']:>10}")
+        # 断开后服务端需要写入下一个分片才能发现，稍等再读取统计
+        time.sleep(args.token_delay * 5 + 0.1)
+        print(f"server: {state.get_stats()}")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
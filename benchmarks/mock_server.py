@@ -0,0 +1,446 @@
+"""
+本地模拟模型服务（OpenAI / 火山方舟兼容的 /chat/completions 接口）
+
+用于在不调用真实模型（不产生费用）的情况下测量客户端和执行器的行为，只依赖标准库：
+- 非流式：等待首令牌延迟 + 全部令牌的生成时间后一次性返回
+- 流式（stream=true）：按 SSE 逐段返回，判定 JSON 之后还有一段说明文字，
+  可用于测量流式提前结束节省的时间；客户端提前断开时记为取消的生成
+- 首令牌延迟按分布采样：const:0.3 / uniform:0.1,0.5 / lognormal:0.3,0.5（中位数, sigma）
+- 按比例注入 5xx 错误和 429 限流（带 Retry-After）；按比例返回格式有缺陷的输出
+  （一半可容错修复：尾随逗号/单引号，一半缺少判定字段需要重问），重问（对话中已有 assistant 回复）时返回正确输出；
+  请求带 response_format（结构化输出模式）时只返回 JSON 对象，不带代码块和说明文字；
+  可设置服务容量，同时处理的请求超过容量时直接返回 429（用于测量自适应并发）
+- 判定结果由生成图URL（消息中最后一张图片）的哈希决定，同一URL每次返回相同结果；
+  提示词要求按节点分键输出（节点1-3合并调用）时，每个节点键下返回同一份判定
+
+用法：
+    python benchmarks/mock_server.py --port 18080 --latency lognormal:0.3,0.5 --error-rate 0.01
+
+模型配置的 base_url 设为 http://127.0.0.1:18080/api/v3 即可使用；GET /api/v3/stats 返回请求统计
+"""
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ==================== 默认模拟参数 ====================
+DEFAULT_LATENCY = "const:0.3"  # 首令牌延迟分布（秒）
+DEFAULT_TOKEN_DELAY = 0.02  # 每个令牌的生成间隔（秒）
+DEFAULT_TRAILING_TOKENS = 60  # 判定 JSON 之后的说明文字令牌数
+DEFAULT_PASS_RATE = 0.9  # 每个判定字段为"通过"的比例
+FUSED_KEYS = ("node1", "node2", "node3")  # 节点1-3合并调用的输出键
+CHARS_PER_TOKEN = 4  # 每个流式分片的字符数
+RETRY_AFTER_SECONDS = 1  # 429 响应的 Retry-After
+
+
+class LatencyDist:
+    """首令牌延迟分布"""
+
+    KINDS = ("const", "uniform", "lognormal")
+    PARAM_COUNTS = {"const": (0, 1), "uniform": (2,), "lognormal": (2,)}
+
+    def __init__(self, spec):
+        """
+        Args:
+            spec: 分布描述，如 const:0.3 / uniform:0.1,0.5 / lognormal:0.3,0.5
+        """
+        kind, _, params = str(spec).partition(":")
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        try:
+            self.params = [float(p) for p in params.split(",") if p.strip()]
+        except ValueError:
+            raise ValueError(f"Invalid latency parameters: {spec}") from None
+        if len(self.params) not in self.PARAM_COUNTS[kind]:
+            raise ValueError(f"Invalid latency parameters: {spec}")
+        self.spec = spec
+        self.kind = kind
+
+    def sample(self, rng):
+        """采样一个延迟（秒）"""
+        if self.kind == "const":
+            return self.params[0] if self.params else 0.0
+        if self.kind == "uniform":
+            low, high = self.params
+            return rng.uniform(low, high)
+        median, sigma = self.params
+        return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+
+
+def _fraction(*parts):
+    """由字符串计算 [0, 1) 区间的确定性数值"""
+    digest = hashlib.sha256("|".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def verdict_for(image_url, pass_rate=DEFAULT_PASS_RATE):
+    """
+    按生成图URL生成确定性的判定 JSON（同时包含各节点需要的字段）
+
+    Args:
+        image_url: 生成图URL
+        pass_rate: 每个判定字段为"通过"的比例
+
+    Returns:
+        dict: 判定 JSON
+    """
+    passed = {key: _fraction(image_url, key) < pass_rate for key in ("car", "cropping", "match")}
+    return {
+        "car": "yes" if passed["car"] else "no",
+        "cropping": "no" if passed["cropping"] else "yes",
+        "match": "yes" if passed["match"] else "no",
+        "match_image": "1",
+        "reference_vehicle_description": "白色轿车，前脸朝左",
+        "reason": "模拟输出"
+    }
+
+
+def _is_fused(messages):
+    """提示词是否要求节点1-3合并输出"""
+    text = json.dumps(messages or [], ensure_ascii=False)
+    return all(f'\\"{key}\\"' in text for key in FUSED_KEYS)
+
+
+def _last_image_url(messages):
+    """消息中最后一张图片的URL（生成图总是最后一张）"""
+    url = ""
+    for message in messages or []:
+        content = message.get("content")
+        if isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    url = part["image_url"].get("url", "")
+    return url
+
+
+class MockServer(ThreadingHTTPServer):
+    """线程模式 HTTP 服务，加大监听队列以承受高并发连接"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MockState:
+    """模拟服务的参数和统计（线程安全）"""
+
+    def __init__(self, latency=DEFAULT_LATENCY, token_delay=DEFAULT_TOKEN_DELAY,
+                 trailing_tokens=DEFAULT_TRAILING_TOKENS, error_rate=0.0, rate_limit_rate=0.0,
+                 pass_rate=DEFAULT_PASS_RATE, capacity=0, malformed_rate=0.0, seed=None):
+        """
+        Args:
+            latency: 首令牌延迟分布描述
+            token_delay: 每个令牌的生成间隔（秒）
+            trailing_tokens: 判定 JSON 之后的说明文字令牌数
+            error_rate: 返回 500 的比例
+            rate_limit_rate: 返回 429 的比例
+            pass_rate: 每个判定字段为"通过"的比例
+            capacity: 同时处理的请求数上限，超过时返回 429，0 表示不限制
+            malformed_rate: 返回格式有缺陷的输出的比例
+            seed: 随机种子（延迟、错误和格式缺陷注入）
+        """
+        self.latency = LatencyDist(latency)
+        self.token_delay = token_delay
+        self.trailing_tokens = trailing_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.pass_rate = pass_rate
+        self.capacity = capacity
+        self.malformed_rate = malformed_rate
+        self.inflight = 0
+        self.stats = {
+            "requests": 0, "streams": 0, "cancelled": 0, "errors": 0, "rate_limited": 0, "peak_inflight": 0,
+            "malformed": 0, "reasks": 0
+        }
+        self.lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def draw(self):
+        """
+        为一次请求抽取延迟和注入的错误
+
+        Returns:
+            tuple: (首令牌延迟秒数, None / 500 / 429)
+        """
+        with self.lock:
+            ttft = self.latency.sample(self._rng)
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return ttft, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return ttft, 500
+        return ttft, None
+
+    def enter(self):
+        """
+        开始处理一个请求
+
+        Returns:
+            bool: 超过服务容量时返回 False（请求不计入处理中）
+        """
+        with self.lock:
+            if self.capacity and self.inflight >= self.capacity:
+                return False
+            self.inflight += 1
+            self.stats["peak_inflight"] = max(self.stats["peak_inflight"], self.inflight)
+            return True
+
+    def leave(self):
+        """请求处理结束"""
+        with self.lock:
+            self.inflight -= 1
+
+    def completion_text(self, image_url, fused=False, json_only=False, reask=False):
+        """
+        完整输出：```json 代码块 + 说明文字
+
+        Args:
+            image_url: 生成图URL
+            fused: 是否按节点分键输出
+            json_only: 是否只输出 JSON 对象（结构化输出模式）
+            reask: 是否为重问（总是返回正确输出）
+        """
+        verdict = verdict_for(image_url, self.pass_rate)
+        with self.lock:
+            roll = self._rng.random()
+        defect = None
+        if reask:
+            self.count("reasks")
+        elif roll < self.malformed_rate:
+            self.count("malformed")
+            defect = "missing" if roll < self.malformed_rate / 2 else "syntax"
+        if defect == "missing":
+            verdict = {k: v for k, v in verdict.items() if k not in ("car", "cropping", "match")}
+        if fused:
+            verdict = {key: verdict for key in FUSED_KEYS}
+        body = json.dumps(verdict, ensure_ascii=False)
+        if defect == "syntax":
+            body = body.replace('"', "'")[:-1] + ",}"
+        if json_only:
+            return body
+        trailing = "以上为判定结果，" * max(0, self.trailing_tokens * CHARS_PER_TOKEN // 8)
+        return f"```json\n{body}\n```\n{trailing}"
+
+    def count(self, field):
+        with self.lock:
+            self.stats[field] += 1
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats)
+
+
+def _usage(text):
+    """按字符数估算的令牌用量"""
+    completion_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+    return {"prompt_tokens": 1000, "completion_tokens": completion_tokens, "total_tokens": 1000 + completion_tokens}
+
+
+def make_handler(state):
+    """
+    创建绑定模拟参数的请求处理类
+
+    Args:
+        state: MockState
+
+    Returns:
+        type: BaseHTTPRequestHandler 子类
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, body, headers=None):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, state.get_stats())
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "not found"}})
+                return
+            state.count("requests")
+            if not state.enter():
+                state.count("rate_limited")
+                self._send_json(429, {"error": {"code": "ServerOverloaded", "message": "mock capacity exceeded"}},
+                                {"Retry-After": str(RETRY_AFTER_SECONDS)})
+                return
+            try:
+                self._complete(body)
+            finally:
+                state.leave()
+
+        def _complete(self, body):
+            ttft, error = state.draw()
+            if error == 429:
+                state.count("rate_limited")
+                self._send_json(429, {"error": {"code": "RateLimitExceeded", "message": "mock rate limit"}},
+                                {"Retry-After": str(RETRY_AFTER_SECONDS)})
+                return
+            if error == 500:
+                time.sleep(ttft)
+                state.count("errors")
+                self._send_json(500, {"error": {"code": "InternalServiceError", "message": "mock error"}})
+                return
+
+            messages = body.get("messages")
+            text = state.completion_text(
+                _last_image_url(messages), _is_fused(messages),
+                json_only=bool(body.get("response_format")),
+                reask=any(m.get("role") == "assistant" for m in messages or [])
+            )
+            if body.get("stream"):
+                self._stream(body, text, ttft)
+                return
+            time.sleep(ttft + state.token_delay * (len(text) // CHARS_PER_TOKEN))
+            try:
+                self._send_json(200, {
+                    "id": "mock",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": _usage(text)
+                })
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端已放弃该请求（如对冲请求被取消）
+                state.count("cancelled")
+
+        def _stream(self, body, text, ttft):
+            state.count("streams")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+
+            def _event(payload):
+                self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+                self.wfile.flush()
+
+            def _chunk(delta, finish_reason=None, usage=None):
+                return json.dumps({
+                    "id": "mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [] if usage else [
+                        {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                    ],
+                    "usage": usage
+                }, ensure_ascii=False)
+
+            try:
+                time.sleep(ttft)
+                _event(_chunk({"role": "assistant", "content": ""}))
+                for i in range(0, len(text), CHARS_PER_TOKEN):
+                    _event(_chunk({"content": text[i:i + CHARS_PER_TOKEN]}))
+                    time.sleep(state.token_delay)
+                _event(_chunk({}, finish_reason="stop"))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    _event(_chunk({}, usage=_usage(text)))
+                _event("[DONE]")
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前断开：剩余的生成被取消
+                state.count("cancelled")
+
+    return Handler
+
+
+def start_server(port=0, **kwargs):
+    """
+    在后台线程启动模拟服务
+
+    Args:
+        port: 端口，0 表示随机端口
+        **kwargs: MockState 参数
+
+    Returns:
+        tuple: (MockServer, MockState, base_url)
+    """
+    state = MockState(**kwargs)
+    server = MockServer(("127.0.0.1", port), make_handler(state))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+    return server, state, base_url
+
+
+def _latency_arg(spec):
+    """校验 --latency 参数（无效时由 argparse 报错退出）"""
+    try:
+        LatencyDist(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+
+def add_arguments(parser):
+    """添加模拟参数的命令行选项（基准测试脚本共用）"""
+    parser.add_argument("--latency", type=_latency_arg, default=DEFAULT_LATENCY,
+                        help="首令牌延迟分布：const:S / uniform:LOW,HIGH / lognormal:MEDIAN,SIGMA（秒）")
+    parser.add_argument("--token-delay", type=float, default=DEFAULT_TOKEN_DELAY, help="每个令牌的生成间隔（秒）")
+    parser.add_argument("--trailing-tokens", type=int, default=DEFAULT_TRAILING_TOKENS,
+                        help="判定 JSON 之后的说明文字令牌数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--pass-rate", type=float, default=DEFAULT_PASS_RATE, help="每个判定字段为通过的比例")
+    parser.add_argument("--capacity", type=int, default=0, help="同时处理的请求数上限，超过时返回 429，0 表示不限制")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回格式有缺陷的输出的比例")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+
+
+def state_kwargs(args):
+    """从命令行参数构建 MockState 参数"""
+    return {
+        "latency": args.latency,
+        "token_delay": args.token_delay,
+        "trailing_tokens": args.trailing_tokens,
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "pass_rate": args.pass_rate,
+        "capacity": args.capacity,
+        "malformed_rate": args.malformed_rate,
+        "seed": args.seed
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟模型服务")
+    parser.add_argument("--port", type=int, default=18080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server, _, base_url = start_server(args.port, **state_kwargs(args))
+    print(f"Mock model server listening on {base_url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -34,12 +34,24 @@ NODE_OPTIONS = {
     5: "节点5: 细节一致性"
 }
 
+def _limit_value(value):
+    """将配置中的限额值转换为整数（空值视为不限制）"""
+    try:
+        return max(0, int(float(value)))
+    except (TypeError, ValueError):
+        return 0
+
 # ==================== Dialog: 新增模型 ====================
 @st.dialog("➕ 新增模型配置", width="medium")
 def show_add_model_dialog():
     new_model_id = st.text_input("模型ID", placeholder="例如: doubao-seed-1-8-251228", key="new_model_id")
     new_api_key = st.text_input("API Key", type="password", key="new_api_key")
     new_thinking = st.selectbox("思考模式", ["disabled", "enabled"], key="new_thinking")
+    col_rpm, col_tpm = st.columns([1, 1])
+    with col_rpm:
+        new_rpm = st.number_input("RPM 上限", min_value=0, value=0, step=100, help="每分钟请求数上限，0 表示不限制", key="new_rpm")
+    with col_tpm:
+        new_tpm = st.number_input("TPM 上限", min_value=0, value=0, step=10000, help="每分钟令牌数上限，0 表示不限制", key="new_tpm")
     
     col_confirm, col_cancel = st.columns([1, 1])
     with col_confirm:
@@ -47,7 +59,7 @@ def show_add_model_dialog():
             if not new_model_id or not new_api_key:
                 st.error("模型ID和API Key不能为空")
             else:
-                cm.add_config(new_model_id, new_api_key, new_thinking)
+                cm.add_config(new_model_id, new_api_key, new_thinking, rpm=int(new_rpm), tpm=int(new_tpm))
                 load_model_configs_cached.clear()
                 st.toast("模型配置添加成功！", icon="✅")
                 time.sleep(0.5)
@@ -67,6 +79,17 @@ def show_edit_model_dialog(config_data):
         index=0 if config_data['thinking_mode'] == 'disabled' else 1,
         key="edit_thinking"
     )
+    col_rpm, col_tpm = st.columns([1, 1])
+    with col_rpm:
+        edit_rpm = st.number_input(
+            "RPM 上限", min_value=0, value=_limit_value(config_data.get('rpm')), step=100,
+            help="每分钟请求数上限，0 表示不限制", key="edit_rpm"
+        )
+    with col_tpm:
+        edit_tpm = st.number_input(
+            "TPM 上限", min_value=0, value=_limit_value(config_data.get('tpm')), step=10000,
+            help="每分钟令牌数上限，0 表示不限制", key="edit_tpm"
+        )
     
     col_confirm, col_cancel = st.columns([1, 1])
     with col_confirm:
@@ -78,7 +101,9 @@ def show_edit_model_dialog(config_data):
                     config_data['config_id'],
                     model_id=edit_model_id,
                     api_key=edit_api_key,
-                    thinking_mode=edit_thinking
+                    thinking_mode=edit_thinking,
+                    rpm=int(edit_rpm),
+                    tpm=int(edit_tpm)
                 )
                 load_model_configs_cached.clear()
                 st.toast("模型配置修改成功！", icon="✅")
@@ -9,11 +9,14 @@ PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(_
 sys.path.insert(0, PROJECT_ROOT)
 
 from src import data_manager as dm
+from src import config_manager as cm
+from src import image_preprocess as ip
 
 # ==================== 配置 ====================
 BACKEND_URL = "http://localhost:8000"
 API_TIMEOUT = 30  # API 请求超时时间（秒）
 MAX_CONCURRENT_TASKS = 3  # 最大并发任务数
+MAX_CASE_CONCURRENCY = 32  # 单个任务最大用例并发数
 
 # ==================== 缓存函数 ====================
 @st.cache_data(ttl=300)
@@ -176,13 +179,90 @@ if no_selection:
 elif not can_submit:
     st.warning(f"⚠️ 当前有 {running_count} 个任务正在运行，已达到最大并发数（{MAX_CONCURRENT_TASKS}），请等待任务完成后再提交")
 
+concurrency = st.number_input(
+    "并发数",
+    min_value=1,
+    max_value=MAX_CASE_CONCURRENCY,
+    value=1,
+    step=1,
+    help="同时执行的用例数量，1 表示逐个执行；模型配置开启自适应并发时作为上限，实际请求并发自动调整",
+    key="run_concurrency"
+)
+
+# 多配置对比：选择多个配置时同一批用例在各配置上并行执行
+configs_df = cm.get_all_configs()
+config_labels = {
+    str(row["config_id"]): f"{row['model_id']}（{row['thinking_mode']}）"
+    for _, row in configs_df.iterrows()
+}
+selected_config_ids = st.multiselect(
+    "模型配置",
+    options=list(config_labels.keys()),
+    format_func=lambda cid: config_labels[cid],
+    help="不选择时使用当前激活的配置；选择多个配置时并行执行并生成对比报告",
+    key="run_config_ids"
+)
+
+prefetch_images = st.checkbox(
+    "预取图片",
+    value=False,
+    help="执行前并行下载所有图片到本地缓存，模型调用直接发送图片内容；无法下载的生成图不再调用模型",
+    key="run_prefetch_images"
+)
+
+# 图片预处理：缩放/重新编码后发送以减少视觉令牌，选择多个方案时各执行一次并生成对比报告
+image_profiles = st.multiselect(
+    "图片预处理方案",
+    options=list(ip.get_profiles().keys()),
+    help="不选择时原图发送；original 为原图，balanced 缩小节点4参考图，economy 缩小所有图片（需要预取图片，自动开启）",
+    key="run_image_profiles"
+)
+
+# 节点1-3的调用方式：顺序调用最省调用次数，投机并行延迟最低，合并调用只发一次请求
+precheck_mode = st.radio(
+    "节点1-3调用方式",
+    options=["sequential", "speculative", "fused"],
+    format_func=lambda mode: {
+        "sequential": "顺序调用（调用最少）",
+        "speculative": "投机并行（延迟最低）",
+        "fused": "合并调用（一次请求）"
+    }[mode],
+    horizontal=True,
+    help="投机并行同时发起节点1-3，前面的节点未通过时丢弃后续结果；合并调用用一个提示词同时判断节点1-3"
+         "（优先使用 prompts/prompt_fused.csv，否则拼接节点1-3提示词）",
+    key="run_precheck_mode"
+)
+
+# 复用与缓存：默认每个用例都重新调用模型（响应缓存命中除外）
+reuse_history = st.checkbox(
+    "复用历史节点输出",
+    value=False,
+    help="只调整了部分节点提示词时开启：上游提示词、参考图和模型配置一致的节点直接使用历史运行的输出，只重新调用修改过的节点及其下游",
+    key="run_reuse_history"
+)
+bypass_cache = st.checkbox(
+    "跳过响应缓存",
+    value=False,
+    help="所有节点强制重新调用模型（不读取响应缓存，也不复用历史节点输出），用于评估模型输出的稳定性",
+    key="run_bypass_cache"
+)
+
 if st.button("▶️ 执行测试", disabled=no_selection or not can_submit, type="primary"):
     # 提交任务到后端
     try:
         case_ids = selected_cases["case_id"].tolist()
         response = requests.post(
             f"{BACKEND_URL}/api/test/submit",
-            json={"case_ids": case_ids},
+            json={
+                "case_ids": case_ids,
+                "concurrency": int(concurrency),
+                "config_ids": selected_config_ids,
+                "prefetch_images": prefetch_images,
+                "image_profiles": image_profiles,
+                "precheck_mode": precheck_mode,
+                "reuse_history": reuse_history,
+                "bypass_cache": bypass_cache
+            },
             timeout=API_TIMEOUT
         )
         
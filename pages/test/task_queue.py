@@ -173,13 +173,29 @@ with st.container(border=True):
                     if current_case:
                         st.write(f"**当前执行:** Case {current_case}")
                 
+                # 模型服务熔断时任务暂停，探测成功后自动继续
+                circuit = detail.get("circuit_breaker") or {}
+                
                 with col2:
-                    st.write(f"**状态:** 🟢 运行中")
+                    st.write("**状态:** ⏸️ 已暂停（模型服务熔断）" if circuit else "**状态:** 🟢 运行中")
                     st.write(f"**已用时间:** {elapsed_time}")
                 
+                for endpoint, breaker in circuit.items():
+                    st.warning(
+                        f"模型服务 `{endpoint}` 不可用，已暂停 {breaker.get('paused_s', 0):.0f}s，"
+                        f"{breaker.get('retry_in_s', 0):.0f}s 后探测恢复。最近错误：{breaker.get('last_error')}"
+                    )
+                
                 # 进度条
                 st.progress(progress_pct / 100)
                 
+                # 自适应并发：当前学到的请求并发上限
+                for config_id, limiter in (detail.get("adaptive_concurrency") or {}).items():
+                    st.caption(
+                        f"自适应并发 `{config_id}`：上限 {limiter.get('limit', 0):.1f}，"
+                        f"进行中 {limiter.get('inflight', 0)}，减小 {limiter.get('decreases', 0)} 次"
+                    )
+                
                 st.markdown("---")
 
 st.write("")
@@ -0,0 +1,335 @@
+"""
+自适应并发模块
+
+固定的并发数要么太保守，要么一开始就触发大量 429。开启自适应并发（配置 adaptive_concurrency=1）后，
+按模型配置（config_id + model_id）维护进程级共享的 AIMD 并发限制器，限制同时进行中的模型请求数：
+- 慢启动：首次拥塞前每个成功请求使上限 +1（每轮往返翻倍）
+- 加性增：之后上限已被占满时，每个成功请求使上限 +1/上限（每轮往返 +1）
+- 乘性减：请求被限流（429）或节点耗时突增（短期均值超过长期均值的 LATENCY_TOLERANCE 倍）时上限减半；
+  减小前已发出的请求再触发拥塞信号时不重复减小
+
+耗时按节点分别统计（各节点图片数不同，耗时差异很大）；上限在 [adaptive_min_inflight, adaptive_max_inflight] 内变化。
+等待名额的请求（线程和协程）按到达顺序排队，名额释放时直接交给队首，不会有请求长期抢不到名额
+"""
+import time
+import asyncio
+import threading
+from collections import deque
+from . import retry_policy as rp
+from . import metrics
+
+# ==================== 自适应并发配置 ====================
+DEFAULT_MIN_INFLIGHT = 1  # 并发上限的下限
+DEFAULT_MAX_INFLIGHT = 64  # 并发上限的上限
+BACKOFF_RATIO = 0.5  # 拥塞时上限乘以的比例
+LATENCY_TOLERANCE = 2.0  # 短期耗时均值超过长期均值的该倍数时视为耗时突增
+SHORT_ALPHA = 0.2  # 短期耗时均值的平滑系数
+LONG_ALPHA = 0.02  # 长期耗时均值（基线）的平滑系数
+MIN_SAMPLES = 10  # 判断耗时突增前每个节点至少需要的样本数
+
+
+class _LatencyBaseline:
+    """单个节点的短期/长期耗时均值"""
+
+    def __init__(self):
+        self.short = None
+        self.long = None
+        self.samples = 0
+
+    def observe(self, seconds):
+        """
+        记录一次耗时
+
+        Returns:
+            bool: 是否耗时突增
+        """
+        self.samples += 1
+        if self.long is None:
+            self.short = self.long = seconds
+            return False
+        self.short += SHORT_ALPHA * (seconds - self.short)
+        self.long += LONG_ALPHA * (seconds - self.long)
+        return self.samples >= MIN_SAMPLES and self.short > self.long * LATENCY_TOLERANCE
+
+
+class _Waiter:
+    """排队等待名额的请求（线程用 Event，协程用所在事件循环的 Future）"""
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+        self.taken_at = None
+
+    def wake(self):
+        """
+        通知等待者已获得名额
+
+        Returns:
+            bool: 事件循环已关闭、无法通知时返回 False
+        """
+        if self.loop is None:
+            self.event.set()
+            return True
+        try:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+        except RuntimeError:
+            return False
+        return True
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AdaptiveLimiter:
+    """单个模型配置的 AIMD 并发限制器（线程安全）"""
+
+    def __init__(self, key, min_limit=DEFAULT_MIN_INFLIGHT, max_limit=DEFAULT_MAX_INFLIGHT):
+        """
+        Args:
+            key: 限制器标识 (config_id, model_id)
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+        """
+        self.key = key
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min_limit)
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.slow_start = True
+        self.increases = 0
+        self.decreases = 0
+        self.last_decrease_reason = None
+        self._last_decrease_at = 0.0
+        self._baselines = {}
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._labels = {"config": key[0], "model": key[1]}
+        metrics.VLM_ADAPTIVE_LIMIT.set(self.limit, **self._labels)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        从模型配置创建并发限制器
+
+        Args:
+            config: 模型配置字典（adaptive_concurrency、adaptive_min_inflight、adaptive_max_inflight）
+
+        Returns:
+            AdaptiveLimiter or None: 未开启自适应并发时返回 None
+        """
+        if not rp._config_number(config, "adaptive_concurrency", 0, int):
+            return None
+        min_limit, max_limit = _config_bounds(config)
+        return cls(_key(config), min_limit, max_limit)
+
+    def set_bounds(self, min_limit, max_limit):
+        """
+        更新上限的范围（配置变更时调用）
+
+        Args:
+            min_limit: 并发上限的下限
+            max_limit: 并发上限的上限
+        """
+        with self._lock:
+            self.min_limit = min_limit
+            self.max_limit = max_limit
+            self._set_limit(self.limit)
+
+    def _set_limit(self, limit):
+        """更新上限并把空出的名额交给排队的请求（调用方需持有锁）"""
+        self.limit = min(float(self.max_limit), max(float(self.min_limit), limit))
+        metrics.VLM_ADAPTIVE_LIMIT.set(round(self.limit, 2), **self._labels)
+        self._wake()
+
+    def _has_slot(self):
+        """是否有空闲名额（调用方需持有锁）"""
+        return self.inflight < int(self.limit)
+
+    def _take(self):
+        """占用一个名额（调用方需持有锁）"""
+        self.inflight += 1
+        self.peak_inflight = max(self.peak_inflight, self.inflight)
+        return time.monotonic()
+
+    def _wake(self):
+        """按排队顺序把空闲名额交给等待者（调用方需持有锁）"""
+        while self._waiters and self._has_slot():
+            waiter = self._waiters.popleft()
+            waiter.taken_at = self._take()
+            if not waiter.wake():
+                self.inflight -= 1
+
+    def _enqueue(self, loop=None):
+        """
+        有空闲名额且无人排队时直接占用，否则排队
+
+        Returns:
+            tuple: (占用名额的时间, None) 或 (None, _Waiter)
+        """
+        with self._lock:
+            if not self._waiters and self._has_slot():
+                return self._take(), None
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            return None, waiter
+
+    def acquire(self):
+        """
+        阻塞等待直到获得名额
+
+        Returns:
+            tuple: (占用名额的时间 monotonic，等待秒数)，释放时传回占用时间
+        """
+        start = time.monotonic()
+        taken_at, waiter = self._enqueue()
+        if waiter is None:
+            return taken_at, 0.0
+        waiter.event.wait()
+        return waiter.taken_at, time.monotonic() - start
+
+    async def acquire_async(self):
+        """
+        异步等待直到获得名额（不阻塞事件循环）
+
+        Returns:
+            tuple: (占用名额的时间 monotonic，等待秒数)
+        """
+        start = time.monotonic()
+        taken_at, waiter = self._enqueue(asyncio.get_running_loop())
+        if waiter is None:
+            return taken_at, 0.0
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter.taken_at is None:
+                    self._waiters.remove(waiter)
+                else:
+                    # 名额已交给该请求但请求被取消：归还名额
+                    self.inflight -= 1
+                    self._wake()
+            raise
+        return waiter.taken_at, time.monotonic() - start
+
+    def release(self, taken_at, node=None, seconds=None, error=None):
+        """
+        释放名额，并按请求结果调整上限
+
+        Args:
+            taken_at: acquire 返回的占用时间
+            node: 节点标签（耗时按节点统计），None 表示请求被取消，只释放名额
+            seconds: 请求耗时（秒）
+            error: 失败时的 ModelCallError，成功时为 None
+        """
+        with self._lock:
+            saturated = self.inflight >= int(self.limit)
+            self.inflight -= 1
+            if node is None or error is not None:
+                if error is not None and error.kind == rp.RateLimitedError.kind:
+                    self._decrease(taken_at, error.kind)
+                self._wake()
+                return
+            baseline = self._baselines.get(node)
+            if baseline is None:
+                baseline = self._baselines[node] = _LatencyBaseline()
+            if baseline.observe(seconds):
+                self._decrease(taken_at, "latency")
+            elif saturated:
+                self.increases += 1
+                self._set_limit(self.limit + (1.0 if self.slow_start else 1.0 / self.limit))
+            self._wake()
+
+    def _decrease(self, taken_at, reason):
+        """乘性减小上限（调用方需持有锁）"""
+        # 上次减小前发出的请求反映的是旧的并发水平，不重复减小
+        if taken_at < self._last_decrease_at:
+            return
+        self._last_decrease_at = time.monotonic()
+        self.slow_start = False
+        self.decreases += 1
+        self.last_decrease_reason = reason
+        metrics.VLM_ADAPTIVE_DECREASES.inc(reason=reason, **self._labels)
+        self._set_limit(self.limit * BACKOFF_RATIO)
+
+    def get_stats(self):
+        """
+        获取并发限制器状态
+
+        Returns:
+            dict: {"config_id", "model_id", "limit", "inflight", "waiting", "peak_inflight", "min_limit",
+                   "max_limit", "slow_start", "increases", "decreases", "last_decrease_reason"}
+        """
+        with self._lock:
+            return {
+                "config_id": self.key[0],
+                "model_id": self.key[1],
+                "limit": round(self.limit, 2),
+                "inflight": self.inflight,
+                "waiting": len(self._waiters),
+                "peak_inflight": self.peak_inflight,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "slow_start": self.slow_start,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "last_decrease_reason": self.last_decrease_reason
+            }
+
+
+def _key(config):
+    """配置对应的限制器标识"""
+    return (str(config.get('config_id', '')), str(config.get('model_id', '')))
+
+
+def _config_bounds(config):
+    """读取配置中的并发上限范围"""
+    min_limit = max(1, rp._config_number(config, "adaptive_min_inflight", DEFAULT_MIN_INFLIGHT, int))
+    max_limit = max(min_limit, rp._config_number(config, "adaptive_max_inflight", DEFAULT_MAX_INFLIGHT, int))
+    return min_limit, max_limit
+
+
+# ==================== 进程级注册表 ====================
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_adaptive_limiter(config):
+    """
+    获取模型配置对应的共享并发限制器
+
+    同一 (config_id, model_id) 在进程内只有一个限制器，所有任务共同学习服务端的实际容量；
+    配置中的上限范围变化时同步更新
+
+    Args:
+        config: 模型配置字典
+
+    Returns:
+        AdaptiveLimiter or None: 未开启自适应并发时返回 None
+    """
+    key = _key(config)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if not rp._config_number(config, "adaptive_concurrency", 0, int):
+            return None
+        if limiter is None:
+            limiter = AdaptiveLimiter.from_config(config)
+            _limiters[key] = limiter
+        else:
+            limiter.set_bounds(*_config_bounds(config))
+        return limiter
+
+
+def get_all_stats():
+    """
+    获取所有并发限制器的状态
+
+    Returns:
+        list: 每个限制器的状态字典
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.get_stats() for limiter in limiters]
@@ -0,0 +1,464 @@
+"""
+调用上下文模块
+
+CallContext 贯穿单个用例的整个工作流，由工作流创建并传给模型客户端的每次调用，
+用于承载用例级状态（重试预算、是否跳过缓存、图片发送方式、参考图集合）并记录调用统计
+（调用次数、重试次数、耗时、错误类型、缓存命中次数、历史输出复用次数、令牌用量）
+
+节点调用通过 ctx.for_node(i) 获取节点视图（NodeContext），接口与 CallContext 一致，
+记录的数据同时累加到用例总计和该节点的指标（node_metrics）中：
+- wall_ms: 节点总耗时（含限流等待、重试退避）
+- latency_ms: 请求耗时（所有尝试之和）
+- queue_wait_ms: 限流等待时间
+- attempts / retries: 请求尝试次数 / 重试次数
+- prompt_tokens / completion_tokens / reasoning_tokens: 令牌用量（来自响应 usage）
+- cache_hit / memo_hit: 是否命中响应缓存 / 复用历史输出
+- hedged: 发出的对冲请求数（见 hedging）
+- coalesced: 是否与进行中的相同请求合并、共享其结果（见 single_flight）
+- reasks: 输出不符合节点结构时的针对性重问次数（见 structured_output）
+
+投机模式下另外记录用例级的投机统计：提前发起的调用数、结果未被使用的调用数、节省的耗时，
+以及结果未被使用的调用消耗的令牌。投机调用使用 for_speculative_node 获取的节点视图，
+记录先暂存，结果被使用时计入节点指标，被丢弃时只计入用例总计和投机统计（不产生节点指标）
+"""
+import threading
+from . import retry_policy as rp
+
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "reasoning_tokens")
+
+
+def _new_node_metrics():
+    """创建空的节点指标"""
+    return {
+        "wall_ms": 0.0,
+        "latency_ms": 0.0,
+        "queue_wait_ms": 0.0,
+        "attempts": 0,
+        "retries": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "reasoning_tokens": 0,
+        "cache_hit": False,
+        "memo_hit": False,
+        "hedged": 0,
+        "coalesced": False,
+        "reasks": 0
+    }
+
+
+class CallContext:
+    """单个用例的模型调用上下文（线程安全）"""
+
+    def __init__(self, retry_budget=None, bypass_cache=False, inline_images=False,
+                 image_profile=None, case_url=None, ref_set=None):
+        """
+        初始化调用上下文
+
+        Args:
+            retry_budget: 用例级重试预算，None 时使用默认预算
+            bypass_cache: 是否跳过响应缓存读取
+            inline_images: 是否以本地缓存图片的 data URL 发送图片
+            image_profile: 图片预处理方案（ImageProfile），None 表示不处理
+            case_url: 生成图URL（用于区分生成图和参考图）
+            ref_set: 参考图集合（RefSet），用于复用已编码的参考图
+        """
+        self.retry_budget = retry_budget if retry_budget is not None else rp.RetryBudget()
+        self.bypass_cache = bypass_cache
+        self.inline_images = inline_images
+        self.image_profile = image_profile
+        self.case_url = case_url
+        self.ref_set = ref_set
+        self.cache_hits = 0
+        self.memo_hits = 0
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.latency_ms = 0.0
+        self.queue_wait_ms = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reasoning_tokens = 0
+        self.speculative_calls = 0
+        self.speculative_wasted = 0
+        self.speculation_saved_ms = 0.0
+        self.speculative_wasted_usage = dict.fromkeys(USAGE_FIELDS, 0)
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.coalesced = 0
+        self.reasks = 0
+        self.errors = {}
+        self.node_metrics = {}
+        self._lock = threading.Lock()
+
+    def for_node(self, node, verdict_keys=(), schema=None):
+        """
+        获取节点视图
+
+        Args:
+            node: 节点序号
+            verdict_keys: 节点判定所需的输出字段（流式调用时用于提前结束）
+            schema: 节点输出结构（NodeSchema，用于结构化输出模式和重问）
+
+        Returns:
+            NodeContext: 记录时自动归属到该节点的上下文
+        """
+        return NodeContext(self, node, verdict_keys, schema)
+
+    def for_speculative_node(self, node, verdict_keys=(), schema=None):
+        """
+        获取投机调用的节点视图（参数同 for_node）
+
+        Returns:
+            SpeculativeNodeContext: 记录暂存到调用结果被使用或丢弃时的节点上下文
+        """
+        return SpeculativeNodeContext(self, node, verdict_keys, schema)
+
+    def _node(self, node):
+        """获取节点指标，不存在时创建（调用方需持有锁）"""
+        key = str(node)
+        if key not in self.node_metrics:
+            self.node_metrics[key] = _new_node_metrics()
+        return self.node_metrics[key]
+
+    def record_attempt(self, latency_ms, error=None, node=None):
+        """
+        记录一次请求尝试
+
+        Args:
+            latency_ms: 本次尝试的耗时（毫秒）
+            error: 失败时的 ModelCallError
+            node: 节点序号（可选）
+        """
+        with self._lock:
+            self.attempts += 1
+            self.latency_ms += latency_ms
+            if error is not None:
+                self.errors[error.kind] = self.errors.get(error.kind, 0) + 1
+            if node is not None:
+                metrics = self._node(node)
+                metrics["attempts"] += 1
+                metrics["latency_ms"] += latency_ms
+
+    def record_retry(self, node=None):
+        """记录一次重试"""
+        with self._lock:
+            self.retries += 1
+            if node is not None:
+                self._node(node)["retries"] += 1
+
+    def record_call(self, node=None):
+        """记录一次逻辑调用（含重试只算一次）"""
+        with self._lock:
+            self.calls += 1
+            if node is not None:
+                self._node(node)
+
+    def record_cache_hit(self, node=None):
+        """记录一次响应缓存命中"""
+        with self._lock:
+            self.cache_hits += 1
+            if node is not None:
+                self._node(node)["cache_hit"] = True
+
+    def record_memo_hit(self, node=None):
+        """记录一次历史节点输出复用"""
+        with self._lock:
+            self.memo_hits += 1
+            if node is not None:
+                self._node(node)["memo_hit"] = True
+
+    def record_coalesced(self, node=None):
+        """记录一次与进行中的相同请求合并"""
+        with self._lock:
+            self.coalesced += 1
+            if node is not None:
+                self._node(node)["coalesced"] = True
+
+    def record_reask(self, node=None):
+        """记录一次针对性重问"""
+        with self._lock:
+            self.reasks += 1
+            if node is not None:
+                self._node(node)["reasks"] += 1
+
+    def record_queue_wait(self, wait_ms, node=None):
+        """
+        记录限流等待时间
+
+        Args:
+            wait_ms: 等待时间（毫秒）
+            node: 节点序号（可选）
+        """
+        with self._lock:
+            self.queue_wait_ms += wait_ms
+            if node is not None:
+                self._node(node)["queue_wait_ms"] += wait_ms
+
+    def record_usage(self, usage, node=None):
+        """
+        记录令牌用量
+
+        Args:
+            usage: {"prompt_tokens", "completion_tokens", "reasoning_tokens"}
+            node: 节点序号（可选）
+        """
+        if not usage:
+            return
+        with self._lock:
+            metrics = self._node(node) if node is not None else None
+            for field in USAGE_FIELDS:
+                value = usage.get(field) or 0
+                setattr(self, field, getattr(self, field) + value)
+                if metrics is not None:
+                    metrics[field] += value
+
+    def record_wall(self, node, wall_ms):
+        """
+        记录节点总耗时
+
+        Args:
+            node: 节点序号
+            wall_ms: 节点总耗时（毫秒）
+        """
+        with self._lock:
+            self._node(node)["wall_ms"] += wall_ms
+
+    def record_hedge(self, won, node=None):
+        """
+        记录一次对冲请求
+
+        Args:
+            won: 是否对冲请求先返回
+            node: 节点序号（可选）
+        """
+        with self._lock:
+            self.hedged += 1
+            self.hedge_wins += int(bool(won))
+            if node is not None:
+                self._node(node)["hedged"] += 1
+
+    def record_speculation(self, calls=0, wasted=0, saved_ms=0.0):
+        """
+        记录投机调用统计
+
+        Args:
+            calls: 提前发起的调用数
+            wasted: 其中结果未被使用的调用数
+            saved_ms: 相比顺序执行节省的耗时（毫秒）
+        """
+        with self._lock:
+            self.speculative_calls += calls
+            self.speculative_wasted += wasted
+            self.speculation_saved_ms += saved_ms
+
+    def record_speculative_usage(self, usage):
+        """
+        记录结果未被使用的投机调用消耗的令牌（用例总计另由 record_usage 记录）
+
+        Args:
+            usage: {"prompt_tokens", "completion_tokens", "reasoning_tokens"}
+        """
+        if not usage:
+            return
+        with self._lock:
+            for field in USAGE_FIELDS:
+                self.speculative_wasted_usage[field] += usage.get(field) or 0
+
+    def to_dict(self):
+        """
+        导出调用统计
+
+        Returns:
+            dict: {"calls", "cache_hits", "memo_hits", "attempts", "retries", "latency_ms",
+                   "queue_wait_ms", "prompt_tokens", "completion_tokens", "reasoning_tokens", "errors"}
+                  投机模式下另含 "speculative_calls", "speculative_wasted", "speculation_saved_ms"
+                  和 "speculative_wasted_prompt_tokens" 等（被丢弃的调用消耗的令牌），
+                  发生对冲时另含 "hedged", "hedge_wins"，发生请求合并时另含 "coalesced"，
+                  发生重问时另含 "reasks"
+        """
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "cache_hits": self.cache_hits,
+                "memo_hits": self.memo_hits,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "latency_ms": round(self.latency_ms, 1),
+                "queue_wait_ms": round(self.queue_wait_ms, 1),
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "reasoning_tokens": self.reasoning_tokens,
+                "errors": dict(self.errors),
+                **({
+                    "speculative_calls": self.speculative_calls,
+                    "speculative_wasted": self.speculative_wasted,
+                    "speculation_saved_ms": round(self.speculation_saved_ms, 1),
+                    **{f"speculative_wasted_{field}": value for field, value in self.speculative_wasted_usage.items()}
+                } if self.speculative_calls else {}),
+                **({"hedged": self.hedged, "hedge_wins": self.hedge_wins} if self.hedged else {}),
+                **({"coalesced": self.coalesced} if self.coalesced else {}),
+                **({"reasks": self.reasks} if self.reasks else {})
+            }
+
+    def node_metrics_dict(self):
+        """
+        导出各节点指标
+
+        Returns:
+            dict: {"1": {...}, "2": {...}, ...}，耗时保留1位小数
+        """
+        with self._lock:
+            return {
+                node: {k: round(v, 1) if isinstance(v, float) else v for k, v in metrics.items()}
+                for node, metrics in self.node_metrics.items()
+            }
+
+
+class NodeContext:
+    """CallContext 的节点视图，接口与 CallContext 一致，记录时自动带上节点序号"""
+
+    def __init__(self, parent, node, verdict_keys=(), schema=None):
+        """
+        Args:
+            parent: 用例调用上下文（CallContext）
+            node: 节点序号
+            verdict_keys: 节点判定所需的输出字段
+            schema: 节点输出结构（NodeSchema）
+        """
+        self.parent = parent
+        self.node = node
+        self.verdict_keys = tuple(verdict_keys)
+        self.schema = schema
+
+    @property
+    def retry_budget(self):
+        return self.parent.retry_budget
+
+    @property
+    def bypass_cache(self):
+        return self.parent.bypass_cache
+
+    @property
+    def inline_images(self):
+        return self.parent.inline_images
+
+    @property
+    def image_profile(self):
+        return self.parent.image_profile
+
+    @property
+    def case_url(self):
+        return self.parent.case_url
+
+    @property
+    def ref_set(self):
+        return self.parent.ref_set
+
+    def record_attempt(self, latency_ms, error=None):
+        self.parent.record_attempt(latency_ms, error, node=self.node)
+
+    def record_retry(self):
+        self.parent.record_retry(node=self.node)
+
+    def record_call(self):
+        self.parent.record_call(node=self.node)
+
+    def record_cache_hit(self):
+        self.parent.record_cache_hit(node=self.node)
+
+    def record_memo_hit(self):
+        self.parent.record_memo_hit(node=self.node)
+
+    def record_coalesced(self):
+        self.parent.record_coalesced(node=self.node)
+
+    def record_reask(self):
+        self.parent.record_reask(node=self.node)
+
+    def record_queue_wait(self, wait_ms):
+        self.parent.record_queue_wait(wait_ms, node=self.node)
+
+    def record_usage(self, usage):
+        self.parent.record_usage(usage, node=self.node)
+
+    def record_wall(self, wall_ms):
+        self.parent.record_wall(self.node, wall_ms)
+
+    def record_hedge(self, won):
+        self.parent.record_hedge(won, node=self.node)
+
+
+class SpeculativeNodeContext(NodeContext):
+    """
+    投机调用的节点视图
+
+    记录先暂存，resolve(used=True) 时按 NodeContext 计入用例总计和节点指标；
+    resolve(used=False)（结果被丢弃）时只计入用例总计，令牌另计入投机统计，不产生节点指标。
+    resolve 之后到达的记录（如被丢弃但仍在进行的请求）直接按结果计入
+    """
+
+    def __init__(self, parent, node, verdict_keys=(), schema=None):
+        super().__init__(parent, node, verdict_keys, schema)
+        self._records = []
+        self._used = None  # None: 尚未决定；True: 结果被使用；False: 结果被丢弃
+        self._lock = threading.Lock()
+
+    def _record(self, name, *args):
+        """暂存或直接计入一条记录"""
+        with self._lock:
+            if self._used is None:
+                self._records.append((name, args))
+                return
+            used = self._used
+        self._apply(name, args, used)
+
+    def _apply(self, name, args, used):
+        if used:
+            getattr(NodeContext, name)(self, *args)
+            return
+        getattr(self.parent, name)(*args)
+        if name == "record_usage":
+            self.parent.record_speculative_usage(*args)
+
+    def resolve(self, used):
+        """
+        调用结果被使用或丢弃，计入暂存的记录
+
+        Args:
+            used: 结果是否被使用
+        """
+        with self._lock:
+            self._used = used
+            records, self._records = self._records, []
+        for name, args in records:
+            self._apply(name, args, used)
+
+    def record_attempt(self, latency_ms, error=None):
+        self._record("record_attempt", latency_ms, error)
+
+    def record_retry(self):
+        self._record("record_retry")
+
+    def record_call(self):
+        self._record("record_call")
+
+    def record_cache_hit(self):
+        self._record("record_cache_hit")
+
+    def record_memo_hit(self):
+        self._record("record_memo_hit")
+
+    def record_coalesced(self):
+        self._record("record_coalesced")
+
+    def record_reask(self):
+        self._record("record_reask")
+
+    def record_queue_wait(self, wait_ms):
+        self._record("record_queue_wait", wait_ms)
+
+    def record_usage(self, usage):
+        self._record("record_usage", usage)
+
+    def record_hedge(self, won):
+        self._record("record_hedge", won)
@@ -0,0 +1,257 @@
+"""
+熔断器模块
+
+模型服务不可用时，每个用例都要等到超时并耗尽重试才会失败，整个任务被拖上数小时、
+历史记录里全是 error。按服务端点（base_url + model_id）维护进程级共享的熔断器：
+- closed: 正常放行；连续失败达到 breaker_failures 次，或最近 breaker_window 次请求中
+  失败比例达到 breaker_failure_rate 时打开
+- open: 直接拒绝请求（抛出 CircuitOpenError，不再等待超时）；breaker_cooldown 秒后转为半开
+- half_open: 只放行一个探测请求，成功则关闭、恢复正常，失败则重新打开
+
+只有超时/连接失败和 5xx 计为失败；其他响应（包括 4xx、429）说明服务可达，计为成功
+"""
+import time
+import threading
+from collections import deque
+from . import retry_policy as rp
+from . import metrics
+
+# ==================== 熔断配置 ====================
+DEFAULT_FAILURES = 5  # 连续失败次数阈值，0 表示不启用熔断
+DEFAULT_WINDOW = 20  # 失败比例统计的最近请求数
+DEFAULT_FAILURE_RATE = 0.5  # 窗口内失败比例阈值
+DEFAULT_COOLDOWN = 30.0  # 打开后转为半开前的等待时间（秒）
+TRIP_ERROR_KINDS = (rp.ModelTimeoutError.kind, rp.ServerError.kind)  # 计为失败的错误类型
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}  # 指标取值
+
+
+class CircuitBreaker:
+    """单个服务端点的熔断器（线程安全）"""
+
+    def __init__(self, endpoint, failures=DEFAULT_FAILURES, window=DEFAULT_WINDOW,
+                 failure_rate=DEFAULT_FAILURE_RATE, cooldown=DEFAULT_COOLDOWN):
+        """
+        Args:
+            endpoint: 端点标识（base_url/model_id）
+            failures: 连续失败次数阈值
+            window: 失败比例统计的最近请求数
+            failure_rate: 窗口内失败比例阈值
+            cooldown: 打开后转为半开前的等待时间（秒）
+        """
+        self.endpoint = endpoint
+        self.failures = failures
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.trips = 0
+        self._outcomes = deque(maxlen=max(1, window))
+        self._probe_started = None
+        self._changed = threading.Condition()
+        metrics.VLM_CIRCUIT_STATE.set(STATE_VALUES[CLOSED], endpoint=endpoint)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        从模型配置创建熔断器
+
+        Args:
+            config: 模型配置字典（breaker_failures、breaker_window、breaker_failure_rate、breaker_cooldown）
+
+        Returns:
+            CircuitBreaker or None: breaker_failures 为 0 时返回 None
+        """
+        failures = rp._config_number(config, "breaker_failures", DEFAULT_FAILURES, int)
+        if failures <= 0:
+            return None
+        return cls(
+            _endpoint(config),
+            failures=failures,
+            window=rp._config_number(config, "breaker_window", DEFAULT_WINDOW, int),
+            failure_rate=rp._config_number(config, "breaker_failure_rate", DEFAULT_FAILURE_RATE),
+            cooldown=rp._config_number(config, "breaker_cooldown", DEFAULT_COOLDOWN)
+        )
+
+    def _set_state(self, state):
+        """切换状态并唤醒等待者（调用方需持有锁）"""
+        self.state = state
+        metrics.VLM_CIRCUIT_STATE.set(STATE_VALUES[state], endpoint=self.endpoint)
+        self._changed.notify_all()
+
+    def _trip(self, now):
+        """打开熔断器（调用方需持有锁）"""
+        self.opened_at = now
+        self._probe_started = None
+        self.trips += 1
+        metrics.VLM_CIRCUIT_TRIPS.inc(endpoint=self.endpoint)
+        self._set_state(OPEN)
+
+    def allow(self):
+        """
+        判断是否放行一次请求
+
+        打开超过 cooldown 秒后转为半开并放行一个探测请求；
+        探测请求超过 cooldown 秒仍未返回（如被取消）时允许新的探测
+
+        Returns:
+            bool: 是否放行
+        """
+        with self._changed:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN:
+                if now - self.opened_at < self.cooldown:
+                    return False
+                self._set_state(HALF_OPEN)
+            if self._probe_started is not None and now - self._probe_started < self.cooldown:
+                return False
+            self._probe_started = now
+            return True
+
+    def available(self):
+        """
+        当前是否会放行请求（不占用探测名额，用于调用方判断是否需要等待）
+
+        Returns:
+            bool: 关闭、冷却结束或没有进行中的探测时为 True
+        """
+        with self._changed:
+            if self.state == CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == OPEN:
+                return now - self.opened_at >= self.cooldown
+            return self._probe_started is None or now - self._probe_started >= self.cooldown
+
+    def record(self, error=None):
+        """
+        记录一次请求结果
+
+        Args:
+            error: 失败时的 ModelCallError，成功时为 None
+        """
+        failed = error is not None and error.kind in TRIP_ERROR_KINDS
+        with self._changed:
+            now = time.monotonic()
+            if not failed:
+                self.consecutive_failures = 0
+                self._outcomes.append(False)
+                if self.state == HALF_OPEN:
+                    # 探测成功：恢复正常，重新统计失败比例
+                    self._outcomes.clear()
+                    self._probe_started = None
+                    self._set_state(CLOSED)
+                return
+            self.consecutive_failures += 1
+            self._outcomes.append(True)
+            self.last_error = str(error)
+            if self.state == HALF_OPEN:
+                self._trip(now)
+            elif self.state == CLOSED and self._should_trip():
+                self._trip(now)
+
+    def _should_trip(self):
+        """是否达到打开条件（调用方需持有锁）"""
+        if self.consecutive_failures >= self.failures:
+            return True
+        window_full = len(self._outcomes) == self._outcomes.maxlen
+        return window_full and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate
+
+    def retry_in(self):
+        """
+        距离允许探测的剩余秒数
+
+        Returns:
+            float: 关闭时为 0
+        """
+        with self._changed:
+            return self._retry_in()
+
+    def _retry_in(self):
+        """retry_in 的实现（调用方需持有锁）"""
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def wait(self, timeout):
+        """
+        熔断器未关闭时等待，直到状态变化、冷却结束或超时
+
+        Args:
+            timeout: 最长等待秒数
+        """
+        with self._changed:
+            if self.state == CLOSED:
+                return
+            # 半开时等待探测结果（状态变化会唤醒）
+            remaining = self._retry_in() if self.state == OPEN else timeout
+            self._changed.wait(min(timeout, max(0.05, remaining)))
+
+    def get_stats(self):
+        """
+        获取熔断器状态
+
+        Returns:
+            dict: {"endpoint", "state", "consecutive_failures", "trips", "retry_in_s", "last_error"}
+        """
+        with self._changed:
+            return {
+                "endpoint": self.endpoint,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "trips": self.trips,
+                "retry_in_s": round(self._retry_in(), 1),
+                "last_error": self.last_error
+            }
+
+
+def _endpoint(config):
+    """配置对应的服务端点标识"""
+    return f"{config.get('base_url', '')}/{config.get('model_id', '')}"
+
+
+# ==================== 进程级注册表 ====================
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(config):
+    """
+    获取模型配置对应的共享熔断器
+
+    同一服务端点（base_url + model_id）在进程内共享一个熔断器，
+    使用同一端点的多个配置、多个任务看到一致的状态
+
+    Args:
+        config: 模型配置字典
+
+    Returns:
+        CircuitBreaker or None: 未启用熔断时返回 None
+    """
+    key = _endpoint(config)
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker.from_config(config)
+            if breaker is not None:
+                _breakers[key] = breaker
+        return breaker
+
+
+def get_all_stats():
+    """
+    获取所有熔断器的状态
+
+    Returns:
+        list: 每个熔断器的状态字典
+    """
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.get_stats() for breaker in breakers]
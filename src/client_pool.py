@@ -0,0 +1,317 @@
+"""
+客户端池模块
+
+同一模型常有多个 API Key 或地域端点，每个都有独立的 RPM/TPM 额度。
+在模型配置中把它们标记为同一个池（pool 列）后，池中所有配置共同分担请求：
+- least_outstanding: 选择进行中请求数/权重最小的配置（默认）
+- weighted_round_robin: 按权重平滑轮询（同 nginx smooth weighted round-robin）
+
+熔断中（见 circuit_breaker）或鉴权失败的配置自动移出候选，恢复后重新加入；
+请求因熔断、鉴权失败或重试耗尽（限流/超时/5xx）而失败时，换池中另一个配置重发，
+一次逻辑调用只计一次，换配置重发的请求只计入尝试次数。
+每个配置保留自己的限流器、重试策略、对冲策略、熔断器和自适应并发限制器，池只负责选择
+"""
+import time
+import threading
+from . import model_client as mc
+from . import config_manager as cm
+from . import retry_policy as rp
+from . import metrics
+
+# ==================== 池配置 ====================
+LEAST_OUTSTANDING = "least_outstanding"
+WEIGHTED_ROUND_ROBIN = "weighted_round_robin"
+STRATEGIES = (LEAST_OUTSTANDING, WEIGHTED_ROUND_ROBIN)
+AUTH_COOLDOWN = 300.0  # 鉴权失败的配置移出候选的时间（秒）
+# 换另一个配置重发的错误类型（与具体 API Key / 端点有关的错误）
+FAILOVER_KINDS = (
+    rp.CircuitOpenError.kind, rp.AuthError.kind, rp.RateLimitedError.kind,
+    rp.ModelTimeoutError.kind, rp.ServerError.kind
+)
+
+
+class _MemberState:
+    """池中单个配置的选择状态（同一池的所有客户端共享，由 _state_lock 保护）"""
+
+    def __init__(self, config_id, weight):
+        self.config_id = config_id
+        self.weight = weight
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.current = 0.0  # 平滑轮询的当前权重
+        self.disabled_until = 0.0
+        self.last_error = None
+
+
+class ClientPool(mc.ModelClient):
+    """
+    池化的模型客户端
+
+    对外接口与 ModelClient 一致（call_single / call_multi_ref / call_compare 及异步版本），
+    每次请求从池中选择一个配置的客户端发出
+    """
+
+    def __init__(self, name, configs):
+        """
+        初始化客户端池
+
+        Args:
+            name: 池名称（历史记录中作为 config_id）
+            configs: 池中的配置字典列表（同一 model_id / thinking_mode）
+        """
+        self.name = name
+        strategy = str(configs[0].get('pool_strategy') or LEAST_OUTSTANDING).strip()
+        self.strategy = strategy if strategy in STRATEGIES else LEAST_OUTSTANDING
+        self.members = [
+            (mc.ModelClient(config), _get_member_state(name, config))
+            for config in configs
+        ]
+        # 池本身不发出请求，继承的客户端状态与第一个配置共用（不另建限流器、对冲策略等共享对象）
+        primary = self.members[0][0]
+        self.client = primary.client
+        self._async_clients = primary._async_clients
+        self.rate_limiter = primary.rate_limiter
+        self.retry_policy = primary.retry_policy
+        self.stream = primary.stream
+        self.hedge = primary.hedge
+        self.json_mode = primary.json_mode
+        # 熔断器和自适应并发限制器按成员分别生效（见 circuit_breakers / adaptive_limiters）
+        self.breaker = None
+        self.adaptive = None
+        # 历史记录、节点输出复用和重试预算按池整体归类
+        self.config = dict(configs[0], config_id=name)
+        self.model_id = self.config['model_id']
+        self.thinking_mode = self.config.get('thinking_mode', 'disabled')
+
+    @classmethod
+    def from_pool(cls, name):
+        """
+        按池名称从配置文件创建客户端池
+
+        Args:
+            name: 池名称
+
+        Returns:
+            ClientPool: 客户端池
+
+        Raises:
+            ValueError: 池不存在或池中模型不一致
+        """
+        return cls(name, cm.get_pool_configs(name))
+
+    def circuit_breakers(self):
+        """池中各配置的熔断器（全部熔断时任务暂停）"""
+        return [client.breaker for client, _ in self.members if client.breaker is not None]
+
+    def adaptive_limiters(self):
+        """池中各配置的自适应并发限制器"""
+        return [client.adaptive for client, _ in self.members if client.adaptive is not None]
+
+    # ==================== 选择 ====================
+
+    def _healthy(self, client, state, now):
+        """配置当前是否可用（调用方需持有 _state_lock）"""
+        if state.disabled_until > now:
+            return False
+        return client.breaker is None or client.breaker.available()
+
+    def _pick(self, tried):
+        """
+        选择一个配置并计入进行中请求（内部方法）
+
+        没有可用配置时仍从未尝试过的配置中选择（请求会快速失败，由调用方处理）
+
+        Args:
+            tried: 本次请求已尝试过的成员
+
+        Returns:
+            tuple or None: (ModelClient, _MemberState)，所有配置都已尝试时返回 None
+        """
+        now = time.monotonic()
+        with _state_lock:
+            candidates = [m for m in self.members if m not in tried and m[1].weight > 0]
+            healthy = [m for m in candidates if self._healthy(*m, now)]
+            candidates = healthy or candidates
+            if not candidates:
+                return None
+            if self.strategy == WEIGHTED_ROUND_ROBIN:
+                total = sum(state.weight for _, state in candidates)
+                for _, state in candidates:
+                    state.current += state.weight
+                member = max(candidates, key=lambda m: m[1].current)
+                member[1].current -= total
+            else:
+                member = min(candidates, key=lambda m: (m[1].outstanding / m[1].weight, m[1].requests / m[1].weight))
+            member[1].outstanding += 1
+            member[1].requests += 1
+        metrics.VLM_POOL_REQUESTS.inc(pool=self.name, config=member[1].config_id)
+        return member
+
+    def _release(self, member, error=None):
+        """请求结束，扣除进行中请求并记录失败（内部方法）"""
+        _, state = member
+        with _state_lock:
+            state.outstanding -= 1
+            if error is None:
+                return
+            state.failures += 1
+            state.last_error = str(error)
+            if error.kind == rp.AuthError.kind:
+                state.disabled_until = time.monotonic() + AUTH_COOLDOWN
+
+    # ==================== 发送请求 ====================
+
+    def _send_request(self, messages, ctx=None):
+        """
+        从池中选择配置发送请求（内部方法）
+
+        与 API Key / 端点有关的失败（FAILOVER_KINDS）换另一个配置重发，其他失败（如 4xx 请求错误）直接抛出；
+        逻辑调用在池层记录一次，成员的每次请求（含换配置重发）只计入尝试次数
+
+        Raises:
+            ModelCallError: 调用最终失败
+        """
+        if ctx is not None:
+            ctx.record_call()
+        tried = []
+        error = None
+        while True:
+            member = self._pick(tried)
+            if member is None:
+                raise error or rp.ModelCallError(f"模型池 {self.name} 没有可用配置")
+            try:
+                content = member[0]._dispatch(messages, ctx)
+            except rp.ModelCallError as e:
+                self._release(member, e)
+                if e.kind not in FAILOVER_KINDS:
+                    raise
+                tried.append(member)
+                error = e
+                continue
+            except BaseException:
+                self._release(member)
+                raise
+            self._release(member)
+            return content
+
+    async def _send_request_async(self, messages, ctx=None):
+        """异步发送请求（内部方法，逻辑与 _send_request 一致）"""
+        if ctx is not None:
+            ctx.record_call()
+        tried = []
+        error = None
+        while True:
+            member = self._pick(tried)
+            if member is None:
+                raise error or rp.ModelCallError(f"模型池 {self.name} 没有可用配置")
+            try:
+                content = await member[0]._dispatch_async(messages, ctx)
+            except rp.ModelCallError as e:
+                self._release(member, e)
+                if e.kind not in FAILOVER_KINDS:
+                    raise
+                tried.append(member)
+                error = e
+                continue
+            except BaseException:
+                self._release(member)
+                raise
+            self._release(member)
+            return content
+
+    def get_config_info(self):
+        """
+        获取当前配置信息
+
+        Returns:
+            dict: 配置信息，members 为池中各配置ID
+        """
+        info = super().get_config_info()
+        info["members"] = [str(client.config.get('config_id')) for client, _ in self.members]
+        return info
+
+    def get_stats(self):
+        """
+        获取池中各配置的选择统计
+
+        Returns:
+            dict: {"pool", "strategy", "members": [{"config_id", "base_url", "weight", "outstanding",
+                   "requests", "failures", "healthy", "last_error"}]}
+        """
+        now = time.monotonic()
+        with _state_lock:
+            members = [{
+                "config_id": state.config_id,
+                "base_url": client.config.get('base_url'),
+                "weight": state.weight,
+                "outstanding": state.outstanding,
+                "requests": state.requests,
+                "failures": state.failures,
+                "healthy": self._healthy(client, state, now),
+                "last_error": state.last_error
+            } for client, state in self.members]
+        return {"pool": self.name, "strategy": self.strategy, "members": members}
+
+
+# ==================== 进程级注册表 ====================
+_member_states = {}
+_pools = {}
+_state_lock = threading.Lock()
+
+
+def _get_member_state(pool, config):
+    """
+    获取池中配置的共享选择状态（同一池的多个客户端、多个任务共用进行中请求数）
+
+    Args:
+        pool: 池名称
+        config: 配置字典（pool_weight 变化时更新权重）
+
+    Returns:
+        _MemberState: 选择状态
+    """
+    config_id = str(config.get('config_id'))
+    weight = rp._config_number(config, "pool_weight", 1.0)
+    with _state_lock:
+        state = _member_states.get((pool, config_id))
+        if state is None:
+            state = _MemberState(config_id, weight)
+            _member_states[(pool, config_id)] = state
+        state.weight = weight
+        return state
+
+
+def get_pool_client(name, force_reload=False):
+    """
+    获取客户端池（按池名称复用）
+
+    Args:
+        name: 池名称
+        force_reload: 是否重新读取配置文件
+
+    Returns:
+        ClientPool: 客户端池
+
+    Raises:
+        ValueError: 池不存在或池中模型不一致
+    """
+    with _state_lock:
+        pool = _pools.get(name)
+    if pool is None or force_reload:
+        pool = ClientPool.from_pool(name)
+        with _state_lock:
+            _pools[name] = pool
+    return pool
+
+
+def get_all_stats():
+    """
+    获取所有客户端池的统计
+
+    Returns:
+        list: 每个池的统计字典
+    """
+    with _state_lock:
+        pools = list(_pools.values())
+    return [pool.get_stats() for pool in pools]
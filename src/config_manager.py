@@ -12,6 +12,50 @@ CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
 DATA_DIR = os.path.join(PROJECT_ROOT, "data")
 CONFIG_FILE = os.path.join(DATA_DIR, "model_config.csv")
+DEFAULT_BASE_URL = "https://ark.cn-beijing.volces.com/api/v3"
+
+# 可选配置列（旧配置文件中可能不存在，更新时自动补齐）
+# - rpm: 每分钟请求数上限，0 表示不限制
+# - tpm: 每分钟令牌数上限，0 表示不限制
+# - max_retries: 单次调用最大重试次数
+# - retry_base_delay / retry_max_delay: 指数退避的基础/最大等待秒数
+# - case_retry_budget: 单个用例所有节点累计的最大重试次数
+# - stream: 1 表示节点1-3使用流式调用，判定JSON完整后立即结束生成
+# - hedge_percentile: 请求耗时超过该节点历史耗时的该百分位（如 95）时发出对冲请求，0 表示不对冲
+# - hedge_max_ratio: 对冲请求占全部请求的最大比例
+# - breaker_failures: 连续超时/5xx 达到该次数时熔断（快速失败并暂停任务），0 表示不启用熔断
+# - breaker_window / breaker_failure_rate: 最近 breaker_window 次请求中失败比例达到该值时熔断
+# - breaker_cooldown: 熔断后等待该秒数再发出探测请求，探测成功自动恢复
+# - pool: 客户端池名称，同一池的配置（同一模型的多个 API Key / 地域端点）共同分担请求，空表示不入池
+# - pool_weight: 在池中的权重（请求按权重分配）
+# - pool_strategy: 池的选择策略，least_outstanding（进行中请求数/权重最小）或 weighted_round_robin，
+#   以池中第一个配置为准
+# - adaptive_concurrency: 1 表示按耗时和 429 自动调整同时进行中的请求数（AIMD），任务并发数作为上限
+# - adaptive_min_inflight / adaptive_max_inflight: 自适应并发上限的变化范围
+# - json_mode: 模型服务的结构化输出模式，json_object（只输出JSON对象）或 json_schema（按节点输出结构约束），
+#   空表示不使用（模型不支持时留空，输出仍会容错解析并按节点结构校验）
+OPTIONAL_COLUMNS = {
+    "rpm": 0,
+    "tpm": 0,
+    "max_retries": 3,
+    "retry_base_delay": 1.0,
+    "retry_max_delay": 30.0,
+    "case_retry_budget": 6,
+    "stream": 0,
+    "hedge_percentile": 0,
+    "hedge_max_ratio": 0.05,
+    "breaker_failures": 5,
+    "breaker_window": 20,
+    "breaker_failure_rate": 0.5,
+    "breaker_cooldown": 30.0,
+    "pool": "",
+    "pool_weight": 1,
+    "pool_strategy": "least_outstanding",
+    "adaptive_concurrency": 0,
+    "adaptive_min_inflight": 1,
+    "adaptive_max_inflight": 64,
+    "json_mode": ""
+}
 
 
 def _ensure_config_file():
@@ -21,7 +65,8 @@ def _ensure_config_file():
             "config_id": "default",
             "model_id": "your-model-id-here",
             "api_key": "YOUR_API_KEY_HERE",
-            "thinking_mode": "disabled"
+            "thinking_mode": "disabled",
+            **OPTIONAL_COLUMNS
         }])
         default_config.to_csv(CONFIG_FILE, index=False)
 
@@ -51,15 +96,88 @@ def get_active_config():
         raise ValueError("No model configuration found")
     
     # 简化逻辑：直接返回第一个配置
-    config = configs.iloc[0].to_dict()
+    return _normalize_config(configs.iloc[0].to_dict())
+
+
+def get_config(config_id):
+    """
+    获取指定ID的配置
+    
+    Args:
+        config_id: 配置ID
+    
+    Returns:
+        dict: 配置字典，格式同 get_active_config
+    
+    Raises:
+        ValueError: 配置不存在
+    """
+    _ensure_config_file()
+    configs = pd.read_csv(CONFIG_FILE)
+    
+    # config_id 可能被读取为数字，统一按字符串比较
+    matched = configs[configs['config_id'].astype(str) == str(config_id)]
+    if matched.empty:
+        raise ValueError(f"Model configuration not found: {config_id}")
+    
+    return _normalize_config(matched.iloc[0].to_dict())
+
+
+def get_pool_name(config):
+    """
+    获取配置所属的客户端池名称
     
-    # 添加固定的 base_url（火山引擎）
-    config['base_url'] = "https://ark.cn-beijing.volces.com/api/v3"
+    Args:
+        config: 配置字典
+    
+    Returns:
+        str or None: 池名称，未入池时返回 None
+    """
+    pool = config.get('pool')
+    if not isinstance(pool, str) or not pool.strip():
+        return None
+    return pool.strip()
+
+
+def get_pool_configs(pool):
+    """
+    获取客户端池中的所有配置（按配置文件中的顺序）
+    
+    Args:
+        pool: 池名称
+    
+    Returns:
+        list: 配置字典列表
+    
+    Raises:
+        ValueError: 池不存在，或池中配置的 model_id / thinking_mode 不一致
+    """
+    _ensure_config_file()
+    configs = pd.read_csv(CONFIG_FILE)
+    members = [
+        _normalize_config(config) for config in configs.to_dict("records")
+        if get_pool_name(config) == pool
+    ]
+    if not members:
+        raise ValueError(f"Model pool not found: {pool}")
+    
+    # 池中的请求可以发往任一配置，必须是同一个模型
+    models = {(str(c['model_id']), str(c.get('thinking_mode', 'disabled'))) for c in members}
+    if len(models) > 1:
+        raise ValueError(f"Model pool {pool} mixes different model_id / thinking_mode: {sorted(models)}")
+    return members
+
+
+def _normalize_config(config):
+    """补齐配置的默认值"""
+    # 未配置 base_url 时使用固定的火山引擎地址（可配置为本地 OpenAI 兼容服务用于测试）
+    if not isinstance(config.get('base_url'), str) or not config['base_url'].strip():
+        config['base_url'] = DEFAULT_BASE_URL
     
     return config
 
 
-def add_config(model_id, api_key, thinking_mode="disabled"):
+def add_config(model_id, api_key, thinking_mode="disabled", rpm=0, tpm=0):
     """
     添加新的模型配置
     
@@ -67,6 +185,8 @@ def add_config(model_id, api_key, thinking_mode="disabled"):
         model_id: 模型ID
         api_key: API密钥
         thinking_mode: 思考模式（enabled/disabled）
+        rpm: 每分钟请求数上限，0 表示不限制
+        tpm: 每分钟令牌数上限，0 表示不限制
     
     Returns:
         str: 新配置的ID
@@ -81,7 +201,9 @@ def add_config(model_id, api_key, thinking_mode="disabled"):
         "config_id": config_id,
         "model_id": model_id,
         "api_key": api_key,
-        "thinking_mode": thinking_mode
+        "thinking_mode": thinking_mode,
+        "rpm": rpm,
+        "tpm": tpm
     }
     
     configs = pd.concat([configs, pd.DataFrame([new_config])], ignore_index=True)
@@ -110,8 +232,10 @@ def update_config(config_id, **kwargs):
     if len(idx) == 0:
         return False
     
-    # 更新字段
+    # 更新字段（可选列不存在时先补齐默认值）
     for key, value in kwargs.items():
+        if key not in configs.columns and key in OPTIONAL_COLUMNS:
+            configs[key] = OPTIONAL_COLUMNS[key]
         if key in configs.columns:
             configs.loc[idx[0], key] = value
     
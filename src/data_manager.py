@@ -59,6 +59,22 @@ def get_prompts():
                  prompts[i] = df.iloc[-1].to_dict()
     return prompts
 
+def get_fused_prompt():
+    """
+    获取节点1-3合并调用的专用提示词（prompts/prompt_fused.csv，格式与 prompt_0N.csv 相同）
+
+    Returns:
+        dict or None: 激活版本（无激活版本时取最后一行），文件不存在时返回 None
+                      （此时由激活的 prompt_01 ~ prompt_03 拼接）
+    """
+    df = load_csv("prompts/prompt_fused.csv")
+    if df.empty:
+        return None
+    active = df[df['is_active'] == True]
+    if not active.empty:
+        return active.iloc[0].to_dict()
+    return df.iloc[-1].to_dict()
+
 def get_prompt_versions(node_index):
     """
     获取指定节点的所有版本记录
@@ -0,0 +1,235 @@
+"""
+请求对冲模块
+
+少数节点4/5调用的耗时是中位数的数倍，任务末尾常被这些慢请求拖住。
+开启对冲（配置 hedge_percentile > 0）后，请求耗时超过该节点历史耗时的指定百分位仍未返回时，
+再发出一个相同的请求，取先成功返回的结果，另一个请求被取消或丢弃：
+- LatencyTracker: 按 (模型, 节点) 在线学习请求耗时分布（最近 WINDOW_SIZE 个成功请求的滑动窗口）
+- HedgePolicy: 按配置计算对冲等待时间，并限制对冲请求占全部请求的比例（hedge_max_ratio）
+
+样本不足 MIN_SAMPLES 时不对冲；对冲请求同样占用限流器额度，额度不足时放弃对冲
+"""
+import math
+import bisect
+import threading
+from collections import deque
+from . import retry_policy as rp
+
+# ==================== 对冲配置 ====================
+WINDOW_SIZE = 512  # 每个 (模型, 节点) 保留的最近耗时样本数
+MIN_SAMPLES = 20  # 开始对冲前至少需要的样本数
+DEFAULT_MAX_RATIO = 0.05  # 对冲请求占全部请求的最大比例
+
+
+class LatencyTracker:
+    """滑动窗口耗时分布（线程安全）"""
+
+    def __init__(self, window_size=WINDOW_SIZE):
+        """
+        Args:
+            window_size: 保留的最近样本数
+        """
+        self._samples = deque(maxlen=window_size)
+        self._sorted = []
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        记录一次请求耗时
+
+        Args:
+            seconds: 耗时（秒）
+        """
+        with self._lock:
+            if len(self._samples) == self._samples.maxlen:
+                oldest = self._samples[0]
+                del self._sorted[bisect.bisect_left(self._sorted, oldest)]
+            self._samples.append(seconds)
+            bisect.insort(self._sorted, seconds)
+
+    def percentile(self, pct, min_samples=MIN_SAMPLES):
+        """
+        计算百分位耗时（最近秩法）
+
+        Args:
+            pct: 百分位（0-100）
+            min_samples: 最少样本数
+
+        Returns:
+            float or None: 耗时（秒），样本不足时返回 None
+        """
+        with self._lock:
+            count = len(self._sorted)
+            if count < max(1, min_samples):
+                return None
+            rank = min(count, max(1, int(math.ceil(pct / 100 * count))))
+            return self._sorted[rank - 1]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgePolicy:
+    """单个模型配置的对冲策略（同一配置的所有客户端共享）"""
+
+    def __init__(self, model_id, percentile, max_ratio=DEFAULT_MAX_RATIO):
+        """
+        Args:
+            model_id: 模型ID（耗时分布按模型学习）
+            percentile: 触发对冲的耗时百分位（如 95）
+            max_ratio: 对冲请求占全部请求的最大比例
+        """
+        self.model_id = model_id
+        self.percentile = percentile
+        self.max_ratio = max_ratio
+        self.requests = 0
+        self.hedged = 0
+        self.wins = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        从模型配置创建对冲策略
+
+        Args:
+            config: 模型配置字典（hedge_percentile、hedge_max_ratio）
+
+        Returns:
+            HedgePolicy or None: 未开启对冲时返回 None
+        """
+        percentile = rp._config_number(config, "hedge_percentile", 0.0)
+        if not 0 < percentile < 100:
+            return None
+        max_ratio = min(1.0, rp._config_number(config, "hedge_max_ratio", DEFAULT_MAX_RATIO))
+        return cls(str(config.get('model_id', '')), percentile, max_ratio)
+
+    def tracker(self, node):
+        """该模型指定节点的耗时分布"""
+        return get_tracker(self.model_id, node)
+
+    def delay(self, node):
+        """
+        获取对冲等待时间，并计入一次请求
+
+        Args:
+            node: 节点标签
+
+        Returns:
+            float or None: 请求超过该时间仍未返回时对冲（秒），样本不足时返回 None
+        """
+        with self._lock:
+            self.requests += 1
+        return self.tracker(node).percentile(self.percentile)
+
+    def try_hedge(self, acquire=None):
+        """
+        申请一次对冲（对冲比例未超过上限时成功）
+
+        Args:
+            acquire: 比例未超限时再调用的额度申请函数（如限流器 try_acquire），返回 False 时放弃对冲
+
+        Returns:
+            bool: 是否可以对冲
+        """
+        with self._lock:
+            if self.hedged + 1 > self.max_ratio * self.requests:
+                return False
+            if acquire is not None and not acquire():
+                return False
+            self.hedged += 1
+            return True
+
+    def record_result(self, hedge_won):
+        """
+        记录一次对冲的结果
+
+        Args:
+            hedge_won: 是否对冲请求先返回
+        """
+        if hedge_won:
+            with self._lock:
+                self.wins += 1
+
+    def get_stats(self):
+        """
+        获取对冲统计
+
+        Returns:
+            dict: {"model_id", "percentile", "max_ratio", "requests", "hedged", "wins"}
+        """
+        with self._lock:
+            return {
+                "model_id": self.model_id,
+                "percentile": self.percentile,
+                "max_ratio": self.max_ratio,
+                "requests": self.requests,
+                "hedged": self.hedged,
+                "wins": self.wins
+            }
+
+
+# ==================== 进程级注册表 ====================
+_trackers = {}
+_policies = {}
+_registry_lock = threading.Lock()
+
+
+def get_tracker(model_id, node):
+    """
+    获取 (模型, 节点) 的耗时分布，不存在时创建
+
+    Args:
+        model_id: 模型ID
+        node: 节点标签
+
+    Returns:
+        LatencyTracker: 耗时分布
+    """
+    key = (str(model_id), str(node))
+    with _registry_lock:
+        tracker = _trackers.get(key)
+        if tracker is None:
+            tracker = LatencyTracker()
+            _trackers[key] = tracker
+        return tracker
+
+
+def get_hedge_policy(config):
+    """
+    获取模型配置对应的共享对冲策略
+
+    同一 (config_id, model_id) 在进程内共享一个策略（对冲比例按配置整体限制）；
+    配置中的对冲参数变化时重新创建
+
+    Args:
+        config: 模型配置字典
+
+    Returns:
+        HedgePolicy or None: 未开启对冲时返回 None
+    """
+    key = (str(config.get('config_id', '')), str(config.get('model_id', '')))
+    policy = HedgePolicy.from_config(config)
+    with _registry_lock:
+        current = _policies.get(key)
+        if policy is None:
+            _policies.pop(key, None)
+            return None
+        if (current is not None and current.percentile == policy.percentile
+                and current.max_ratio == policy.max_ratio):
+            return current
+        _policies[key] = policy
+        return policy
+
+
+def get_all_stats():
+    """
+    获取所有对冲策略的统计
+
+    Returns:
+        list: 每个策略的统计字典
+    """
+    with _registry_lock:
+        policies = list(_policies.values())
+    return [policy.get_stats() for policy in policies]
@@ -1,11 +1,13 @@
 import os
 import json
+import math
 from datetime import datetime
 
 # 获取项目路径
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
 HISTORY_DIR = os.path.join(PROJECT_ROOT, "data", "test_history")
+COMPARISON_DIR = os.path.join(PROJECT_ROOT, "data", "comparison_reports")
 
 # 确保目录存在
 os.makedirs(HISTORY_DIR, exist_ok=True)
@@ -15,10 +17,152 @@ def generate_test_id():
     """
     生成测试ID（时间戳格式）
     
+    同一秒内保存多份记录（多配置对比测试）时追加序号，如 YYYYMMDD_HHMMSS_2
+    
     Returns:
         str: 格式为 YYYYMMDD_HHMMSS 的测试ID
     """
-    return datetime.now().strftime("%Y%m%d_%H%M%S")
+    base_id = datetime.now().strftime("%Y%m%d_%H%M%S")
+    test_id = base_id
+    suffix = 2
+    while os.path.exists(os.path.join(HISTORY_DIR, f"{test_id}.json")):
+        test_id = f"{base_id}_{suffix}"
+        suffix += 1
+    return test_id
+
+
+def _percentile(values, pct):
+    """
+    计算百分位数（最近秩法）
+
+    Args:
+        values: 数值列表
+        pct: 百分位（0-100）
+
+    Returns:
+        float: 百分位数，列表为空时返回0
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, int(math.ceil(pct / 100 * len(ordered))))
+    return round(ordered[rank - 1], 1)
+
+
+def _distribution(values):
+    """
+    计算耗时分布摘要
+
+    Args:
+        values: 耗时列表（毫秒）
+
+    Returns:
+        dict: {"count", "mean", "p50", "p95", "p99", "max"}
+    """
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 1) if values else 0,
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "max": round(max(values), 1) if values else 0
+    }
+
+
+def compute_performance_stats(results_list):
+    """
+    汇总用例和各节点的耗时、令牌用量
+
+    节点耗时分布只统计实际发起模型调用的节点（排除缓存命中、历史输出复用和与进行中相同请求的合并），
+    令牌用量和重试次数为所有用例之和
+
+    投机模式（节点1-3同时发起）的运行另含 speculation：提前发起的调用数、结果被丢弃的调用数
+    （相对顺序执行多花的调用）、占全部模型调用的比例，以及每个用例节省的耗时分布；
+    发生请求对冲的运行另含 hedging：对冲请求数、对冲请求先返回的次数、占全部模型调用的比例
+
+    Args:
+        results_list: 测试结果列表（需包含 node_metrics，可选 case_latency_ms、case_queue_wait_ms）
+
+    Returns:
+        dict: {
+            "case_latency_ms": {...},
+            "case_queue_wait_ms": {...},
+            "nodes": {"1": {"wall_ms": {...}, "queue_wait_ms": {...}, "retries", "prompt_tokens",
+                            "completion_tokens", "reasoning_tokens", "cache_hits", "memo_hits", "coalesced", "hedged", "reasks"}, ...},
+            "speculation": {"calls", "wasted_calls", "model_calls", "wasted_rate", "saved_ms": {...},
+                            "wasted_prompt_tokens", "wasted_completion_tokens", "wasted_reasoning_tokens"}（仅投机模式）,
+            "hedging": {"hedged", "wins", "model_calls", "hedged_rate"}（仅发生对冲时）
+        }
+    """
+    case_latency = [r['case_latency_ms'] for r in results_list if r.get('case_latency_ms') is not None]
+    case_queue_wait = [r['case_queue_wait_ms'] for r in results_list if r.get('case_queue_wait_ms') is not None]
+
+    node_samples = {}
+    for r in results_list:
+        for node, metrics in (r.get('node_metrics') or {}).items():
+            sample = node_samples.setdefault(node, {
+                "wall_ms": [], "queue_wait_ms": [], "retries": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "reasoning_tokens": 0,
+                "cache_hits": 0, "memo_hits": 0, "coalesced": 0, "hedged": 0, "reasks": 0
+            })
+            if metrics.get('memo_hit'):
+                sample["memo_hits"] += 1
+                continue
+            if metrics.get('cache_hit'):
+                sample["cache_hits"] += 1
+                continue
+            if metrics.get('coalesced'):
+                sample["coalesced"] += 1
+                continue
+            # 没有发出请求的节点（如早期记录中被丢弃的投机调用）不计入耗时分布
+            if not metrics.get('attempts'):
+                continue
+            sample["wall_ms"].append(metrics.get('wall_ms', 0))
+            sample["queue_wait_ms"].append(metrics.get('queue_wait_ms', 0))
+            for key in ("retries", "prompt_tokens", "completion_tokens", "reasoning_tokens", "hedged", "reasks"):
+                sample[key] += metrics.get(key, 0) or 0
+
+    nodes = {}
+    for node in sorted(node_samples, key=int):
+        sample = node_samples[node]
+        nodes[node] = dict(
+            sample,
+            wall_ms=_distribution(sample["wall_ms"]),
+            queue_wait_ms=_distribution(sample["queue_wait_ms"])
+        )
+
+    performance = {
+        "case_latency_ms": _distribution(case_latency),
+        "case_queue_wait_ms": _distribution(case_queue_wait),
+        "nodes": nodes
+    }
+
+    call_stats = [r.get('call_stats') or {} for r in results_list]
+    if any(stats.get('speculative_calls') for stats in call_stats):
+        model_calls = sum(stats.get('calls', 0) for stats in call_stats)
+        wasted = sum(stats.get('speculative_wasted', 0) for stats in call_stats)
+        performance["speculation"] = {
+            "calls": sum(stats.get('speculative_calls', 0) for stats in call_stats),
+            "wasted_calls": wasted,
+            "model_calls": model_calls,
+            "wasted_rate": round(wasted / model_calls, 4) if model_calls else 0,
+            "saved_ms": _distribution([stats.get('speculation_saved_ms', 0) for stats in call_stats]),
+            # 结果未被使用的投机调用消耗的令牌（不计入节点指标）
+            **{
+                f"wasted_{field}": sum(stats.get(f"speculative_wasted_{field}", 0) for stats in call_stats)
+                for field in ("prompt_tokens", "completion_tokens", "reasoning_tokens")
+            }
+        }
+    if any(stats.get('hedged') for stats in call_stats):
+        model_calls = sum(stats.get('calls', 0) for stats in call_stats)
+        hedged = sum(stats.get('hedged', 0) for stats in call_stats)
+        performance["hedging"] = {
+            "hedged": hedged,
+            "wins": sum(stats.get('hedge_wins', 0) for stats in call_stats),
+            "model_calls": model_calls,
+            "hedged_rate": round(hedged / model_calls, 4) if model_calls else 0
+        }
+    return performance
 
 
 def save_test_history(results_list, tag_node_map=None):
@@ -38,6 +182,14 @@ def save_test_history(results_list, tag_node_map=None):
             - is_correct: 是否符合预期
             - prompt_versions: 提示词版本字典 {"p1": "v1.0.0", "p2": "v2.0.0", ...}
             - model_config: 模型配置 {"model_id": "...", "thinking_mode": "..."}
+            - call_stats: 调用统计 {"calls", "attempts", "retries", "latency_ms", "errors", ...}
+            - node_metrics: 各节点指标 {"1": {"wall_ms", "queue_wait_ms", "retries", "prompt_tokens", ...}, ...}
+            - case_latency_ms / case_queue_wait_ms: 用例执行耗时 / 排队等待时间
+            - node_outputs: 各节点解析后的输出 {"1": {...}, "2": {...}, ...}
+            - prompt_hashes: 提示词内容哈希 {"p1": "...", ...}
+            - ref_hash: 参考图集合哈希
+            - image_profile / image_profile_key: 图片预处理方案名称 / 内容哈希
+            - duplicate_of: 与同一任务中另一用例图片相同、复用其评测结果时为该用例ID（可选）
         tag_node_map: 标签到预期节点的映射 {"裁切": 2, "非汽车": 1, ...}
 
     Returns:
@@ -92,6 +244,9 @@ def save_test_history(results_list, tag_node_map=None):
     if results_list and 'model_config' in results_list[0]:
         model_config = results_list[0]['model_config']
 
+    # 图片预处理方案（同一次运行中所有用例相同）
+    image_profile = results_list[0].get('image_profile') if results_list else None
+
     # 简化results（保留必要字段，新增is_precise）
     simplified_results = []
     for r in results_list:
@@ -120,7 +275,18 @@ def save_test_history(results_list, tag_node_map=None):
             "is_precise": is_precise,
             "finish_at_step": r.get('finish_at_step'),
             "expected_filter_node": tag_node_map.get(r.get('problem_tag', ''), 0),
-            "parse_output": r.get('parse_output', {})
+            "parse_output": r.get('parse_output', {}),
+            "call_stats": r.get('call_stats', {}),
+            "node_metrics": r.get('node_metrics', {}),
+            "case_latency_ms": r.get('case_latency_ms'),
+            "case_queue_wait_ms": r.get('case_queue_wait_ms'),
+            "model_config": r.get('model_config', {}),
+            "node_outputs": r.get('node_outputs', {}),
+            "prompt_hashes": r.get('prompt_hashes', {}),
+            "ref_hash": r.get('ref_hash'),
+            "image_profile": r.get('image_profile'),
+            "image_profile_key": r.get('image_profile_key'),
+            "duplicate_of": r.get('duplicate_of')
         })
 
     # 构建历史数据
@@ -137,6 +303,8 @@ def save_test_history(results_list, tag_node_map=None):
         "node_efficiency": node_efficiency,
         "prompt_versions": all_prompt_versions,
         "model_config": model_config,
+        "image_profile": image_profile,
+        "performance": compute_performance_stats(results_list),
         "results": simplified_results
     }
 
@@ -148,6 +316,115 @@ def save_test_history(results_list, tag_node_map=None):
     return test_id
 
 
+def save_comparison_report(runs, test_ids):
+    """
+    保存多配置对比报告
+
+    同一用例集在多个模型配置（或图片预处理方案）上的运行结果汇总为一份报告：
+    每次运行的准确率、节点有效率、耗时和令牌用量，相对第一次运行（基准）的令牌/耗时节省
+    和准确率变化，以及各运行判定不一致的用例
+
+    Args:
+        runs: 每次运行的测试结果列表（与 save_test_history 的输入格式一致）
+        test_ids: 每次运行对应的历史记录ID
+
+    Returns:
+        dict: 对比报告（同时保存到 data/comparison_reports/<compare_id>.json）
+    """
+    os.makedirs(COMPARISON_DIR, exist_ok=True)
+    compare_id = test_ids[0] if test_ids else generate_test_id()
+
+    histories = [load_test_history(test_id) or {} for test_id in test_ids]
+    # 各次运行的图片预处理方案不同时，以 "配置ID/方案" 区分
+    multi_profile = len({h.get('image_profile') for h in histories}) > 1
+
+    configs = []
+    verdicts_by_case = {}
+    case_info = {}
+    for results, test_id, history in zip(runs, test_ids, histories):
+        model_config = history.get('model_config', {})
+        config_id = str(model_config.get('config_id', test_id))
+        image_profile = history.get('image_profile')
+        label = f"{config_id}/{image_profile}" if multi_profile else config_id
+        performance = history.get('performance', {})
+        nodes = performance.get('nodes', {})
+        # 令牌用量含结果未被使用的投机调用
+        speculation = performance.get('speculation') or {}
+        configs.append({
+            "config_id": config_id,
+            "label": label,
+            "model_id": model_config.get('model_id'),
+            "thinking_mode": model_config.get('thinking_mode'),
+            "image_profile": image_profile,
+            "test_id": test_id,
+            "cases_total": history.get('cases_total', 0),
+            "acc_rate": history.get('acc_rate', 0),
+            "node_efficiency": history.get('node_efficiency', 0),
+            "error_total": sum(1 for r in results if r.get('final_pass') == 'error'),
+            "case_latency_ms": performance.get('case_latency_ms', {}),
+            "speculation": performance.get('speculation'),
+            "node_prompt_tokens": {node: n.get('prompt_tokens', 0) for node, n in nodes.items()},
+            **{
+                field: sum(n.get(field, 0) for n in nodes.values()) + speculation.get(f"wasted_{field}", 0)
+                for field in ("prompt_tokens", "completion_tokens", "reasoning_tokens")
+            }
+        })
+        for r in results:
+            case_id = r.get('case_id')
+            case_info.setdefault(case_id, {
+                "case_id": case_id,
+                "car": r.get('car'),
+                "case_type": r.get('case_type'),
+                "problem_tag": r.get('problem_tag'),
+                "case_url": r.get('case_url')
+            })
+            verdicts_by_case.setdefault(case_id, {})[label] = {
+                "final_pass": r.get('final_pass'),
+                "finish_at_step": r.get('finish_at_step'),
+                "is_correct": r.get('is_correct'),
+                "reason": r.get('reason', '')
+            }
+
+    # 相对基准（第一次运行）的变化：令牌节省比例、p50 耗时变化、准确率变化
+    if configs:
+        baseline = configs[0]
+        for config in configs:
+            base_tokens = baseline["prompt_tokens"]
+            base_p50 = baseline["case_latency_ms"].get("p50")
+            p50 = config["case_latency_ms"].get("p50")
+            config["vs_baseline"] = {
+                "prompt_tokens_saved": round(1 - config["prompt_tokens"] / base_tokens, 4) if base_tokens else None,
+                "latency_p50_delta_ms": round(p50 - base_p50, 1) if p50 is not None and base_p50 is not None else None,
+                "acc_rate_delta": round(config["acc_rate"] - baseline["acc_rate"], 4)
+            }
+
+    # 所有配置都有结果且最终判定一致的用例视为一致
+    disagreements = []
+    agreed = 0
+    for case_id, verdicts in verdicts_by_case.items():
+        final_passes = {v['final_pass'] for v in verdicts.values()}
+        if len(verdicts) == len(configs) and len(final_passes) == 1:
+            agreed += 1
+        else:
+            disagreements.append(dict(case_info[case_id], verdicts=verdicts))
+
+    cases_total = len(verdicts_by_case)
+    report = {
+        "compare_id": compare_id,
+        "test_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "configs": configs,
+        "cases_total": cases_total,
+        "agreement_rate": round(agreed / cases_total, 4) if cases_total > 0 else 0,
+        "disagreements": disagreements
+    }
+
+    file_path = os.path.join(COMPARISON_DIR, f"{compare_id}.json")
+    with open(file_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    return report
+
+
 def load_test_history(test_id):
     """
     加载指定测试历史
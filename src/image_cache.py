@@ -0,0 +1,374 @@
+"""
+图片缓存模块
+
+任务开始前把所有用例图和参考图并行下载一次，按内容哈希（SHA-256）存放在本地磁盘，
+模型调用时以 base64 data URL 发送缓存的图片，避免模型服务在每次调用时重新下载
+（部分图床响应很慢，节点4一次调用就包含最多5张参考图）
+
+- 文件按内容寻址：data/cache/images/<前2位>/<sha256>，相同内容只存一份
+- URL 到内容哈希的映射保存在 SQLite 索引中，下载失败的 URL 也会记录，
+  在 FAILURE_TTL 内不再重复尝试，任务可在调用模型前识别失效图片
+- 预处理后的图片（缩放/重新编码，见 image_preprocess）按 (URL, 处理参数) 记录为变体，
+  同样按内容寻址存放
+"""
+import os
+import time
+import base64
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+
+# 获取项目路径
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+IMAGE_CACHE_DIR = os.path.join(PROJECT_ROOT, "data", "cache", "images")
+INDEX_FILE = os.path.join(IMAGE_CACHE_DIR, "index.sqlite")
+
+# ==================== 下载配置 ====================
+PREFETCH_WORKERS = 16  # 并行下载线程数
+DOWNLOAD_TIMEOUT = 20  # 单次下载超时（秒）
+DOWNLOAD_RETRIES = 2  # 下载失败（超时/连接错误/5xx）的重试次数
+MAX_IMAGE_BYTES = 20 * 1024 * 1024  # 单张图片最大大小
+FAILURE_TTL = 600  # 下载失败记录的有效期（秒），期内不再重复下载
+
+# 常见图片格式的文件头
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+class ImageUnavailableError(Exception):
+    """图片无法下载或不是有效图片"""
+
+    def __init__(self, url, reason):
+        """
+        Args:
+            url: 图片URL
+            reason: 失败原因
+        """
+        super().__init__(f"{reason}: {url}")
+        self.url = url
+        self.reason = reason
+
+
+def _sniff_mime(content, header_mime):
+    """
+    判断图片格式
+
+    Args:
+        content: 图片内容
+        header_mime: 响应头中的 Content-Type
+
+    Returns:
+        str or None: MIME 类型，不是图片时返回 None
+    """
+    for signature, mime in _IMAGE_SIGNATURES:
+        if content.startswith(signature):
+            return mime
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    header_mime = (header_mime or "").split(";")[0].strip().lower()
+    return header_mime if header_mime.startswith("image/") else None
+
+
+class ImageCache:
+    """内容寻址的本地图片缓存（线程安全）"""
+
+    def __init__(self, root=IMAGE_CACHE_DIR, index_file=INDEX_FILE):
+        """
+        初始化图片缓存
+
+        Args:
+            root: 图片存放目录
+            index_file: URL 索引文件路径
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.downloads = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+        # 同一 URL 同时只下载一次
+        self._url_locks = {}
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=PREFETCH_WORKERS, pool_maxsize=PREFETCH_WORKERS)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._conn = sqlite3.connect(index_file, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS images (
+                url TEXT PRIMARY KEY,
+                digest TEXT,
+                mime TEXT,
+                size INTEGER,
+                error TEXT,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS variants (
+                url TEXT NOT NULL,
+                settings_key TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                mime TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (url, settings_key)
+            )
+        """)
+        self._conn.commit()
+
+    def _path(self, digest):
+        """内容哈希对应的文件路径"""
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _lookup(self, url):
+        """查询索引，返回 (digest, mime, error, fetched_at) 或 None"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT digest, mime, error, fetched_at FROM images WHERE url = ?", (url,)
+            ).fetchone()
+
+    def _record(self, url, digest=None, mime=None, size=None, error=None):
+        """写入索引"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO images (url, digest, mime, size, error, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, digest, mime, size, error, time.time())
+            )
+            self._conn.commit()
+
+    def _store(self, content):
+        """
+        按内容哈希保存文件
+
+        Returns:
+            str: 内容哈希
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再替换，避免并发读取到不完整的文件
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        return digest
+
+    def _download(self, url):
+        """
+        下载图片（内部方法）
+
+        Returns:
+            tuple: (content, mime)
+
+        Raises:
+            ImageUnavailableError: 下载失败或内容不是图片
+        """
+        reason = "下载失败"
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                response = self._session.get(url, timeout=DOWNLOAD_TIMEOUT)
+            except requests.RequestException as e:
+                reason = f"下载失败（{type(e).__name__}）"
+                continue
+            if response.status_code >= 500:
+                reason = f"下载失败（HTTP {response.status_code}）"
+                continue
+            if response.status_code != 200:
+                raise ImageUnavailableError(url, f"下载失败（HTTP {response.status_code}）")
+            content = response.content
+            if not content:
+                raise ImageUnavailableError(url, "图片内容为空")
+            if len(content) > MAX_IMAGE_BYTES:
+                raise ImageUnavailableError(url, f"图片过大（{len(content)} 字节）")
+            mime = _sniff_mime(content, response.headers.get("Content-Type"))
+            if mime is None:
+                raise ImageUnavailableError(url, "内容不是有效图片")
+            return content, mime
+        raise ImageUnavailableError(url, reason)
+
+    def fetch(self, url):
+        """
+        获取图片（未缓存时下载）
+
+        Args:
+            url: 图片URL
+
+        Returns:
+            tuple: (digest, mime)
+
+        Raises:
+            ImageUnavailableError: 图片无法下载（包括 FAILURE_TTL 内已失败过的 URL）
+        """
+        with self._lock:
+            url_lock = self._url_locks.setdefault(url, threading.Lock())
+
+        with url_lock:
+            row = self._lookup(url)
+            if row is not None:
+                digest, mime, error, fetched_at = row
+                if digest and os.path.exists(self._path(digest)):
+                    return digest, mime
+                if error and time.time() - fetched_at < FAILURE_TTL:
+                    raise ImageUnavailableError(url, error)
+
+            try:
+                content, mime = self._download(url)
+            except ImageUnavailableError as e:
+                self.failures += 1
+                self._record(url, error=e.reason)
+                raise
+
+            digest = self._store(content)
+            self._record(url, digest=digest, mime=mime, size=len(content))
+            self.downloads += 1
+            return digest, mime
+
+    def prefetch(self, urls, max_workers=PREFETCH_WORKERS):
+        """
+        并行下载一批图片
+
+        Args:
+            urls: 图片URL列表（自动去重，忽略空值）
+            max_workers: 并行下载线程数
+
+        Returns:
+            dict: {url: 失败原因}，只包含下载失败的URL
+        """
+        unique_urls = list(dict.fromkeys(u for u in urls if u))
+        failures = {}
+
+        def _fetch(url):
+            try:
+                self.fetch(url)
+            except ImageUnavailableError as e:
+                failures[url] = e.reason
+
+        if unique_urls:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-prefetch") as pool:
+                list(pool.map(_fetch, unique_urls))
+        return failures
+
+    def source_path(self, url):
+        """
+        获取已缓存原图的本地路径
+
+        Args:
+            url: 图片URL
+
+        Returns:
+            str or None: 文件路径，未缓存时返回 None
+        """
+        row = self._lookup(url)
+        if row is None or not row[0]:
+            return None
+        path = self._path(row[0])
+        return path if os.path.exists(path) else None
+
+    def has_variant(self, url, settings_key):
+        """是否已有指定处理参数的变体"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM variants WHERE url = ? AND settings_key = ?", (url, settings_key)
+            ).fetchone()
+        return row is not None and os.path.exists(self._path(row[0]))
+
+    def put_variant(self, url, settings_key, content, mime):
+        """
+        保存预处理后的图片变体
+
+        Args:
+            url: 原图URL
+            settings_key: 处理参数标识
+            content: 处理后的图片内容
+            mime: 处理后的 MIME 类型
+        """
+        digest = self._store(content)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO variants (url, settings_key, digest, mime, size) VALUES (?, ?, ?, ?, ?)",
+                (url, settings_key, digest, mime, len(content))
+            )
+            self._conn.commit()
+
+    def data_url(self, url, settings_key=None):
+        """
+        获取已缓存图片的 base64 data URL
+
+        Args:
+            url: 图片URL
+            settings_key: 处理参数标识，指定时优先使用对应的预处理变体，变体不存在时使用原图
+
+        Returns:
+            str or None: data URL，未缓存时返回 None
+        """
+        row = None
+        if settings_key:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT digest, mime FROM variants WHERE url = ? AND settings_key = ?",
+                    (url, settings_key)
+                ).fetchone()
+        if row is None:
+            row = self._lookup(url)
+        if row is None or not row[0]:
+            return None
+        digest, mime = row[0], row[1]
+        try:
+            with open(self._path(digest), "rb") as f:
+                content = f.read()
+        except OSError:
+            return None
+        return f"data:{mime};base64,{base64.b64encode(content).decode('ascii')}"
+
+    def get_stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 索引中的图片数、失败URL数、总大小，以及本进程的下载/失败次数
+        """
+        with self._lock:
+            images, total_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM images WHERE digest IS NOT NULL"
+            ).fetchone()
+            failed = self._conn.execute(
+                "SELECT COUNT(*) FROM images WHERE digest IS NULL"
+            ).fetchone()[0]
+        return {
+            "images": images,
+            "failed_urls": failed,
+            "size_bytes": total_size,
+            "downloads": self.downloads,
+            "failures": self.failures
+        }
+
+
+# ==================== 全局缓存实例 ====================
+_global_cache = None
+_global_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """
+    获取全局图片缓存实例
+
+    Returns:
+        ImageCache: 缓存实例
+    """
+    global _global_cache
+
+    with _global_cache_lock:
+        if _global_cache is None:
+            _global_cache = ImageCache()
+
+    return _global_cache
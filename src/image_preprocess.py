@@ -0,0 +1,356 @@
+"""
+图片预处理模块
+
+发送给模型前按节点缩放、重新编码图片并调整 detail 级别，以减少视觉令牌：
+节点4一次调用包含最多5张参考图和1张 detail=high 的生成图，是最贵的调用
+
+预处理参数按"方案"（ImageProfile）组织，每个方案按 (节点, 图片角色) 指定 ImageSettings：
+- node: 节点序号，0 表示所有节点
+- role: gen（生成图）/ ref（参考图）/ all
+- max_side: 长边最大像素，0 表示不缩放
+- format: original / jpeg / webp
+- quality: JPEG/WebP 质量（1-100）
+- detail: 发送时的 detail 参数（low/high/auto），为空表示保持原样
+
+内置方案见 BUILTIN_PROFILES，可在 data/image_profiles.csv 中新增或覆盖
+（列：profile, node, role, max_side, format, quality, detail）
+
+图片需先由 image_cache 预取到本地；处理在进程池（spawn 启动）中执行，结果按 (URL, 处理参数) 缓存。
+缩放和重新编码依赖 Pillow（可选依赖），未安装时需要处理图片内容的方案不可用（check_supported），
+只调整 detail 参数的方案不受影响。单张图片处理失败时按原图发送，
+缓存键和节点输出复用键按实际发送的图片计算（见 effective_key），不会记为该方案的结果
+"""
+import io
+import os
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from . import image_cache as ic
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# 获取项目路径
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+PROFILES_FILE = os.path.join(PROJECT_ROOT, "data", "image_profiles.csv")
+
+# ==================== 预处理配置 ====================
+DEFAULT_PROFILE = "original"  # 默认方案：不做任何处理
+PREPROCESS_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))  # 进程池大小
+IMAGE_FORMATS = ("original", "jpeg", "webp")
+IMAGE_ROLES = ("gen", "ref", "all")
+
+
+class ImageSettings:
+    """单类图片的预处理参数"""
+
+    def __init__(self, max_side=0, format="original", quality=85, detail=None):
+        """
+        Args:
+            max_side: 长边最大像素，0 表示不缩放
+            format: 输出格式（original/jpeg/webp）
+            quality: JPEG/WebP 质量
+            detail: detail 参数，None 表示保持原样
+        """
+        self.max_side = int(max_side or 0)
+        self.format = format if format in IMAGE_FORMATS else "original"
+        self.quality = int(quality or 85)
+        self.detail = detail or None
+
+    @property
+    def transforms_image(self):
+        """是否需要处理图片内容（缩放或重新编码）"""
+        return self.max_side > 0 or self.format != "original"
+
+    @property
+    def key(self):
+        """
+        处理参数标识（只包含影响图片内容的参数），不处理图片时为 None
+        """
+        if not self.transforms_image:
+            return None
+        return f"{self.max_side}-{self.format}-{self.quality}"
+
+    def to_dict(self):
+        return {
+            "max_side": self.max_side,
+            "format": self.format,
+            "quality": self.quality,
+            "detail": self.detail
+        }
+
+
+IDENTITY_SETTINGS = ImageSettings()
+
+
+class ImageProfile:
+    """预处理方案：按 (节点, 图片角色) 指定预处理参数"""
+
+    def __init__(self, name, rules=None):
+        """
+        Args:
+            name: 方案名称
+            rules: {(node, role): ImageSettings}
+        """
+        self.name = name
+        self.rules = dict(rules or {})
+
+    def get(self, node, role):
+        """
+        查找参数，优先级：(节点, 角色) > (节点, all) > (0, 角色) > (0, all)
+
+        Args:
+            node: 节点序号（None 表示未知节点）
+            role: gen / ref
+
+        Returns:
+            ImageSettings: 预处理参数
+        """
+        candidates = []
+        if node is not None:
+            candidates += [(int(node), role), (int(node), "all")]
+        candidates += [(0, role), (0, "all")]
+        for key in candidates:
+            if key in self.rules:
+                return self.rules[key]
+        return IDENTITY_SETTINGS
+
+    @property
+    def transforms_image(self):
+        """是否有需要处理图片内容（缩放或重新编码）的规则"""
+        return any(s.transforms_image for s in self.rules.values())
+
+    @property
+    def is_identity(self):
+        """是否完全不处理（图片内容和 detail 都保持原样）"""
+        return all(not s.transforms_image and s.detail is None for s in self.rules.values())
+
+    @property
+    def key(self):
+        """
+        方案内容哈希，用于区分不同方案产生的结果（如节点输出复用），不处理时为 None
+        """
+        if self.is_identity:
+            return None
+        text = ";".join(
+            f"{node}:{role}:{s.key}:{s.detail}"
+            for (node, role), s in sorted(self.rules.items())
+        )
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+    def to_dict(self):
+        return {
+            f"{node}:{role}": s.to_dict()
+            for (node, role), s in sorted(self.rules.items())
+        }
+
+
+# 内置方案
+# - original: 原图发送
+# - balanced: 节点4参考图缩小并降低 detail，生成图保持 detail=high 但限制分辨率
+# - economy: 所有图片缩小重新编码，参考图使用 detail=low
+BUILTIN_PROFILES = {
+    "original": ImageProfile("original"),
+    "balanced": ImageProfile("balanced", {
+        (4, "ref"): ImageSettings(max_side=768, format="jpeg", quality=80, detail="low"),
+        (0, "gen"): ImageSettings(max_side=1536, format="jpeg", quality=90),
+    }),
+    "economy": ImageProfile("economy", {
+        (0, "ref"): ImageSettings(max_side=512, format="jpeg", quality=75, detail="low"),
+        (0, "gen"): ImageSettings(max_side=1024, format="jpeg", quality=85),
+    }),
+}
+
+
+def get_profiles():
+    """
+    获取所有预处理方案（内置方案 + data/image_profiles.csv）
+
+    Returns:
+        dict: {方案名称: ImageProfile}
+    """
+    profiles = dict(BUILTIN_PROFILES)
+    if not os.path.exists(PROFILES_FILE):
+        return profiles
+
+    df = pd.read_csv(PROFILES_FILE)
+    custom = {}
+    for _, row in df.iterrows():
+        name = str(row["profile"]).strip()
+        role = str(row.get("role", "all")).strip() if pd.notna(row.get("role")) else "all"
+        if role not in IMAGE_ROLES:
+            continue
+        detail = row.get("detail")
+        custom.setdefault(name, {})[(int(row.get("node", 0) or 0), role)] = ImageSettings(
+            max_side=row.get("max_side", 0) if pd.notna(row.get("max_side")) else 0,
+            format=str(row.get("format", "original")).strip().lower() if pd.notna(row.get("format")) else "original",
+            quality=row.get("quality", 85) if pd.notna(row.get("quality")) else 85,
+            detail=str(detail).strip() if pd.notna(detail) and str(detail).strip() else None
+        )
+    for name, rules in custom.items():
+        profiles[name] = ImageProfile(name, rules)
+    return profiles
+
+
+def get_profile(name):
+    """
+    获取指定预处理方案
+
+    Args:
+        name: 方案名称，为空时返回默认方案
+
+    Returns:
+        ImageProfile: 预处理方案
+
+    Raises:
+        ValueError: 方案不存在
+    """
+    profiles = get_profiles()
+    name = name or DEFAULT_PROFILE
+    if name not in profiles:
+        raise ValueError(f"Image profile not found: {name}")
+    return profiles[name]
+
+
+def check_supported(profile):
+    """
+    检查方案在当前环境下是否可用（处理图片内容需要 Pillow）
+
+    Args:
+        profile: ImageProfile
+
+    Raises:
+        ValueError: 方案需要缩放/重新编码图片但未安装 Pillow
+    """
+    if profile.transforms_image and Image is None:
+        raise ValueError(f"图片预处理方案 {profile.name} 需要缩放/重新编码图片，但未安装 Pillow")
+
+
+def effective_key(profile, images, cache=None):
+    """
+    用例实际发送的图片对应的方案哈希（节点输出复用键）
+
+    预处理变体不存在的图片（处理失败或未预取）按原图发送，这些图片计入哈希，
+    与完整处理的结果区分；所有图片都已处理时等于 profile.key
+
+    Args:
+        profile: ImageProfile，None 表示原图
+        images: 用例发送的图片 [(url, node, role)]
+        cache: ImageCache，None 表示不发送本地图片（所有变体视为不存在）
+
+    Returns:
+        str or None: 方案哈希，原图时为 None
+    """
+    if profile is None or profile.key is None:
+        return None
+    missing = set()
+    for url, node, role in images:
+        settings = profile.get(node, role)
+        if not settings.transforms_image:
+            continue
+        if cache is None or not cache.has_variant(url, settings.key):
+            missing.add(f"{url}#{settings.key}")
+    if not missing:
+        return profile.key
+    text = "\n".join([profile.key] + sorted(missing))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+# ==================== 图片处理 ====================
+
+def _transform(path, max_side, fmt, quality):
+    """
+    缩放并重新编码一张图片（在子进程中执行）
+
+    Args:
+        path: 原图路径
+        max_side: 长边最大像素
+        fmt: 输出格式（original/jpeg/webp）
+        quality: 编码质量
+
+    Returns:
+        tuple: (content, mime)
+    """
+    with Image.open(path) as img:
+        img.load()
+        source_format = (img.format or "JPEG").upper()
+        if max_side and max(img.size) > max_side:
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        if fmt == "original":
+            fmt = "png" if source_format == "PNG" else "jpeg"
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+
+        buffer = io.BytesIO()
+        if fmt == "webp":
+            img.save(buffer, format="WEBP", quality=quality)
+            mime = "image/webp"
+        elif fmt == "png":
+            img.save(buffer, format="PNG", optimize=True)
+            mime = "image/png"
+        else:
+            img.save(buffer, format="JPEG", quality=quality, optimize=True)
+            mime = "image/jpeg"
+        return buffer.getvalue(), mime
+
+
+def preprocess_images(images, profile, max_workers=PREPROCESS_WORKERS):
+    """
+    按方案预处理一批已预取的图片
+
+    Args:
+        images: [(url, node, role)] 列表
+        profile: ImageProfile
+        max_workers: 进程池大小
+
+    Returns:
+        dict: {"processed": 新处理数, "cached": 已有缓存数, "failed": {url: 原因}}
+        处理失败的图片按原图发送
+
+    Raises:
+        ValueError: 方案需要处理图片但未安装 Pillow
+    """
+    check_supported(profile)
+    cache = ic.get_image_cache()
+    pending = {}
+    seen = set()
+    cached = 0
+    for url, node, role in images:
+        settings = profile.get(node, role)
+        if not settings.transforms_image:
+            continue
+        if (url, settings.key) in seen:
+            continue
+        seen.add((url, settings.key))
+        if cache.has_variant(url, settings.key):
+            cached += 1
+            continue
+        path = cache.source_path(url)
+        if path is not None:
+            pending[(url, settings.key)] = (path, settings)
+
+    stats = {"processed": 0, "cached": cached, "failed": {}}
+    if not pending:
+        return stats
+
+    keys = list(pending)
+    # 调用方是持有 SQLite 连接、HTTP 连接池和多个线程的后台线程，fork 出的子进程可能卡在继承的锁上
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = [
+            pool.submit(_transform, path, s.max_side, s.format, s.quality)
+            for path, s in (pending[k] for k in keys)
+        ]
+        for (url, settings_key), future in zip(keys, futures):
+            try:
+                content, mime = future.result()
+            except Exception as e:
+                stats["failed"][url] = f"{type(e).__name__}: {e}"
+                continue
+            cache.put_variant(url, settings_key, content, mime)
+            stats["processed"] += 1
+    return stats
@@ -0,0 +1,371 @@
+"""
+运行指标模块
+
+进程内的轻量指标注册表，输出 Prometheus 文本格式（由后端 /metrics 暴露），
+用于观察吞吐和饱和度，不需要依赖 prometheus_client：
+- Counter: 只增计数器
+- Gauge: 可增减的瞬时值
+- Histogram: 固定分桶的分布（耗时）
+
+每个指标按标签值元组分别计数，记录操作只是在锁内更新字典，开销可以忽略
+
+本模块同时声明工作流使用的全部指标（vlm_*），模型客户端、工作流和任务执行器直接引用
+"""
+import time
+import threading
+from collections import deque
+
+# 耗时分桶（秒）
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0, 120.0)
+CASE_LATENCY_BUCKETS = (1.0, 2.0, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0)
+RATE_WINDOW_SECONDS = 60  # 用例吞吐和错误率的滑动窗口
+
+
+def _escape(value):
+    """转义标签值"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    """格式化标签，如 {node="1",model="m"}"""
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    """格式化数值（整数不带小数点）"""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """指标基类"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name, help_text, labels=()):
+        """
+        Args:
+            name: 指标名
+            help_text: 说明
+            labels: 标签名列表
+        """
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        """按声明顺序取标签值"""
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self):
+        """
+        输出 Prometheus 文本格式
+
+        Returns:
+            list: 文本行
+        """
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    """只增计数器"""
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        """
+        增加计数
+
+        Args:
+            amount: 增量
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        """读取当前值"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """瞬时值"""
+
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        """设置值"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        """增加"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        """减少"""
+        self.inc(-amount, **labels)
+
+    def get(self, **labels):
+        """读取当前值"""
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """固定分桶直方图"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        """
+        Args:
+            name: 指标名
+            help_text: 说明
+            labels: 标签名列表
+            buckets: 分桶上界（升序，+Inf 自动追加）
+        """
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """
+        记录一个观测值
+
+        Args:
+            value: 观测值（秒）
+            **labels: 标签值
+        """
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各分桶计数..., 总和, 总数]
+                state = [0] * len(self.buckets) + [0.0, 0]
+                self._values[key] = state
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, [("le", _format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {state[-1]}")
+            plain = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{plain} {_format_value(round(state[-2], 6))}")
+            lines.append(f"{self.name}_count{plain} {state[-1]}")
+        return lines
+
+
+class RateWindow:
+    """滑动窗口计数，用于计算最近一段时间的吞吐和错误率"""
+
+    def __init__(self, window_seconds=RATE_WINDOW_SECONDS):
+        """
+        Args:
+            window_seconds: 窗口长度（秒）
+        """
+        self.window_seconds = window_seconds
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        """移除窗口外的事件（调用方需持有锁）"""
+        while self._events and self._events[0][0] < now - self.window_seconds:
+            self._events.popleft()
+
+    def record(self, is_error=False):
+        """记录一个事件"""
+        now = time.monotonic()
+        with self._lock:
+            self._events.append((now, is_error))
+            self._trim(now)
+
+    def snapshot(self):
+        """
+        计算窗口内的速率和错误率
+
+        Returns:
+            tuple: (每秒事件数, 错误率)
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            total = len(self._events)
+            errors = sum(1 for _, is_error in self._events if is_error)
+        rate = total / self.window_seconds
+        return rate, (errors / total if total else 0.0)
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """
+        注册指标（同名指标只注册一次）
+
+        Returns:
+            已注册的指标
+        """
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collector):
+        """
+        注册采集回调，在每次输出前调用（用于按需刷新 Gauge）
+
+        Args:
+            collector: 无参函数
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """
+        输出所有指标的 Prometheus 文本格式
+
+        Returns:
+            str: 文本
+        """
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics.values())
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# ==================== 全局注册表与工作流指标 ====================
+REGISTRY = Registry()
+
+VLM_REQUESTS = REGISTRY.counter(
+    "vlm_requests_total", "模型请求次数（每次尝试计一次），status 为 ok 或错误类型", ("node", "model", "status")
+)
+VLM_REQUEST_SECONDS = REGISTRY.histogram(
+    "vlm_request_duration_seconds", "模型请求耗时（秒）", ("node", "model")
+)
+VLM_RETRIES = REGISTRY.counter("vlm_retries_total", "模型请求重试次数", ("node", "model"))
+VLM_CACHE_HITS = REGISTRY.counter("vlm_cache_hits_total", "响应缓存命中次数", ("node", "model"))
+VLM_STREAM_EARLY_STOPS = REGISTRY.counter(
+    "vlm_stream_early_stops_total", "流式调用在判定JSON完整后提前结束的次数", ("node", "model")
+)
+VLM_COALESCED = REGISTRY.counter(
+    "vlm_coalesced_requests_total", "与进行中的相同请求合并、未实际发出的请求次数", ("node", "model")
+)
+VLM_REASKS = REGISTRY.counter(
+    "vlm_reasks_total", "输出不符合节点结构时的针对性重问次数", ("node", "model")
+)
+VLM_HEDGED_REQUESTS = REGISTRY.counter(
+    "vlm_hedged_requests_total", "对冲请求次数（result=won 表示对冲请求先返回）", ("node", "model", "result")
+)
+VLM_CIRCUIT_STATE = REGISTRY.gauge(
+    "vlm_circuit_state", "熔断器状态（0=closed, 1=half_open, 2=open）", ("endpoint",)
+)
+VLM_CIRCUIT_TRIPS = REGISTRY.counter("vlm_circuit_trips_total", "熔断器打开次数", ("endpoint",))
+VLM_POOL_REQUESTS = REGISTRY.counter("vlm_pool_requests_total", "客户端池分配到各配置的请求次数", ("pool", "config"))
+VLM_ADAPTIVE_LIMIT = REGISTRY.gauge(
+    "vlm_adaptive_concurrency_limit", "自适应并发限制器当前的并发上限", ("config", "model")
+)
+VLM_ADAPTIVE_DECREASES = REGISTRY.counter(
+    "vlm_adaptive_concurrency_decreases_total", "自适应并发上限减小次数（reason 为 rate_limited 或 latency）",
+    ("config", "model", "reason")
+)
+VLM_MEMO_HITS = REGISTRY.counter("vlm_memo_hits_total", "历史节点输出复用次数", ("node",))
+VLM_RATE_LIMIT_WAIT_SECONDS = REGISTRY.counter(
+    "vlm_rate_limit_wait_seconds_total", "限流等待总时长（秒）", ("model",)
+)
+VLM_TOKENS = REGISTRY.counter("vlm_tokens_total", "令牌用量", ("node", "model", "type"))
+
+CASES = REGISTRY.counter("vlm_cases_total", "已完成用例数，按最终结果分类", ("final_pass",))
+CASE_SECONDS = REGISTRY.histogram(
+    "vlm_case_duration_seconds", "单个用例执行耗时（秒）", buckets=CASE_LATENCY_BUCKETS
+)
+CASES_QUEUED = REGISTRY.gauge("vlm_cases_queued", "已提交但尚未开始执行的用例数")
+CASES_RUNNING = REGISTRY.gauge("vlm_cases_running", "正在执行的用例数")
+CASES_PER_SECOND = REGISTRY.gauge(
+    "vlm_cases_per_second", f"最近{RATE_WINDOW_SECONDS}秒的用例吞吐（个/秒）"
+)
+CASE_ERROR_RATIO = REGISTRY.gauge(
+    "vlm_case_error_ratio", f"最近{RATE_WINDOW_SECONDS}秒内 final_pass=error 的用例占比"
+)
+
+_case_window = RateWindow()
+
+
+def record_case(final_pass, duration_seconds):
+    """
+    记录一个完成的用例
+
+    Args:
+        final_pass: 最终结果
+        duration_seconds: 执行耗时（秒）
+    """
+    CASES.inc(final_pass=final_pass)
+    CASE_SECONDS.observe(duration_seconds)
+    _case_window.record(is_error=(final_pass == "error"))
+
+
+def _collect_case_rates():
+    """刷新吞吐和错误率"""
+    rate, error_ratio = _case_window.snapshot()
+    CASES_PER_SECOND.set(round(rate, 4))
+    CASE_ERROR_RATIO.set(round(error_ratio, 4))
+
+
+REGISTRY.add_collector(_collect_case_rates)
+
+
+def render():
+    """
+    输出全局注册表的 Prometheus 文本
+
+    Returns:
+        str: 文本
+    """
+    return REGISTRY.render()
@@ -7,10 +7,192 @@
 - call_single: 单图判断（节点1-3），只传生成图
 - call_multi_ref: 多参考图比对（节点4），参考图在前，生成图在后
 - call_compare: 双图比对（节点5），参考图+描述+生成图
+
+每个调用方法都有对应的异步版本（call_single_async 等），
+异步版本基于 AsyncArk，同一事件循环内共享一个长连接池
+
+所有请求发送前都会经过按配置共享的限流器（RPM/TPM，见 rate_limiter）；
+调用失败时按错误类型重试（见 retry_policy），最终失败抛出 ModelCallError；
+可解析为JSON的响应会写入持久化响应缓存（见 response_cache），相同请求直接命中缓存；
+请求次数、耗时、重试、缓存命中和令牌用量按节点和模型记录到运行指标（见 metrics）；
+任务开启图片预取时，图片以本地缓存的 base64 data URL 发送（见 image_cache），
+并可按节点缩放/重新编码、调整 detail（见 image_preprocess）；
+配置开启对冲时，请求超过该节点历史耗时的指定百分位仍未返回则再发出一个相同请求（见 hedging）；
+服务端点持续超时/5xx 时熔断，请求直接抛出 CircuitOpenError 而不再等待超时（见 circuit_breaker）；
+配置标记了 pool 时 get_client 返回客户端池，请求分散到池中所有配置（见 client_pool）；
+开启自适应并发时，同时进行中的请求数由 AIMD 限制器按耗时和 429 自动调整（见 adaptive_limiter）；
+多个用例/任务同时发出完全相同的请求时只调用一次模型，共享结果（见 single_flight）；
+模型输出按节点声明的结构容错解析和校验，配置 json_mode 时使用服务端的结构化输出模式，
+不符合结构时通过 reask 在原对话后针对性重问（见 structured_output）
 """
-import json
-from volcenginesdkarkruntime import Ark
+import time
+import asyncio
+import threading
+import weakref
+import httpx
+from concurrent import futures
+from volcenginesdkarkruntime import Ark, AsyncArk
 from . import config_manager as cm
+from . import rate_limiter as rl
+from . import retry_policy as rp
+from . import response_cache as rc
+from . import metrics
+from . import image_cache as ic
+from . import image_preprocess as ip
+from . import ref_registry as rr
+from . import single_flight as sf
+from . import structured_output as so
+from . import stream_parser as sp
+from . import hedging
+from . import circuit_breaker as cb
+from . import adaptive_limiter as al
+
+# ==================== 异步连接池配置 ====================
+ASYNC_POOL_MAX_CONNECTIONS = 512  # 连接池最大连接数
+ASYNC_POOL_MAX_KEEPALIVE = 128  # 最大保持活跃的空闲连接数
+ASYNC_POOL_KEEPALIVE_EXPIRY = 30.0  # 空闲连接保持时间（秒）
+HEDGE_WORKERS = 128  # 同步模式下对冲请求共用的线程数
+
+# 每个事件循环一个共享的 httpx.AsyncClient（异步连接不能跨事件循环复用）
+_async_http_clients = weakref.WeakKeyDictionary()
+_async_http_lock = threading.Lock()
+
+# 同步模式下对冲时主请求和对冲请求在共用线程池中执行（首次对冲时创建）
+_hedge_executor = None
+_hedge_lock = threading.Lock()
+
+
+def _get_async_http_client():
+    """
+    获取当前事件循环共享的异步 HTTP 连接池
+
+    Returns:
+        httpx.AsyncClient: 共享的异步 HTTP 客户端
+    """
+    loop = asyncio.get_running_loop()
+    with _async_http_lock:
+        http_client = _async_http_clients.get(loop)
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=ASYNC_POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=ASYNC_POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=ASYNC_POOL_KEEPALIVE_EXPIRY
+                )
+            )
+            _async_http_clients[loop] = http_client
+        return http_client
+
+
+def _get_usage(response):
+    """
+    从响应的 usage 中读取令牌用量
+
+    Args:
+        response: 模型API响应对象
+
+    Returns:
+        dict: {"prompt_tokens", "completion_tokens", "reasoning_tokens", "total_tokens"}，
+              响应不含 usage 时返回空字典；reasoning_tokens 仅在思考模式下存在，缺失时为0
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return {}
+    details = getattr(usage, "completion_tokens_details", None)
+    reasoning_tokens = getattr(details, "reasoning_tokens", None) if details is not None else None
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", None) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+        "reasoning_tokens": reasoning_tokens or 0,
+        "total_tokens": getattr(usage, "total_tokens", None)
+    }
+
+
+def _config_flag(config, key):
+    """读取配置中的开关字段（1/true/yes 为开启），空值或非法值为关闭"""
+    value = config.get(key)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes")
+    try:
+        return float(value) == 1
+    except (TypeError, ValueError):
+        return False
+
+
+class _StreamReader:
+    """累积流式输出，查找包含判定字段的 JSON 对象"""
+
+    def __init__(self, verdict_keys):
+        """
+        Args:
+            verdict_keys: 判定字段
+        """
+        self.verdict_keys = verdict_keys
+        self.scanner = sp.JsonObjectScanner()
+        self.verdict = None
+        self.usage = {}
+
+    def feed(self, chunk):
+        """
+        处理一个流式分片
+
+        Args:
+            chunk: 流式响应分片
+
+        Returns:
+            bool: 是否已得到判定（可以结束）
+        """
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = _get_usage(chunk)
+        choices = getattr(chunk, "choices", None) or []
+        # 思考模式下的 reasoning_content 不参与判定，只扫描正文
+        delta = getattr(choices[0], "delta", None) if choices else None
+        text = getattr(delta, "content", None) or ""
+        obj = self.scanner.feed(text)
+        while obj is not None:
+            if sp.has_verdict(obj, self.verdict_keys):
+                self.verdict = obj
+                return True
+            obj = self.scanner.feed("")
+        return False
+
+
+def _hedge_pool():
+    """同步对冲请求共用的线程池"""
+    global _hedge_executor
+    with _hedge_lock:
+        if _hedge_executor is None:
+            _hedge_executor = futures.ThreadPoolExecutor(
+                max_workers=HEDGE_WORKERS, thread_name_prefix="hedge"
+            )
+        return _hedge_executor
+
+
+def _node_label(ctx):
+    """
+    获取指标的节点标签
+
+    Args:
+        ctx: 用例调用上下文（节点视图带有 node 属性）
+
+    Returns:
+        str: 节点序号，未知时为空字符串
+    """
+    node = getattr(ctx, "node", None)
+    return "" if node is None else str(node)
+
+
+async def close_async_pool():
+    """
+    关闭当前事件循环的共享连接池
+
+    应在事件循环结束前调用（如 asyncio.run 的协程末尾）
+    """
+    loop = asyncio.get_running_loop()
+    with _async_http_lock:
+        http_client = _async_http_clients.pop(loop, None)
+    if http_client is not None and not http_client.is_closed:
+        await http_client.aclose()
 
 
 class ModelClient:
@@ -27,45 +209,693 @@ class ModelClient:
             config = cm.get_active_config()
         
         self.config = config
+        # 重试由 _send_request 统一处理，关闭 SDK 内置重试
         self.client = Ark(
             base_url=config['base_url'],
-            api_key=config['api_key']
+            api_key=config['api_key'],
+            max_retries=0
         )
         self.model_id = config['model_id']
         self.thinking_mode = config.get('thinking_mode', 'disabled')
+        # 异步客户端按事件循环缓存，底层共享连接池
+        self._async_clients = weakref.WeakKeyDictionary()
+        # 同一配置的所有客户端和任务共享一个限流器
+        self.rate_limiter = rl.get_rate_limiter(config)
+        self.retry_policy = rp.RetryPolicy.from_config(config)
+        # 流式调用：节点声明了判定字段时，判定 JSON 完整后立即结束生成
+        self.stream = _config_flag(config, "stream")
+        # 请求对冲（未开启时为 None），同一配置共享对冲比例限制
+        self.hedge = hedging.get_hedge_policy(config)
+        # 熔断器（未启用时为 None），同一服务端点的所有客户端共享
+        self.breaker = cb.get_circuit_breaker(config)
+        # 自适应并发限制器（未开启时为 None），同一配置的所有客户端和任务共享
+        self.adaptive = al.get_adaptive_limiter(config)
+        # 模型服务结构化输出模式（未开启时为 None）
+        self.json_mode = so.get_json_mode(config)
+    
+    def _get_async_client(self):
+        """
+        获取当前事件循环对应的 AsyncArk 客户端（内部方法）
+        
+        Returns:
+            AsyncArk: 使用共享连接池的异步客户端
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncArk(
+                base_url=self.config['base_url'],
+                api_key=self.config['api_key'],
+                max_retries=0,
+                http_client=_get_async_http_client()
+            )
+            self._async_clients[loop] = client
+        return client
     
-    def _send_request(self, messages):
+    def _send_request(self, messages, ctx=None):
         """
         发送请求到模型API（内部方法）
         
+        失败时按错误类型决定是否重试：可重试错误（限流/超时/5xx）按退避策略等待后重试，
+        并消耗用例的重试预算；不可重试或预算耗尽时抛出 ModelCallError；
+        服务端点已熔断时不发出请求，直接抛出 CircuitOpenError；
+        已有相同请求（缓存键相同）进行中时不再发出，等待并共享其结果或异常
+        
         Args:
             messages: 完整的消息列表
+            ctx: 用例调用上下文（CallContext 或节点视图 NodeContext），用于重试预算和调用统计
+        
+        Returns:
+            str: 模型返回的文本内容
+        
+        Raises:
+            ModelCallError: 调用最终失败
+        """
+        if ctx is not None:
+            ctx.record_call()
+        return self._dispatch(messages, ctx)
+    
+    def _dispatch(self, messages, ctx):
+        """
+        读取缓存、合并相同请求并发出（内部方法，不计入逻辑调用数）
+        
+        客户端池换配置重发时直接调用成员的 _dispatch，一次逻辑调用只记录一次
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        # 缓存键和令牌估算使用改写后的消息（包含预处理参数和 detail），实际发送时才内联图片
+        key_messages = self._rewrite_images(messages, ctx, inline=False)
+        cache_key, cached = self._read_cache(key_messages, ctx)
+        if cached is not None:
+            return cached
+        
+        # 相同的进行中请求只发出一次（见 single_flight）
+        return sf.do(
+            cache_key or rc.make_cache_key(self.model_id, self.thinking_mode, key_messages),
+            lambda: self._request(messages, key_messages, cache_key, ctx),
+            on_shared=lambda: self._record_coalesced(ctx)
+        )
+    
+    def _request(self, messages, key_messages, cache_key, ctx):
+        """
+        实际发出请求并按策略重试（内部方法，由 _dispatch 在合并层内调用）
+        
+        Args:
+            messages: 完整的消息列表
+            key_messages: 改写后用于计算缓存键和估算令牌的消息列表
+            cache_key: 响应缓存键（缓存未启用时为 None）
+            ctx: 用例调用上下文
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        estimated_tokens = rl.estimate_tokens(key_messages)
+        payload = self._rewrite_images(messages, ctx, inline=True)
+        verdict_keys = self._verdict_keys(ctx)
+        attempt = 0
+        while True:
+            self._check_circuit()
+            wait = self.rate_limiter.acquire(estimated_tokens)
+            if wait > 0:
+                metrics.VLM_RATE_LIMIT_WAIT_SECONDS.inc(wait, model=self.model_id)
+                if ctx is not None:
+                    ctx.record_queue_wait(wait * 1000)
+            slot = self._acquire_slot(ctx)
+            start = time.perf_counter()
+            try:
+                content, usage = self._attempt_hedged(payload, verdict_keys, estimated_tokens, ctx)
+            except Exception as e:
+                error = rp.classify_error(e)
+                self._release_slot(slot, ctx, start, error)
+                if not self._should_retry(error, attempt, ctx, start):
+                    raise error from e
+                time.sleep(self.retry_policy.compute_delay(attempt, error))
+                attempt += 1
+                continue
+            except BaseException:
+                self._release_slot(slot)
+                raise
+            
+            self._release_slot(slot, ctx, start)
+            self._record_success(usage, estimated_tokens, ctx, start)
+            self._write_cache(cache_key, content, ctx)
+            return content
+    
+    async def _send_request_async(self, messages, ctx=None):
+        """
+        异步发送请求到模型API（内部方法）
+        
+        重试逻辑与 _send_request 一致
+        
+        Args:
+            messages: 完整的消息列表
+            ctx: 用例调用上下文（CallContext）
+        
+        Returns:
+            str: 模型返回的文本内容
+        
+        Raises:
+            ModelCallError: 调用最终失败
+        """
+        if ctx is not None:
+            ctx.record_call()
+        return await self._dispatch_async(messages, ctx)
+    
+    async def _dispatch_async(self, messages, ctx):
+        """异步读取缓存、合并相同请求并发出（内部方法，逻辑与 _dispatch 一致）"""
+        # 缓存键和令牌估算使用改写后的消息（包含预处理参数和 detail），实际发送时才内联图片
+        key_messages = self._rewrite_images(messages, ctx, inline=False)
+        cache_key, cached = self._read_cache(key_messages, ctx)
+        if cached is not None:
+            return cached
+        
+        return await sf.do_async(
+            cache_key or rc.make_cache_key(self.model_id, self.thinking_mode, key_messages),
+            lambda: self._request_async(messages, key_messages, cache_key, ctx),
+            on_shared=lambda: self._record_coalesced(ctx)
+        )
+    
+    async def _request_async(self, messages, key_messages, cache_key, ctx):
+        """
+        异步发出请求并按策略重试（逻辑与 _request 一致）
         
         Returns:
             str: 模型返回的文本内容
         """
+        estimated_tokens = rl.estimate_tokens(key_messages)
+        payload = self._rewrite_images(messages, ctx, inline=True)
+        verdict_keys = self._verdict_keys(ctx)
+        attempt = 0
+        while True:
+            self._check_circuit()
+            wait = await self.rate_limiter.acquire_async(estimated_tokens)
+            if wait > 0:
+                metrics.VLM_RATE_LIMIT_WAIT_SECONDS.inc(wait, model=self.model_id)
+                if ctx is not None:
+                    ctx.record_queue_wait(wait * 1000)
+            slot = await self._acquire_slot_async(ctx)
+            start = time.perf_counter()
+            try:
+                content, usage = await self._attempt_hedged_async(payload, verdict_keys, estimated_tokens, ctx)
+            except Exception as e:
+                error = rp.classify_error(e)
+                self._release_slot(slot, ctx, start, error)
+                if not self._should_retry(error, attempt, ctx, start):
+                    raise error from e
+                await asyncio.sleep(self.retry_policy.compute_delay(attempt, error))
+                attempt += 1
+                continue
+            except BaseException:
+                # 被取消的请求只释放名额，不参与上限调整
+                self._release_slot(slot)
+                raise
+            
+            self._release_slot(slot, ctx, start)
+            self._record_success(usage, estimated_tokens, ctx, start)
+            self._write_cache(cache_key, content, ctx)
+            return content
+    
+    def _record_coalesced(self, ctx):
+        """记录一次与进行中的相同请求合并（内部方法）"""
+        metrics.VLM_COALESCED.inc(node=_node_label(ctx), model=self.model_id)
+        if ctx is not None:
+            ctx.record_coalesced()
+    
+    def _record_success(self, usage, estimated_tokens, ctx, start):
+        """
+        记录成功请求的耗时和令牌用量（内部方法）
+        
+        Args:
+            usage: 令牌用量（_get_usage 的返回值，未知时为空字典）
+            estimated_tokens: 请求前预估的令牌数
+            ctx: 用例调用上下文
+            start: 本次尝试的开始时间（perf_counter）
+        """
+        elapsed = time.perf_counter() - start
+        if ctx is not None:
+            ctx.record_attempt(elapsed * 1000)
+            ctx.record_usage(usage)
+        self.rate_limiter.record_usage(estimated_tokens, usage.get("total_tokens"))
+        
+        node = _node_label(ctx)
+        metrics.VLM_REQUESTS.inc(node=node, model=self.model_id, status="ok")
+        metrics.VLM_REQUEST_SECONDS.observe(elapsed, node=node, model=self.model_id)
+        for field in ("prompt_tokens", "completion_tokens", "reasoning_tokens"):
+            if usage.get(field):
+                metrics.VLM_TOKENS.inc(usage[field], node=node, model=self.model_id, type=field)
+    
+    # ==================== 单次请求与对冲 ====================
+    
+    def _attempt(self, payload, verdict_keys, ctx):
+        """
+        发出一次请求（内部方法）
+        
+        开启对冲时成功请求的耗时计入该节点的耗时分布；请求结果计入熔断器
+        
+        Returns:
+            tuple: (content, usage)
+        """
+        start = time.perf_counter()
         try:
-            response = self.client.chat.completions.create(
-                model=self.model_id,
-                messages=messages,
-                thinking={"type": self.thinking_mode}
-            )
-            return response.choices[0].message.content
+            if verdict_keys:
+                content, usage = self._create_streaming(payload, verdict_keys, ctx)
+            else:
+                response = self.client.chat.completions.create(
+                    model=self.model_id,
+                    messages=payload,
+                    thinking={"type": self.thinking_mode},
+                    **self._format_kwargs(ctx)
+                )
+                content = response.choices[0].message.content
+                usage = _get_usage(response)
         except Exception as e:
-            return f"Error: {e}"
+            self._record_circuit(rp.classify_error(e))
+            raise
+        self._record_circuit(None)
+        self._observe_latency(ctx, time.perf_counter() - start)
+        return content, usage
+    
+    async def _attempt_async(self, payload, verdict_keys, ctx):
+        """发出一次异步请求（内部方法，逻辑与 _attempt 一致）"""
+        start = time.perf_counter()
+        try:
+            if verdict_keys:
+                content, usage = await self._create_streaming_async(payload, verdict_keys, ctx)
+            else:
+                response = await self._get_async_client().chat.completions.create(
+                    model=self.model_id,
+                    messages=payload,
+                    thinking={"type": self.thinking_mode},
+                    **self._format_kwargs(ctx)
+                )
+                content = response.choices[0].message.content
+                usage = _get_usage(response)
+        except Exception as e:
+            # 被取消的请求（CancelledError 不是 Exception）不计入熔断统计
+            self._record_circuit(rp.classify_error(e))
+            raise
+        self._record_circuit(None)
+        self._observe_latency(ctx, time.perf_counter() - start)
+        return content, usage
+    
+    # ==================== 自适应并发 ====================
     
-    def call_single(self, prompt, image_url):
+    def adaptive_limiters(self):
         """
-        单图判断调用（节点1-3使用）
+        该客户端请求经过的自适应并发限制器（未开启时为空列表）
+        
+        Returns:
+            list: AdaptiveLimiter 列表
+        """
+        return [self.adaptive] if self.adaptive is not None else []
+    
+    def _acquire_slot(self, ctx):
+        """
+        等待自适应并发名额（内部方法）
+        
+        Returns:
+            float or None: 占用名额的时间，未开启自适应并发时返回 None
+        """
+        if self.adaptive is None:
+            return None
+        taken_at, wait = self.adaptive.acquire()
+        if wait > 0 and ctx is not None:
+            ctx.record_queue_wait(wait * 1000)
+        return taken_at
+    
+    async def _acquire_slot_async(self, ctx):
+        """异步等待自适应并发名额（内部方法）"""
+        if self.adaptive is None:
+            return None
+        taken_at, wait = await self.adaptive.acquire_async()
+        if wait > 0 and ctx is not None:
+            ctx.record_queue_wait(wait * 1000)
+        return taken_at
+    
+    def _release_slot(self, slot, ctx=None, start=None, error=None):
+        """
+        释放自适应并发名额（内部方法）
         
         Args:
-            prompt: 提示词文本
-            image_url: 生成图URL
+            slot: _acquire_slot 的返回值
+            ctx: 用例调用上下文（耗时按节点统计）
+            start: 请求开始时间（perf_counter），None 表示请求被取消，不参与上限调整
+            error: 失败时的 ModelCallError
+        """
+        if slot is None:
+            return
+        if start is None:
+            self.adaptive.release(slot)
+            return
+        self.adaptive.release(slot, _node_label(ctx), time.perf_counter() - start, error)
+    
+    # ==================== 熔断 ====================
+    
+    def circuit_breakers(self):
+        """
+        该客户端请求经过的熔断器（未启用时为空列表）
         
         Returns:
-            str: 模型返回的文本内容
+            list: CircuitBreaker 列表
         """
-        messages = [
+        return [self.breaker] if self.breaker is not None else []
+    
+    def _check_circuit(self):
+        """
+        服务端点已熔断时快速失败（内部方法）
+        
+        Raises:
+            CircuitOpenError: 熔断器拒绝本次请求
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            raise rp.CircuitOpenError(
+                f"模型服务 {self.breaker.endpoint} 已熔断（{self.breaker.retry_in():.0f}s 后探测）："
+                f"{self.breaker.last_error}"
+            )
+    
+    def _record_circuit(self, error):
+        """记录一次请求结果到熔断器（内部方法）"""
+        if self.breaker is not None:
+            self.breaker.record(error)
+    
+    def _observe_latency(self, ctx, seconds):
+        """记录成功请求的耗时，用于学习对冲等待时间（内部方法）"""
+        if self.hedge is not None:
+            self.hedge.tracker(_node_label(ctx)).observe(seconds)
+    
+    def _hedge_delay(self, ctx):
+        """
+        获取本次请求的对冲等待时间（内部方法）
+        
+        Returns:
+            float or None: 等待秒数，未开启对冲或样本不足时返回 None
+        """
+        if self.hedge is None:
+            return None
+        return self.hedge.delay(_node_label(ctx))
+    
+    def _try_hedge(self, estimated_tokens):
+        """申请对冲：对冲比例未超限且限流器当前有空闲额度（内部方法）"""
+        return self.hedge.try_hedge(lambda: self.rate_limiter.try_acquire(estimated_tokens))
+    
+    def _record_hedge(self, hedge_won, ctx):
+        """记录一次对冲的结果（内部方法）"""
+        self.hedge.record_result(hedge_won)
+        metrics.VLM_HEDGED_REQUESTS.inc(
+            node=_node_label(ctx), model=self.model_id, result="won" if hedge_won else "lost"
+        )
+        if ctx is not None:
+            ctx.record_hedge(hedge_won)
+    
+    def _attempt_hedged(self, payload, verdict_keys, estimated_tokens, ctx):
+        """
+        发出一次请求，超过对冲等待时间仍未返回时再发出一个相同请求（内部方法）
+        
+        采用先成功返回的结果，另一个请求的结果被丢弃；两个请求都失败时抛出先失败的异常
+        
+        Returns:
+            tuple: (content, usage)
+        """
+        delay = self._hedge_delay(ctx)
+        if delay is None:
+            return self._attempt(payload, verdict_keys, ctx)
+        pool = _hedge_pool()
+        primary = pool.submit(self._attempt, payload, verdict_keys, ctx)
+        done, _ = futures.wait([primary], timeout=delay)
+        if done or not self._try_hedge(estimated_tokens):
+            return primary.result()
+        
+        hedge = pool.submit(self._attempt, payload, verdict_keys, ctx)
+        pending = {primary, hedge}
+        first_error = None
+        while pending:
+            done, pending = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    self._record_hedge(future is hedge, ctx)
+                    return future.result()
+                first_error = first_error or future.exception()
+        self._record_hedge(False, ctx)
+        raise first_error
+    
+    async def _attempt_hedged_async(self, payload, verdict_keys, estimated_tokens, ctx):
+        """
+        异步对冲请求（逻辑与 _attempt_hedged 一致，未采用的请求直接取消）
+        
+        Returns:
+            tuple: (content, usage)
+        """
+        delay = self._hedge_delay(ctx)
+        if delay is None:
+            return await self._attempt_async(payload, verdict_keys, ctx)
+        primary = asyncio.ensure_future(self._attempt_async(payload, verdict_keys, ctx))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if done or not self._try_hedge(estimated_tokens):
+                return await primary
+            
+            hedge = asyncio.ensure_future(self._attempt_async(payload, verdict_keys, ctx))
+            tasks.append(hedge)
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._record_hedge(task is hedge, ctx)
+                        return task.result()
+                    first_error = first_error or task.exception()
+            self._record_hedge(False, ctx)
+            raise first_error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    # ==================== 流式调用 ====================
+    
+    def _verdict_keys(self, ctx):
+        """
+        获取流式提前结束所需的判定字段（内部方法）
+        
+        只有配置开启流式（stream=1）且节点声明了判定字段时才使用流式调用
+        
+        Returns:
+            tuple: 判定字段，为空表示不使用流式调用
+        """
+        if not self.stream or ctx is None:
+            return ()
+        return tuple(getattr(ctx, "verdict_keys", None) or ())
+    
+    def _stream_kwargs(self, payload, ctx):
+        """流式请求参数（内部方法）"""
+        return {
+            "model": self.model_id,
+            "messages": payload,
+            "thinking": {"type": self.thinking_mode},
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            **self._format_kwargs(ctx)
+        }
+    
+    # ==================== 结构化输出 ====================
+    
+    def _format_kwargs(self, ctx):
+        """
+        结构化输出模式的请求参数（内部方法）
+        
+        配置开启 json_mode 时只对工作流节点调用生效（ctx 带有节点输出结构）
+        
+        Returns:
+            dict: {"response_format": ...}，未开启时为空字典
+        """
+        if self.json_mode is None or ctx is None:
+            return {}
+        return {"response_format": so.response_format(self.json_mode, getattr(ctx, "schema", None))}
+    
+    def _create_streaming(self, payload, verdict_keys, ctx):
+        """
+        流式调用，判定 JSON 完整后立即结束（内部方法）
+        
+        收到包含全部判定字段的 JSON 对象后关闭连接，取消剩余的生成；
+        提前结束时响应不含 usage，令牌用量记为未知
+        
+        Args:
+            payload: 发送的消息列表
+            verdict_keys: 判定字段
+            ctx: 用例调用上下文
+        
+        Returns:
+            tuple: (content, usage)
+        """
+        reader = _StreamReader(verdict_keys)
+        stream = self.client.chat.completions.create(**self._stream_kwargs(payload, ctx))
+        try:
+            for chunk in stream:
+                if reader.feed(chunk):
+                    break
+        finally:
+            stream.close()
+        return self._finish_stream(reader, ctx)
+    
+    async def _create_streaming_async(self, payload, verdict_keys, ctx):
+        """
+        异步流式调用（逻辑与 _create_streaming 一致）
+        
+        Returns:
+            tuple: (content, usage)
+        """
+        reader = _StreamReader(verdict_keys)
+        stream = await self._get_async_client().chat.completions.create(**self._stream_kwargs(payload, ctx))
+        try:
+            async for chunk in stream:
+                if reader.feed(chunk):
+                    break
+        finally:
+            await stream.close()
+        return self._finish_stream(reader, ctx)
+    
+    def _finish_stream(self, reader, ctx):
+        """记录提前结束并返回流式结果（内部方法）"""
+        if reader.verdict is not None:
+            metrics.VLM_STREAM_EARLY_STOPS.inc(node=_node_label(ctx), model=self.model_id)
+            return reader.verdict, reader.usage
+        return reader.scanner.text, reader.usage
+    
+    def _rewrite_images(self, messages, ctx, inline):
+        """
+        按用例的图片预处理方案改写消息中的图片（内部方法）
+        
+        - 方案指定了 detail 时覆盖图片的 detail 参数
+        - inline=False: 实际发送预处理变体的图片在URL后追加处理参数标识，用于计算缓存键和估算令牌
+          （变体不存在时按原图发送，不追加标识）
+        - inline=True: 替换为本地缓存图片（优先使用预处理变体）的 data URL，用于实际发送；
+          只在 ctx.inline_images 为 True 时替换，未缓存的图片保留原URL
+        
+        生成图与参考图按 URL 是否等于 ctx.case_url 区分
+        
+        Args:
+            messages: 完整的消息列表
+            ctx: 用例调用上下文
+            inline: 是否替换为 data URL
+        
+        Returns:
+            list: 改写后的消息列表（不需要改写时返回原列表）
+        """
+        profile = ctx.image_profile if ctx is not None else None
+        inline_images = ctx is not None and ctx.inline_images
+        inline = inline and inline_images
+        if (profile is None or profile.is_identity) and not inline:
+            return messages
+        
+        cache = ic.get_image_cache() if inline_images else None
+        ref_set = getattr(ctx, "ref_set", None)
+        node = getattr(ctx, "node", None)
+        rewritten = []
+        for message in messages:
+            content = message.get("content")
+            if isinstance(content, str):
+                rewritten.append(message)
+                continue
+            parts = []
+            for part in content:
+                if part.get("type") == "image_url":
+                    image = dict(part["image_url"])
+                    url = image["url"]
+                    settings = ip.IDENTITY_SETTINGS
+                    if profile is not None:
+                        settings = profile.get(node, "gen" if url == ctx.case_url else "ref")
+                    if settings.detail:
+                        image["detail"] = settings.detail
+                    if inline and ref_set is not None and url in ref_set:
+                        # 参考图在任务内只编码一次
+                        image["url"] = ref_set.data_url(url, settings.key, cache) or url
+                    elif inline:
+                        image["url"] = cache.data_url(url, settings.key) or url
+                    elif settings.key and cache is not None and cache.has_variant(url, settings.key):
+                        image["url"] = f"{url}#{settings.key}"
+                    part = {"type": "image_url", "image_url": image}
+                parts.append(part)
+            rewritten.append(dict(message, content=parts))
+        return rewritten
+    
+    def _read_cache(self, messages, ctx):
+        """
+        查询响应缓存（内部方法）
+        
+        Args:
+            messages: 完整的消息列表
+            ctx: 用例调用上下文（ctx.bypass_cache 为 True 时跳过读取，仍会写入新结果）
+        
+        Returns:
+            tuple: (cache_key, cached_text)，缓存未启用时 cache_key 为 None，未命中时 cached_text 为 None
+        """
+        cache = rc.get_response_cache()
+        if cache is None:
+            return None, None
+        
+        cache_key = rc.make_cache_key(self.model_id, self.thinking_mode, messages)
+        if ctx is not None and ctx.bypass_cache:
+            return cache_key, None
+        
+        cached = cache.get(cache_key)
+        if cached is not None:
+            metrics.VLM_CACHE_HITS.inc(node=_node_label(ctx), model=self.model_id)
+            if ctx is not None:
+                ctx.record_cache_hit()
+        return cache_key, cached
+    
+    def _write_cache(self, cache_key, content, ctx=None):
+        """
+        写入响应缓存，只缓存可解析为JSON且符合节点输出结构的响应（内部方法）
+        
+        Args:
+            cache_key: 缓存键（None 表示缓存未启用）
+            content: 模型返回的文本内容
+            ctx: 用例调用上下文（节点视图带有输出结构）
+        """
+        if cache_key is None:
+            return
+        _, problems = self.parse_structured(content, getattr(ctx, "schema", None))
+        if problems:
+            return
+        rc.get_response_cache().put(cache_key, content)
+    
+    def _should_retry(self, error, attempt, ctx, start):
+        """
+        记录失败的尝试并判断是否重试（内部方法）
+        
+        Args:
+            error: ModelCallError
+            attempt: 已重试次数
+            ctx: 用例调用上下文
+            start: 本次尝试的开始时间（perf_counter）
+        
+        Returns:
+            bool: 是否重试
+        """
+        elapsed = time.perf_counter() - start
+        node = _node_label(ctx)
+        metrics.VLM_REQUESTS.inc(node=node, model=self.model_id, status=error.kind)
+        metrics.VLM_REQUEST_SECONDS.observe(elapsed, node=node, model=self.model_id)
+        if ctx is not None:
+            ctx.record_attempt(elapsed * 1000, error)
+        if not self.retry_policy.should_retry(error, attempt):
+            return False
+        if ctx is not None:
+            if not ctx.retry_budget.try_consume():
+                return False
+            ctx.record_retry()
+        metrics.VLM_RETRIES.inc(node=node, model=self.model_id)
+        return True
+    
+    # ==================== 消息构建 ====================
+    
+    def _build_single_messages(self, prompt, image_url):
+        """构建单图判断的消息列表（内部方法）"""
+        return [
             {"role": "system", "content": prompt},
             {
                 "role": "user",
@@ -75,52 +905,34 @@ class ModelClient:
                 ]
             }
         ]
-        return self._send_request(messages)
     
-    def call_multi_ref(self, prompt, ref_urls, gen_url):
+    def _build_multi_ref_messages(self, prompt, ref_urls, gen_url):
         """
-        多参考图比对调用（节点4使用）
-        图片顺序：参考图1-N在前，生成图在后
-        
-        Args:
-            prompt: 提示词文本
-            ref_urls: 参考图URL列表
-            gen_url: 生成图URL
+        构建多参考图比对的消息列表（内部方法）
         
-        Returns:
-            str: 模型返回的文本内容
+        ref_urls 为 RefSet 时直接使用其预先构建的参考图前缀，同一车型的所有用例共用
         """
         # 构建参考图内容
-        ref_content = [
-            {"type": "text", "text": f"下面{len(ref_urls)}张图片为参考图"}
-        ]
-        for url in ref_urls:
-            ref_content.append({"type": "image_url", "image_url": {"url": url}})
+        if isinstance(ref_urls, rr.RefSet):
+            ref_content = list(ref_urls.prefix_content())
+        else:
+            ref_content = [
+                {"type": "text", "text": f"下面{len(ref_urls)}张图片为参考图"}
+            ]
+            for url in ref_urls:
+                ref_content.append({"type": "image_url", "image_url": {"url": url}})
         
         # 构建生成图内容
         ref_content.append({"type": "text", "text": "下面图片为生成图，需要判断这个图片"})
         ref_content.append({"type": "image_url", "image_url": {"url": gen_url, "detail": "high"}})
         
-        messages = [
+        return [
             {"role": "system", "content": prompt},
             {"role": "user", "content": ref_content}
         ]
-        return self._send_request(messages)
     
-    def call_compare(self, prompt, ref_url, gen_url, ref_description=""):
-        """
-        双图比对调用（节点5使用）
-        图片顺序：参考图在前，生成图在后
-        
-        Args:
-            prompt: 提示词文本（应包含{{cankaotumiaoshu}}占位符）
-            ref_url: 参考图URL
-            gen_url: 生成图URL
-            ref_description: 参考图描述文本
-        
-        Returns:
-            str: 模型返回的文本内容
-        """
+    def _build_compare_messages(self, prompt, ref_url, gen_url, ref_description=""):
+        """构建双图比对的消息列表（内部方法）"""
         # 替换描述占位符
         final_prompt = prompt
         if "{{cankaotumiaoshu}}" in prompt:
@@ -134,11 +946,161 @@ class ModelClient:
             {"type": "image_url", "image_url": {"url": gen_url, "detail": "high"}}
         ]
         
-        messages = [
+        return [
             {"role": "system", "content": final_prompt},
             {"role": "user", "content": user_content}
         ]
-        return self._send_request(messages)
+    
+    # ==================== 同步调用 ====================
+    
+    def call_single(self, prompt, image_url, ctx=None):
+        """
+        单图判断调用（节点1-3使用）
+        
+        Args:
+            prompt: 提示词文本
+            image_url: 生成图URL
+            ctx: 用例调用上下文（可选）
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        return self._send_request(self._build_single_messages(prompt, image_url), ctx)
+    
+    def call_multi_ref(self, prompt, ref_urls, gen_url, ctx=None):
+        """
+        多参考图比对调用（节点4使用）
+        图片顺序：参考图1-N在前，生成图在后
+        
+        Args:
+            prompt: 提示词文本
+            ref_urls: 参考图URL列表（或 RefSet）
+            gen_url: 生成图URL
+            ctx: 用例调用上下文（可选）
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        return self._send_request(self._build_multi_ref_messages(prompt, ref_urls, gen_url), ctx)
+    
+    def call_compare(self, prompt, ref_url, gen_url, ref_description="", ctx=None):
+        """
+        双图比对调用（节点5使用）
+        图片顺序：参考图在前，生成图在后
+        
+        Args:
+            prompt: 提示词文本（应包含{{cankaotumiaoshu}}占位符）
+            ref_url: 参考图URL
+            gen_url: 生成图URL
+            ref_description: 参考图描述文本
+            ctx: 用例调用上下文（可选）
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        return self._send_request(
+            self._build_compare_messages(prompt, ref_url, gen_url, ref_description), ctx
+        )
+    
+    # ==================== 异步调用 ====================
+    
+    async def call_single_async(self, prompt, image_url, ctx=None):
+        """
+        单图判断调用的异步版本（节点1-3使用）
+        
+        Args:
+            prompt: 提示词文本
+            image_url: 生成图URL
+            ctx: 用例调用上下文（可选）
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        return await self._send_request_async(self._build_single_messages(prompt, image_url), ctx)
+    
+    async def call_multi_ref_async(self, prompt, ref_urls, gen_url, ctx=None):
+        """
+        多参考图比对调用的异步版本（节点4使用）
+        
+        Args:
+            prompt: 提示词文本
+            ref_urls: 参考图URL列表（或 RefSet）
+            gen_url: 生成图URL
+            ctx: 用例调用上下文（可选）
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        return await self._send_request_async(
+            self._build_multi_ref_messages(prompt, ref_urls, gen_url), ctx
+        )
+    
+    async def call_compare_async(self, prompt, ref_url, gen_url, ref_description="", ctx=None):
+        """
+        双图比对调用的异步版本（节点5使用）
+        
+        Args:
+            prompt: 提示词文本（应包含{{cankaotumiaoshu}}占位符）
+            ref_url: 参考图URL
+            gen_url: 生成图URL
+            ref_description: 参考图描述文本
+            ctx: 用例调用上下文（可选）
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        return await self._send_request_async(
+            self._build_compare_messages(prompt, ref_url, gen_url, ref_description), ctx
+        )
+    
+    # ==================== 结构化输出重问 ====================
+    
+    def _build_reask_messages(self, call_kind, prompt, args, previous, problems, schema):
+        """
+        构建针对性重问的消息列表（内部方法）
+        
+        原消息（提示词和图片不变，可命中服务端前缀缓存）之后追加模型上一次的回复和具体问题
+        """
+        messages = getattr(self, f"_build_{call_kind}_messages")(prompt, *args)
+        return messages + [
+            {"role": "assistant", "content": str(previous)},
+            {"role": "user", "content": so.reask_prompt(problems, schema)}
+        ]
+    
+    def reask(self, call_kind, prompt, args, previous, problems, ctx=None):
+        """
+        输出不符合节点结构时针对性重问
+        
+        Args:
+            call_kind: 原调用方式（single / multi_ref / compare）
+            prompt: 原提示词
+            args: 原调用的其他参数（提示词之外）
+            previous: 模型上一次的回复
+            problems: 上一次回复的问题描述（structured_output.parse 的返回值）
+            ctx: 用例调用上下文（节点视图，带有输出结构）
+        
+        Returns:
+            str: 模型返回的文本内容
+        """
+        if ctx is not None:
+            ctx.record_reask()
+        metrics.VLM_REASKS.inc(node=_node_label(ctx), model=self.model_id)
+        schema = getattr(ctx, "schema", None)
+        return self._send_request(
+            self._build_reask_messages(call_kind, prompt, args, previous, problems, schema), ctx
+        )
+    
+    async def reask_async(self, call_kind, prompt, args, previous, problems, ctx=None):
+        """异步针对性重问（参数与 reask 一致）"""
+        if ctx is not None:
+            ctx.record_reask()
+        metrics.VLM_REASKS.inc(node=_node_label(ctx), model=self.model_id)
+        schema = getattr(ctx, "schema", None)
+        return await self._send_request_async(
+            self._build_reask_messages(call_kind, prompt, args, previous, problems, schema), ctx
+        )
+    
+    # ==================== 通用调用 ====================
     
     def call(self, prompt, image_urls, system_prompt="You are a helpful assistant."):
         """
@@ -150,7 +1112,7 @@ class ModelClient:
             system_prompt: 系统提示词
         
         Returns:
-            str: 模型返回的文本内容
+            str: 模型返回的文本内容，调用失败时返回 "Error: ..." 文本（保持旧行为）
         """
         messages = [
             {"role": "system", "content": system_prompt},
@@ -163,12 +1125,15 @@ class ModelClient:
         
         messages.append({"role": "user", "content": user_content})
         
-        return self._send_request(messages)
+        try:
+            return self._send_request(messages)
+        except rp.ModelCallError as e:
+            return f"Error: {e}"
     
     def parse_json_response(self, response_text):
         """
         解析模型返回的JSON内容
-        支持处理Markdown代码块包裹的JSON
+        支持Markdown代码块、前后夹杂的说明文字和常见格式缺陷（见 structured_output.extract_json）
         
         Args:
             response_text: 模型返回的原始文本
@@ -176,16 +1141,20 @@ class ModelClient:
         Returns:
             dict or None: 解析后的JSON对象，失败返回None
         """
-        try:
-            # 清理Markdown代码块
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
-            
-            return json.loads(response_text.strip())
-        except Exception:
-            return None
+        return so.extract_json(response_text)
+    
+    def parse_structured(self, response_text, schema=None):
+        """
+        解析模型返回的JSON内容并按节点输出结构校验
+        
+        Args:
+            response_text: 模型返回的原始文本
+            schema: 节点输出结构（NodeSchema），None 时只要求是非空JSON对象
+        
+        Returns:
+            tuple: (JSON对象或None, 问题描述列表)，问题列表为空表示可以使用
+        """
+        return so.parse(response_text, schema)
     
     def get_config_info(self):
         """
@@ -203,23 +1172,60 @@ class ModelClient:
 
 # 全局单例客户端（用于向后兼容）
 _global_client = None
+_global_client_lock = threading.Lock()
+# 按配置ID缓存的客户端（多配置对比测试时使用）
+_clients_by_config = {}
 
-def get_client(force_reload=False):
+def _build_client(config, force_reload):
     """
-    获取全局模型客户端实例
+    按配置创建客户端：配置标记了 pool 时返回该池的客户端池（内部方法）
+    
+    Args:
+        config: 配置字典
+        force_reload: 是否重新读取池配置
+    
+    Returns:
+        ModelClient: 模型客户端或客户端池
+    """
+    pool = cm.get_pool_name(config)
+    if pool is None:
+        return ModelClient(config)
+    # 客户端池继承 ModelClient，延迟导入避免循环依赖
+    from . import client_pool
+    return client_pool.get_pool_client(pool, force_reload=force_reload)
+
+def get_client(force_reload=False, config_id=None):
+    """
+    获取模型客户端实例
+    
+    配置标记了 pool 时返回该池的客户端池（ClientPool），请求分散到池中所有配置
     
     Args:
         force_reload: 是否强制重新加载配置
+        config_id: 配置ID，None 时返回激活配置的全局客户端；
+                   指定时每个配置一个客户端，多个配置可同时使用
     
     Returns:
         ModelClient: 模型客户端实例
+    
+    Raises:
+        ValueError: 指定的配置不存在，或配置所在的池中模型不一致
     """
     global _global_client
     
-    if _global_client is None or force_reload:
-        _global_client = ModelClient()
-    
-    return _global_client
+    # 并发执行用例时可能有多个线程同时初始化
+    with _global_client_lock:
+        if config_id is None:
+            if _global_client is None or force_reload:
+                _global_client = _build_client(cm.get_active_config(), force_reload)
+            return _global_client
+        
+        key = str(config_id)
+        client = _clients_by_config.get(key)
+        if client is None or force_reload:
+            client = _build_client(cm.get_config(key), force_reload)
+            _clients_by_config[key] = client
+        return client
 
 def call_vlm(prompt, image_urls, system_prompt="You are a helpful assistant."):
     """
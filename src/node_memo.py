@@ -0,0 +1,188 @@
+"""
+节点级结果复用模块
+
+从 test_history 中已保存的运行记录建立索引，复用上游未变化节点的输出：
+节点N的输出只有在以下条件全部一致时才会被复用
+- 生成图URL
+- 模型ID与思考模式
+- 节点1~N的提示词内容哈希（提示词版本号可原地修改，因此按内容判断）
+- 节点4、5额外要求参考图集合一致
+- 图片预处理方案一致（见 image_preprocess）
+
+这样只修改 prompt_05 时，节点1~4直接复用历史输出，每个用例只需对节点5发起一次调用
+"""
+import os
+import json
+import hashlib
+import threading
+from . import history_manager as hm
+
+# ==================== 复用配置 ====================
+MAX_HISTORY_FILES = 50  # 建立索引时最多读取的历史记录数（按时间倒序）
+REF_DEPENDENT_NODES = (4, 5)  # 依赖参考图的节点
+
+
+def prompt_hash(prompt_content):
+    """
+    计算提示词内容哈希
+
+    Args:
+        prompt_content: 提示词文本
+
+    Returns:
+        str: 16位十六进制哈希
+    """
+    return hashlib.sha256(str(prompt_content).encode("utf-8")).hexdigest()[:16]
+
+
+def get_prompt_hashes(prompts):
+    """
+    计算所有节点提示词的内容哈希
+
+    Args:
+        prompts: 提示词字典 {1: {...}, 2: {...}, ...}
+
+    Returns:
+        dict: {"p1": "...", "p2": "...", ...}
+    """
+    return {
+        f"p{node}": prompt_hash(data.get('prompt_content', ""))
+        for node, data in prompts.items()
+        if data.get('prompt_content')
+    }
+
+
+def ref_hash(ref_urls):
+    """
+    计算参考图集合哈希
+
+    Args:
+        ref_urls: 有序参考图URL列表
+
+    Returns:
+        str: 16位十六进制哈希
+    """
+    return hashlib.sha256("\n".join(ref_urls).encode("utf-8")).hexdigest()[:16]
+
+
+def make_memo_key(case_url, node, prompt_hashes, model_config, refs_hash, image_key=None):
+    """
+    计算节点输出的复用键
+
+    Args:
+        case_url: 生成图URL
+        node: 节点序号（1-5）
+        prompt_hashes: 提示词内容哈希 {"p1": "...", ...}
+        model_config: 模型配置摘要 {"model_id", "thinking_mode"}
+        refs_hash: 参考图集合哈希
+        image_key: 图片预处理方案哈希，None 表示原图
+
+    Returns:
+        tuple or None: 复用键，上游提示词哈希不完整时返回 None
+    """
+    upstream = []
+    for i in range(1, node + 1):
+        h = prompt_hashes.get(f"p{i}")
+        if not h:
+            return None
+        upstream.append(h)
+
+    return (
+        case_url,
+        node,
+        str(model_config.get("model_id")),
+        str(model_config.get("thinking_mode")),
+        tuple(upstream),
+        refs_hash if node in REF_DEPENDENT_NODES else None,
+        image_key
+    )
+
+
+class NodeMemo:
+    """节点输出复用索引（线程安全）"""
+
+    def __init__(self):
+        """初始化空索引"""
+        self._outputs = {}
+        self.hits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_history(cls, model_config, max_files=MAX_HISTORY_FILES):
+        """
+        从测试历史建立索引
+
+        只读取与当前模型配置一致的记录；同一键以最新记录为准
+
+        Args:
+            model_config: 当前模型配置摘要
+            max_files: 最多读取的历史文件数
+
+        Returns:
+            NodeMemo: 节点输出复用索引
+        """
+        memo = cls()
+        if not os.path.exists(hm.HISTORY_DIR):
+            return memo
+
+        files = sorted(
+            (f for f in os.listdir(hm.HISTORY_DIR) if f.endswith('.json')),
+            reverse=True
+        )[:max_files]
+
+        # 从旧到新加载，新记录覆盖旧记录
+        for filename in reversed(files):
+            data = hm.load_test_history(filename[:-len('.json')])
+            if not data:
+                continue
+            for r in data.get('results', []):
+                memo.add_result(r, model_config)
+        return memo
+
+    def add_result(self, result, model_config):
+        """
+        将一条结果的节点输出加入索引
+
+        Args:
+            result: 测试结果（需包含 node_outputs、prompt_hashes、model_config，可选 image_profile_key）
+            model_config: 当前模型配置摘要（不一致的记录被忽略）
+        """
+        node_outputs = result.get('node_outputs') or {}
+        prompt_hashes = result.get('prompt_hashes') or {}
+        result_model = result.get('model_config') or {}
+        if not node_outputs or not prompt_hashes:
+            return
+        if (str(result_model.get('model_id')) != str(model_config.get('model_id'))
+                or str(result_model.get('thinking_mode')) != str(model_config.get('thinking_mode'))):
+            return
+
+        with self._lock:
+            for node, output in node_outputs.items():
+                key = make_memo_key(
+                    result.get('case_url'), int(node), prompt_hashes,
+                    result_model, result.get('ref_hash'), result.get('image_profile_key')
+                )
+                if key is not None and isinstance(output, dict):
+                    self._outputs[key] = output
+
+    def get(self, key):
+        """
+        查询节点输出
+
+        Args:
+            key: make_memo_key 生成的键
+
+        Returns:
+            dict or None: 历史输出，未命中返回 None
+        """
+        if key is None:
+            return None
+        with self._lock:
+            output = self._outputs.get(key)
+            if output is not None:
+                self.hits += 1
+            return output
+
+    def __len__(self):
+        with self._lock:
+            return len(self._outputs)
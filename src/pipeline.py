@@ -0,0 +1,581 @@
+"""
+节点流水线引擎模块
+
+审图工作流由若干节点（NodeSpec）声明式组成，每个节点只需声明：
+- call_kind: 调用方式（single / multi_ref / compare，对应 ModelClient.call_*）
+- build_args: 从运行状态构建调用参数（提示词之外的参数）
+- passes: 通过判定，返回 True 则继续下一个节点
+- on_fail: 未通过时的结果映射，返回 NodeOutcome
+- precheck / on_pass（可选）: 调用前的前置检查、通过后的状态更新（可提前结束）
+- verdict_keys（可选）: 判定只依赖的输出字段，流式调用时这些字段齐全的 JSON 一到达即结束生成
+- schema（可选）: 输出结构（structured_output.NodeSchema），输出不符合结构时针对性重问一次，
+  仍不符合才记为解析失败
+- independent（可选）: 调用参数只依赖用例本身（不依赖前序节点输出），投机模式下可提前并行调用
+- members / split_output / build_prompt（可选）: 合并节点，一次调用回答多个成员节点，
+  输出拆分到各成员后按成员顺序判定，结果的 finish_at_step 与逐个调用时一致
+
+Pipeline 负责按顺序执行节点（提示词查找、解析、分支、提前返回），
+NodeExecutor 负责实际发起模型调用，并在每次调用前后执行钩子（PipelineHook），
+计时、缓存复用、并发控制等横切逻辑都通过钩子接入，不需要修改节点声明
+
+投机模式（speculative=True）下，执行器遇到独立节点时同时发起其后连续独立节点的调用，
+仍按节点顺序判定：前面的节点未通过时，尚未开始的调用被取消，已发出的调用结果被丢弃；
+每个用例记录投机调用数、浪费的调用数和节省的耗时（CallContext.record_speculation）。
+同步和异步执行的浪费调用数口径一致：只统计实际发出了请求的被丢弃调用（NodeCall.discard）。
+投机调用的记录暂存在各自的节点上下文中，被丢弃的调用不计入节点指标（不影响节点耗时分布），
+其令牌计入用例总计和投机统计；同步模式下无法中止已发出的请求，用例在这些请求结束后才返回
+"""
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from . import retry_policy as rp
+from . import structured_output as so
+
+# ==================== 投机执行配置 ====================
+SPECULATIVE_WORKERS = 64  # 同步模式下投机调用共用的线程数
+
+
+class NodeOutcome:
+    """节点判定产生的最终结果"""
+
+    def __init__(self, final_pass, reason, parse_output=None):
+        """
+        Args:
+            final_pass: 最终结果（yes/no/unknown/error）
+            reason: 原因说明
+            parse_output: 写入结果的输出，None 时使用节点的解析输出
+        """
+        self.final_pass = final_pass
+        self.reason = reason
+        self.parse_output = parse_output
+
+
+class NodeSpec:
+    """节点声明"""
+
+    def __init__(self, index, name, call_kind, build_args, passes, on_fail,
+                 precheck=None, on_pass=None, verdict_keys=(), independent=False,
+                 members=(), split_output=None, build_prompt=None, schema=None):
+        """
+        Args:
+            index: 节点序号（同时对应提示词序号和 finish_at_step）
+            name: 节点名称
+            call_kind: 调用方式（single/multi_ref/compare）
+            build_args: build_args(state) -> tuple，提示词之外的调用参数
+            passes: passes(output) -> bool，是否通过
+            on_fail: on_fail(output) -> NodeOutcome，未通过时的结果
+            precheck: precheck(state) -> NodeOutcome or None，调用前检查（可选）
+            on_pass: on_pass(output, state) -> NodeOutcome or None，通过后处理（可选）
+            verdict_keys: 判定所需的输出字段（可选），为空时流式调用也等待完整输出
+            independent: 调用参数是否只依赖用例本身（可选），投机模式下可提前调用
+            members: 合并节点的成员节点（可选），成员的 passes/on_fail/on_pass 用于判定
+            split_output: split_output(output) -> {成员序号: 成员输出}，合并节点必填
+            build_prompt: build_prompt(state) -> (提示词, {版本键: 版本})（可选），默认按序号查找提示词
+            schema: 输出结构（NodeSchema，可选），为空时只要求输出是非空 JSON 对象
+        """
+        self.index = index
+        self.name = name
+        self.call_kind = call_kind
+        self.build_args = build_args
+        self.passes = passes
+        self.on_fail = on_fail
+        self.precheck = precheck
+        self.on_pass = on_pass
+        self.verdict_keys = tuple(verdict_keys)
+        self.independent = independent
+        self.members = list(members)
+        self.split_output = split_output
+        self.build_prompt = build_prompt
+        self.schema = schema
+
+
+class NodeCall:
+    """一次待执行的节点调用"""
+
+    def __init__(self, node, prompt, args, reask=None):
+        """
+        Args:
+            node: NodeSpec
+            prompt: 提示词文本
+            args: 提示词之外的调用参数
+            reask: 针对性重问时为 (上一次的模型输出, 问题描述列表)
+        """
+        self.node = node
+        self.prompt = prompt
+        self.args = args
+        self.reask = reask
+        self.started = False  # 是否已发出模型请求
+        self.discarded = False  # 投机调用的结果是否已被丢弃
+        self.ctx = None  # 投机调用的节点上下文（见 speculate）
+        self._lock = threading.Lock()
+
+    def speculate(self, state):
+        """标记为投机调用：调用的记录暂存到结果被使用（use）或丢弃（discard）时再计入"""
+        self.ctx = state.ctx.for_speculative_node(self.index, self.node.verdict_keys, self.node.schema)
+
+    def start(self):
+        """
+        发出模型请求前调用，结果已被丢弃的投机调用不再发出
+
+        Returns:
+            bool: 是否可以发出请求
+        """
+        with self._lock:
+            if self.discarded:
+                return False
+            self.started = True
+            return True
+
+    def discard(self):
+        """
+        丢弃投机调用的结果
+
+        Returns:
+            bool: 请求是否已经发出（计为浪费的调用）
+        """
+        with self._lock:
+            self.discarded = True
+            started = self.started
+        self.ctx.resolve(used=False)
+        return started
+
+    def use(self):
+        """投机调用的结果被使用，暂存的记录计入节点指标"""
+        self.ctx.resolve(used=True)
+
+    @property
+    def index(self):
+        """节点序号"""
+        return self.node.index
+
+    def node_ctx(self, state):
+        """本次调用使用的节点上下文"""
+        if self.ctx is not None:
+            return self.ctx
+        return state.ctx.for_node(self.index, self.node.verdict_keys, self.node.schema)
+
+
+class RunState:
+    """单个用例的流水线运行状态，节点可在其上存放中间值（如匹配的参考图）"""
+
+    def __init__(self, case_data, ref_data, prompts, model_config, ctx):
+        """
+        Args:
+            case_data: 测试用例数据（dict）
+            ref_data: 参考图数据（dict）
+            prompts: 提示词字典 {1: {...}, 2: {...}, ...}
+            model_config: 模型配置摘要
+            ctx: 用例调用上下文（CallContext）
+        """
+        self.case_data = case_data
+        self.ref_data = ref_data
+        self.case_url = case_data['case_url']
+        self.prompts = prompts
+        self.model_config = model_config
+        self.ctx = ctx
+        self.prompt_versions = {}
+        self.node_outputs = {}
+
+
+class Pipeline:
+    """节点流水线"""
+
+    def __init__(self, nodes, success_reason):
+        """
+        Args:
+            nodes: 有序的 NodeSpec 列表
+            success_reason: 所有节点通过时的原因说明
+        """
+        self.nodes = list(nodes)
+        self.success_reason = success_reason
+
+    def _result(self, final_pass, step, parse_output, reason, state):
+        """构建工作流结果"""
+        return {
+            "final_pass": final_pass,
+            "finish_at_step": step,
+            "parse_output": parse_output,
+            "reason": reason,
+            "prompt_versions": state.prompt_versions,
+            "model_config": state.model_config
+        }
+
+    def _outcome_result(self, outcome, node, output, state):
+        """将 NodeOutcome 转换为工作流结果"""
+        parse_output = outcome.parse_output if outcome.parse_output is not None else output
+        return self._result(outcome.final_pass, node.index, parse_output, outcome.reason, state)
+
+    def _prompt(self, node, state):
+        """
+        获取节点提示词并记录版本
+
+        Returns:
+            str: 提示词文本，缺失时为空字符串
+        """
+        if node.build_prompt is not None:
+            prompt, versions = node.build_prompt(state)
+            state.prompt_versions.update(versions)
+            return prompt
+        p_data = state.prompts.get(node.index, {})
+        state.prompt_versions[f"p{node.index}"] = p_data.get('prompt_version', "unknown")
+        return p_data.get('prompt_content', "")
+
+    def _judge(self, node, output, state):
+        """
+        判定单个节点的输出
+
+        Returns:
+            dict or None: 节点给出最终结果时返回工作流结果，继续执行下一节点时返回 None
+        """
+        state.node_outputs[str(node.index)] = output
+
+        if not node.passes(output):
+            return self._outcome_result(node.on_fail(output), node, output, state)
+
+        if node.on_pass is not None:
+            outcome = node.on_pass(output, state)
+            if outcome is not None:
+                return self._outcome_result(outcome, node, output, state)
+        return None
+
+    def _parse_error(self, step, response, state, problems=None):
+        """模型输出无法解析或不符合输出结构时的结果"""
+        if problems and problems != [so.PARSE_FAILED]:
+            return self._result(
+                "error", step,
+                {"error": "Schema validation failed", "problems": problems, "raw_response": str(response)[:200]},
+                f"Node{step} 输出不符合格式要求",
+                state
+            )
+        return self._result(
+            "error", step,
+            {"error": "Failed to parse JSON", "raw_response": str(response)[:200]},
+            f"Node{step} JSON解析失败",
+            state
+        )
+
+    def speculative_calls(self, call, state):
+        """
+        可与当前调用同时发起的后续调用
+
+        当前节点和其后连续的独立节点（无前置检查、提示词存在）可以提前调用
+
+        Args:
+            call: 当前 NodeCall
+            state: RunState
+
+        Returns:
+            list: 后续节点的 NodeCall 列表
+        """
+        if not call.node.independent:
+            return []
+        calls = []
+        for node in self.nodes[self.nodes.index(call.node) + 1:]:
+            if not node.independent or node.precheck is not None:
+                break
+            prompt = state.prompts.get(node.index, {}).get('prompt_content', "")
+            if not prompt:
+                break
+            calls.append(NodeCall(node, prompt, node.build_args(state)))
+        return calls
+
+    def steps(self, state, parse_output):
+        """
+        流水线步骤生成器
+
+        每个节点需要调用模型时 yield NodeCall，由执行器把模型返回文本
+        （或调用失败的 ModelCallError）send 回来；结束时通过 return 返回结果。
+        输出不符合节点结构时再 yield 一个带 reask 的 NodeCall（最多 MAX_REASKS 次）
+
+        Args:
+            state: RunState
+            parse_output: parse_output(response, schema) -> (输出或 None, 问题描述列表)
+
+        Returns:
+            dict: 工作流结果
+        """
+        output = None
+        for node in self.nodes:
+            i = node.index
+
+            if node.precheck is not None:
+                outcome = node.precheck(state)
+                if outcome is not None:
+                    return self._outcome_result(outcome, node, None, state)
+
+            prompt = self._prompt(node, state)
+            if not prompt:
+                label = f"{node.members[0].index}-{node.members[-1].index}" if node.members else i
+                return self._result(
+                    "error", i, {"error": f"Prompt {label} not found"}, f"缺少Node{label}提示词", state
+                )
+
+            args = node.build_args(state)
+            response = yield NodeCall(node, prompt, args)
+            reasks = 0
+            while True:
+                if isinstance(response, rp.ModelCallError):
+                    return self._result(
+                        "error", i,
+                        {"error": str(response), "error_type": response.kind},
+                        f"Node{i} 模型调用失败（{response.kind}）",
+                        state
+                    )
+                output, problems = parse_output(response, node.schema)
+                if not problems:
+                    break
+                if reasks >= so.MAX_REASKS:
+                    return self._parse_error(i, response, state, problems)
+                # 只有不符合结构的输出才重问：原对话后追加上一次的输出和具体问题
+                reasks += 1
+                response = yield NodeCall(node, prompt, args, reask=(response, problems))
+
+            if not node.members:
+                result = self._judge(node, output, state)
+                if result is not None:
+                    return result
+                continue
+
+            # 合并节点：先保存所有成员的输出（供复用），再按成员顺序判定
+            member_outputs = node.split_output(output)
+            for member in node.members:
+                if isinstance(member_outputs.get(member.index), dict):
+                    state.node_outputs[str(member.index)] = member_outputs[member.index]
+            for member in node.members:
+                output = member_outputs.get(member.index)
+                if not isinstance(output, dict) or not output:
+                    return self._parse_error(member.index, response, state)
+                result = self._judge(member, output, state)
+                if result is not None:
+                    return result
+
+        return self._result("yes", self.nodes[-1].index, output, self.success_reason, state)
+
+
+# ==================== 执行器与钩子 ====================
+
+class PipelineHook:
+    """
+    执行器钩子基类
+
+    before_call 返回非 None 时跳过模型调用，直接使用返回值作为模型输出；
+    after_call 在每次调用结束后执行（包括被 before_call 短路的调用）；
+    针对性重问（call.reask 不为 None）同样经过钩子
+    """
+
+    def before_call(self, call, state):
+        """
+        调用前执行
+
+        Args:
+            call: NodeCall
+            state: RunState
+
+        Returns:
+            str or None: 替代模型输出的文本
+        """
+        return None
+
+    def after_call(self, call, state, response, elapsed_ms, skipped):
+        """
+        调用后执行
+
+        Args:
+            call: NodeCall
+            state: RunState
+            response: 模型输出文本或 ModelCallError
+            elapsed_ms: 调用耗时（毫秒）
+            skipped: 是否被 before_call 短路
+        """
+
+
+class TimingHook(PipelineHook):
+    """记录每个节点的总耗时到 state.ctx 的节点指标（wall_ms）"""
+
+    def after_call(self, call, state, response, elapsed_ms, skipped):
+        state.ctx.record_wall(call.index, elapsed_ms)
+
+
+def _speculation_pool():
+    """同步模式下投机调用共用的线程池（首次使用时创建）"""
+    global _speculation_executor
+    with _speculation_lock:
+        if _speculation_executor is None:
+            _speculation_executor = ThreadPoolExecutor(
+                max_workers=SPECULATIVE_WORKERS, thread_name_prefix="speculative"
+            )
+        return _speculation_executor
+
+
+_speculation_executor = None
+_speculation_lock = threading.Lock()
+
+
+class NodeExecutor:
+    """节点执行器：驱动流水线并发起模型调用"""
+
+    def __init__(self, client, hooks=(), speculative=False):
+        """
+        Args:
+            client: 模型客户端（ModelClient）
+            hooks: PipelineHook 列表，按顺序执行
+            speculative: 是否提前并行调用连续的独立节点
+        """
+        self.client = client
+        self.hooks = list(hooks)
+        self.speculative = speculative
+
+    def _before(self, call, state):
+        """依次执行 before_call，返回第一个非 None 的替代输出"""
+        for hook in self.hooks:
+            response = hook.before_call(call, state)
+            if response is not None:
+                return response
+        return None
+
+    def _after(self, call, state, response, elapsed_ms, skipped):
+        """依次执行 after_call"""
+        for hook in self.hooks:
+            hook.after_call(call, state, response, elapsed_ms, skipped)
+
+    def _invoke(self, call, state):
+        """
+        执行一次节点调用（before_call 可短路）
+
+        Returns:
+            tuple: (模型输出文本或 ModelCallError, 是否被短路, 开始时间, 结束时间)
+        """
+        start = time.perf_counter()
+        response = self._before(call, state)
+        skipped = response is not None
+        if not skipped and call.start():
+            try:
+                if call.reask is not None:
+                    response = self.client.reask(
+                        call.node.call_kind, call.prompt, call.args, *call.reask, ctx=call.node_ctx(state)
+                    )
+                else:
+                    method = getattr(self.client, f"call_{call.node.call_kind}")
+                    response = method(call.prompt, *call.args, ctx=call.node_ctx(state))
+            except rp.ModelCallError as e:
+                response = e
+        return response, skipped, start, time.perf_counter()
+
+    async def _invoke_async(self, call, state):
+        """异步执行一次节点调用，返回值与 _invoke 一致"""
+        start = time.perf_counter()
+        response = self._before(call, state)
+        skipped = response is not None
+        if not skipped and call.start():
+            try:
+                if call.reask is not None:
+                    response = await self.client.reask_async(
+                        call.node.call_kind, call.prompt, call.args, *call.reask, ctx=call.node_ctx(state)
+                    )
+                else:
+                    method = getattr(self.client, f"call_{call.node.call_kind}_async")
+                    response = await method(call.prompt, *call.args, ctx=call.node_ctx(state))
+            except rp.ModelCallError as e:
+                response = e
+        return response, skipped, start, time.perf_counter()
+
+    def _record_consumed(self, state, needed_at, invoked):
+        """
+        记录一次被使用的投机调用节省的耗时
+
+        顺序执行时该调用在 needed_at 才会开始，节省的耗时为提前执行的部分
+
+        Returns:
+            tuple: (response, skipped, elapsed_ms)
+        """
+        response, skipped, start, end = invoked
+        state.ctx.record_speculation(calls=1, saved_ms=max(0.0, (min(end, needed_at) - start) * 1000))
+        return response, skipped, (end - start) * 1000
+
+    def run(self, pipeline, state):
+        """
+        同步执行流水线
+
+        Args:
+            pipeline: Pipeline
+            state: RunState
+
+        Returns:
+            dict: 工作流结果
+        """
+        steps = pipeline.steps(state, self.client.parse_structured)
+        pending = {}
+        try:
+            call = next(steps)
+            while True:
+                if self.speculative and call.reask is None and call.index not in pending:
+                    for extra in pipeline.speculative_calls(call, state):
+                        extra.speculate(state)
+                        pending[extra.index] = (extra, _speculation_pool().submit(self._invoke, extra, state))
+                extra, future = pending.pop(call.index, (None, None))
+                if future is not None and not future.cancel():
+                    response, skipped, elapsed_ms = self._record_consumed(
+                        state, time.perf_counter(), future.result()
+                    )
+                    extra.use()
+                else:
+                    # 投机调用还在排队时直接在当前线程执行，避免线程池繁忙时比顺序执行更慢
+                    response, skipped, start, end = self._invoke(call, state)
+                    elapsed_ms = (end - start) * 1000
+                self._after(call, state, response, elapsed_ms, skipped)
+                call = steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            # 前面的节点已给出结论：取消尚未开始的投机调用，已发出的调用结果丢弃
+            started = []
+            for extra, future in pending.values():
+                future.cancel()
+                if extra.discard():
+                    started.append(future)
+            state.ctx.record_speculation(calls=len(started), wasted=len(started))
+            # 已发出的请求无法中止，等待其结束，使消耗的令牌计入本用例的统计
+            wait_futures(started)
+
+    async def run_async(self, pipeline, state):
+        """
+        异步执行流水线（钩子和投机逻辑与 run 一致，未使用的投机调用直接取消）
+
+        Args:
+            pipeline: Pipeline
+            state: RunState
+
+        Returns:
+            dict: 工作流结果
+        """
+        steps = pipeline.steps(state, self.client.parse_structured)
+        pending = {}
+        try:
+            call = next(steps)
+            while True:
+                if self.speculative and call.reask is None and call.index not in pending:
+                    for extra in pipeline.speculative_calls(call, state):
+                        extra.speculate(state)
+                        task = asyncio.ensure_future(self._invoke_async(extra, state))
+                        # 被丢弃的调用失败时不产生 "exception was never retrieved" 警告
+                        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                        pending[extra.index] = (extra, task)
+                extra, task = pending.pop(call.index, (None, None))
+                if task is not None:
+                    needed_at = time.perf_counter()
+                    response, skipped, elapsed_ms = self._record_consumed(state, needed_at, await task)
+                    extra.use()
+                else:
+                    response, skipped, start, end = await self._invoke_async(call, state)
+                    elapsed_ms = (end - start) * 1000
+                self._after(call, state, response, elapsed_ms, skipped)
+                call = steps.send(response)
+        except StopIteration as stop:
+            return stop.value
+        finally:
+            wasted = 0
+            for extra, task in pending.values():
+                task.cancel()
+                wasted += extra.discard()
+            state.ctx.record_speculation(calls=wasted, wasted=wasted)
@@ -0,0 +1,345 @@
+"""
+限流模块
+
+按模型配置（config_id + model_id）维护进程级共享的令牌桶限流器，
+同时限制每分钟请求数（RPM）和每分钟令牌数（TPM）
+
+设计说明：
+- 同一配置的所有 ModelClient、所有并发任务共享同一个限流器
+- 采用"预约"方式取令牌：请求在锁内按到达顺序扣减额度并计算可执行时间，
+  锁外等待，因此多个任务按先来先到公平分配额度，不会集中触发429
+- 请求发出前按消息内容估算令牌数，返回后用实际 usage 修正 TPM 桶
+"""
+import math
+import time
+import asyncio
+import threading
+
+# ==================== 限流配置 ====================
+BURST_SECONDS = 10  # 令牌桶容量对应的时间窗口（秒），即最多允许突发10秒的额度
+IMAGE_TOKEN_ESTIMATE = 1000  # 普通图片的估算令牌数
+HIGH_DETAIL_IMAGE_TOKEN_ESTIMATE = 2500  # detail=high 图片的估算令牌数
+LOW_DETAIL_IMAGE_TOKEN_ESTIMATE = 300  # detail=low 图片的估算令牌数
+DEFAULT_COMPLETION_TOKEN_ESTIMATE = 200  # 预估输出令牌数
+
+
+def _parse_limit(value):
+    """
+    解析配置中的限额值
+
+    Args:
+        value: 配置值（可能为空、NaN、字符串）
+
+    Returns:
+        float: 每分钟限额，0 表示不限制
+    """
+    try:
+        limit = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if math.isnan(limit) or limit <= 0:
+        return 0.0
+    return limit
+
+
+class TokenBucket:
+    """令牌桶（线程安全，支持预约式扣减）"""
+
+    def __init__(self, per_minute):
+        """
+        初始化令牌桶
+
+        Args:
+            per_minute: 每分钟补充的令牌数，0 表示不限制
+        """
+        self._lock = threading.Lock()
+        self._updated_at = time.monotonic()
+        self._tokens = 0.0
+        self.rate = 0.0
+        self.capacity = 0.0
+        self.set_rate(per_minute)
+        self._tokens = self.capacity
+
+    def set_rate(self, per_minute):
+        """
+        更新令牌补充速率（配置变更时调用）
+
+        Args:
+            per_minute: 每分钟补充的令牌数，0 表示不限制
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.per_minute = per_minute
+            self.rate = per_minute / 60.0
+            self.capacity = max(1.0, self.rate * BURST_SECONDS) if per_minute > 0 else 0.0
+            self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self, now):
+        """按流逝时间补充令牌（调用方需持有锁）"""
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    def reserve(self, amount):
+        """
+        预约令牌
+
+        立即扣减额度（允许为负），返回需要等待的秒数；
+        额度不足时后到的请求需要等待更久，保证先来先到
+
+        Args:
+            amount: 需要的令牌数
+
+        Returns:
+            float: 需要等待的秒数
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_reserve(self, amount):
+        """
+        额度充足时立即扣减，否则不扣减
+
+        Args:
+            amount: 需要的令牌数
+
+        Returns:
+            bool: 是否扣减成功
+        """
+        if self.per_minute <= 0:
+            return True
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+    def adjust(self, delta):
+        """
+        修正令牌余额（实际用量与预估不一致时使用）
+
+        Args:
+            delta: 额外消耗的令牌数（负数表示归还）
+        """
+        if self.per_minute <= 0 or delta == 0:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens - delta)
+
+    def available(self):
+        """
+        获取当前可用令牌数
+
+        Returns:
+            float: 当前可用令牌数（不限制时返回 inf）
+        """
+        if self.per_minute <= 0:
+            return math.inf
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class RateLimiter:
+    """单个模型配置的限流器（RPM + TPM）"""
+
+    def __init__(self, key, rpm=0, tpm=0):
+        """
+        初始化限流器
+
+        Args:
+            key: 限流器标识 (config_id, model_id)
+            rpm: 每分钟请求数上限，0 表示不限制
+            tpm: 每分钟令牌数上限，0 表示不限制
+        """
+        self.key = key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.total_wait_seconds = 0.0
+        self.throttled_requests = 0
+        self._stats_lock = threading.Lock()
+
+    def update_limits(self, rpm, tpm):
+        """
+        更新限额
+
+        Args:
+            rpm: 每分钟请求数上限
+            tpm: 每分钟令牌数上限
+        """
+        if rpm != self.requests.per_minute:
+            self.requests.set_rate(rpm)
+        if tpm != self.tokens.per_minute:
+            self.tokens.set_rate(tpm)
+
+    def _reserve(self, estimated_tokens):
+        """预约一次请求所需的额度，返回等待秒数（内部方法）"""
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+        if wait > 0:
+            with self._stats_lock:
+                self.total_wait_seconds += wait
+                self.throttled_requests += 1
+        return wait
+
+    def acquire(self, estimated_tokens=0):
+        """
+        阻塞等待直到可以发送请求
+
+        Args:
+            estimated_tokens: 预估的请求令牌数
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def try_acquire(self, estimated_tokens=0):
+        """
+        不等待地获取一次请求额度（用于可选的额外请求，如对冲）
+
+        Args:
+            estimated_tokens: 预估的请求令牌数
+
+        Returns:
+            bool: 当前额度充足并已扣减时返回 True
+        """
+        if not self.requests.try_reserve(1):
+            return False
+        if not self.tokens.try_reserve(estimated_tokens):
+            self.requests.adjust(-1)
+            return False
+        return True
+
+    async def acquire_async(self, estimated_tokens=0):
+        """
+        异步等待直到可以发送请求
+
+        Args:
+            estimated_tokens: 预估的请求令牌数
+
+        Returns:
+            float: 实际等待的秒数
+        """
+        wait = self._reserve(estimated_tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """
+        用实际令牌用量修正 TPM 桶
+
+        Args:
+            estimated_tokens: 请求前预估的令牌数
+            actual_tokens: 响应 usage 中的实际令牌数（None 表示未知）
+        """
+        if actual_tokens is None:
+            return
+        self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def get_stats(self):
+        """
+        获取限流器状态
+
+        Returns:
+            dict: 限额、可用额度和累计等待信息
+        """
+        with self._stats_lock:
+            return {
+                "config_id": self.key[0],
+                "model_id": self.key[1],
+                "rpm": self.requests.per_minute,
+                "tpm": self.tokens.per_minute,
+                "available_requests": self.requests.available(),
+                "available_tokens": self.tokens.available(),
+                "throttled_requests": self.throttled_requests,
+                "total_wait_seconds": round(self.total_wait_seconds, 3)
+            }
+
+
+# ==================== 进程级注册表 ====================
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(config):
+    """
+    获取模型配置对应的共享限流器
+
+    同一 (config_id, model_id) 在进程内只有一个限流器；
+    配置中的 rpm/tpm 变化时会同步更新限额
+
+    Args:
+        config: 模型配置字典（可包含 rpm、tpm 字段）
+
+    Returns:
+        RateLimiter: 共享限流器
+    """
+    key = (str(config.get('config_id', '')), str(config.get('model_id', '')))
+    rpm = _parse_limit(config.get('rpm'))
+    tpm = _parse_limit(config.get('tpm'))
+
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(key, rpm, tpm)
+            _limiters[key] = limiter
+        else:
+            limiter.update_limits(rpm, tpm)
+        return limiter
+
+
+def get_all_stats():
+    """
+    获取所有限流器的状态
+
+    Returns:
+        list: 每个限流器的状态字典
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return [limiter.get_stats() for limiter in limiters]
+
+
+def estimate_tokens(messages):
+    """
+    粗略估算一次请求消耗的令牌数（用于 TPM 预约）
+
+    中文文本按每字符约1个令牌估算，图片按固定值估算，并加上预估输出令牌数
+
+    Args:
+        messages: 完整的消息列表
+
+    Returns:
+        int: 估算的令牌数
+    """
+    total = DEFAULT_COMPLETION_TOKEN_ESTIMATE
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, str):
+            total += len(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                total += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                detail = part.get("image_url", {}).get("detail")
+                if detail == "high":
+                    total += HIGH_DETAIL_IMAGE_TOKEN_ESTIMATE
+                elif detail == "low":
+                    total += LOW_DETAIL_IMAGE_TOKEN_ESTIMATE
+                else:
+                    total += IMAGE_TOKEN_ESTIMATE
+    return total
@@ -0,0 +1,173 @@
+"""
+参考图集合模块
+
+同一车型的所有用例共用同一组参考图（1-5张），RefSetRegistry 在任务内为每个车型的
+每个参考图版本只准备一次 RefSet，供该车型所有用例复用：
+- 校验：按 ref_url_1 ~ ref_url_5 顺序提取有效URL（以 http 开头）
+- 预取：所有参考图集合的图片统一预取一次，失效的参考图从集合中移除
+- 编码：节点4消息的参考图前缀（说明文字 + 参考图）只构建一次，
+  以 data URL 发送时每张参考图（每种预处理参数）只编码一次
+
+相同车型的用例发送的节点4消息前缀（系统提示词 + 参考图）完全一致，
+配合按车型分组调度，可命中模型服务端的前缀/上下文缓存
+
+RefSet 可作为有序URL序列使用（len / 下标 / 迭代 / in）
+"""
+import threading
+from . import node_memo as nm
+
+MAX_REF_IMAGES = 5  # 每个车型最多参考图数
+
+
+def ordered_ref_urls(ref_data):
+    """
+    按顺序提取有效的参考图URL
+
+    Args:
+        ref_data: 参考图数据（dict）
+
+    Returns:
+        list: 参考图URL列表（ref_url_1 ~ ref_url_5 中以 http 开头的）
+    """
+    urls = []
+    for i in range(1, MAX_REF_IMAGES + 1):
+        u = ref_data.get(f'ref_url_{i}')
+        if u and str(u).strip() and str(u).startswith('http'):
+            urls.append(u)
+    return urls
+
+
+class RefSet:
+    """单个车型的参考图集合（线程安全）"""
+
+    def __init__(self, car, urls):
+        """
+        Args:
+            car: 车型
+            urls: 有序参考图URL列表
+        """
+        self.car = car
+        self.urls = list(urls)
+        self.hash = nm.ref_hash(self.urls)
+        self.unavailable = {}  # 预取失败被移除的参考图 {url: 原因}
+        self._prefix = None
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_ref_data(cls, car, ref_data):
+        """从参考图数据（refs.csv 的一行）创建"""
+        return cls(car, ordered_ref_urls(ref_data))
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __getitem__(self, index):
+        return self.urls[index]
+
+    def __iter__(self):
+        return iter(self.urls)
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def drop_unavailable(self, failures):
+        """
+        移除预取失败的参考图
+
+        Args:
+            failures: {url: 失败原因}
+        """
+        with self._lock:
+            dead = [u for u in self.urls if u in failures]
+            if not dead:
+                return
+            for url in dead:
+                self.unavailable[url] = failures[url]
+            self.urls = [u for u in self.urls if u not in failures]
+            self.hash = nm.ref_hash(self.urls)
+            self._prefix = None
+
+    def prefix_content(self):
+        """
+        节点4用户消息的参考图前缀（只构建一次，调用方不得修改）
+
+        Returns:
+            list: [说明文字, 参考图1, ..., 参考图N] 消息内容
+        """
+        with self._lock:
+            if self._prefix is None:
+                self._prefix = [{"type": "text", "text": f"下面{len(self.urls)}张图片为参考图"}]
+                self._prefix += [{"type": "image_url", "image_url": {"url": url}} for url in self.urls]
+            return self._prefix
+
+    def data_url(self, url, settings_key, cache):
+        """
+        获取参考图的 data URL（每张图每种预处理参数只编码一次）
+
+        Args:
+            url: 参考图URL
+            settings_key: 预处理参数标识（None 表示原图）
+            cache: ImageCache
+
+        Returns:
+            str or None: data URL，未缓存时返回 None
+        """
+        key = (url, settings_key)
+        with self._lock:
+            if key in self._encoded:
+                return self._encoded[key]
+        encoded = cache.data_url(url, settings_key)
+        if encoded is not None:
+            with self._lock:
+                self._encoded[key] = encoded
+        return encoded
+
+
+class RefSetRegistry:
+    """任务内的参考图集合注册表：每个 (车型, 参考图版本) 只准备一次"""
+
+    def __init__(self):
+        self._sets = {}
+        self._lock = threading.Lock()
+
+    def get(self, car, ref_data):
+        """
+        获取车型的参考图集合，不存在时创建
+
+        参考图URL变化（refs.csv 被修改）视为新版本，创建新的集合
+
+        Args:
+            car: 车型
+            ref_data: 参考图数据（dict）
+
+        Returns:
+            RefSet: 参考图集合
+        """
+        urls = ordered_ref_urls(ref_data)
+        key = (car, nm.ref_hash(urls))
+        with self._lock:
+            if key not in self._sets:
+                self._sets[key] = RefSet(car, urls)
+            return self._sets[key]
+
+    def ref_sets(self):
+        """所有参考图集合"""
+        with self._lock:
+            return list(self._sets.values())
+
+    def prefetch(self, cache):
+        """
+        预取所有参考图集合的图片，并移除失效的参考图
+
+        Args:
+            cache: ImageCache
+
+        Returns:
+            dict: {url: 失败原因}
+        """
+        ref_sets = self.ref_sets()
+        failures = cache.prefetch([url for ref_set in ref_sets for url in ref_set])
+        for ref_set in ref_sets:
+            ref_set.drop_unavailable(failures)
+        return failures
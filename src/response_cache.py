@@ -0,0 +1,232 @@
+"""
+模型响应缓存模块
+
+基于 SQLite 的持久化响应缓存，相同请求（模型、思考模式、系统提示词、图片、文本）
+直接返回上次的模型输出，避免修改单个节点提示词后重跑时重复调用其他节点
+
+缓存键由以下内容计算 SHA-256：
+- model_id、thinking_mode
+- 系统提示词的哈希（节点5的参考图描述已替换进系统提示词）
+- 用户消息中的文本和图片URL（含 detail 参数），按原顺序
+
+淘汰策略：按最近访问时间的 LRU，总大小超过 CACHE_MAX_BYTES 或条目数超过
+CACHE_MAX_ENTRIES 时淘汰最久未访问的条目
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# 获取项目路径
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(CURRENT_DIR)
+CACHE_DIR = os.path.join(PROJECT_ROOT, "data", "cache")
+CACHE_FILE = os.path.join(CACHE_DIR, "response_cache.sqlite")
+
+# ==================== 缓存配置 ====================
+CACHE_ENABLED = True  # 是否启用响应缓存
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # 缓存最大总大小（字节）
+CACHE_MAX_ENTRIES = 200000  # 缓存最大条目数
+EVICTION_CHECK_INTERVAL = 100  # 每写入多少条检查一次是否需要淘汰
+
+
+def _sha256(text):
+    """计算文本的 SHA-256 十六进制摘要"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(model_id, thinking_mode, messages):
+    """
+    计算请求的缓存键
+
+    Args:
+        model_id: 模型ID
+        thinking_mode: 思考模式
+        messages: 完整的消息列表
+
+    Returns:
+        str: 缓存键（SHA-256 十六进制）
+    """
+    parts = []
+    for message in messages:
+        content = message.get("content", "")
+        if message.get("role") == "system":
+            parts.append(["system", _sha256(content)])
+        elif isinstance(content, str):
+            parts.append([message.get("role"), content])
+        else:
+            for part in content:
+                if part.get("type") == "image_url":
+                    image = part.get("image_url", {})
+                    parts.append(["image", image.get("url", ""), image.get("detail", "")])
+                else:
+                    parts.append(["text", part.get("text", "")])
+
+    fingerprint = json.dumps(
+        {"model_id": str(model_id), "thinking_mode": str(thinking_mode), "parts": parts},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return _sha256(fingerprint)
+
+
+class ResponseCache:
+    """SQLite 响应缓存（线程安全）"""
+
+    def __init__(self, path=CACHE_FILE, max_bytes=CACHE_MAX_BYTES, max_entries=CACHE_MAX_ENTRIES):
+        """
+        初始化响应缓存
+
+        Args:
+            path: SQLite 文件路径
+            max_bytes: 缓存最大总大小（字节）
+            max_entries: 缓存最大条目数
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                cache_key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """
+        读取缓存
+
+        Args:
+            key: 缓存键
+
+        Returns:
+            str or None: 缓存的模型输出，未命中返回 None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM responses WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE responses SET last_access = ? WHERE cache_key = ?", (time.time(), key)
+            )
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        """
+        写入缓存
+
+        Args:
+            key: 缓存键
+            response: 模型输出文本
+        """
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (cache_key, response, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now)
+            )
+            self._conn.commit()
+            self.writes += 1
+            if self.writes % EVICTION_CHECK_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        """按 LRU 淘汰超出限额的条目（调用方需持有锁）"""
+        count, total_size = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if count <= self.max_entries and total_size <= self.max_bytes:
+            return
+
+        # 淘汰到限额的 90%，避免频繁触发
+        target_count = int(self.max_entries * 0.9)
+        target_size = int(self.max_bytes * 0.9)
+        cursor = self._conn.execute("SELECT cache_key, size FROM responses ORDER BY last_access ASC")
+        to_delete = []
+        for cache_key, size in cursor:
+            if count <= target_count and total_size <= target_size:
+                break
+            to_delete.append((cache_key,))
+            count -= 1
+            total_size -= size
+
+        self._conn.executemany("DELETE FROM responses WHERE cache_key = ?", to_delete)
+        self._conn.commit()
+        self.evictions += len(to_delete)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def get_stats(self):
+        """
+        获取缓存统计
+
+        Returns:
+            dict: 命中/未命中/写入/淘汰次数、命中率、条目数和总大小
+        """
+        with self._lock:
+            count, total_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups > 0 else 0,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "entries": count,
+                "size_bytes": total_size,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes
+            }
+
+
+# ==================== 全局缓存实例 ====================
+_global_cache = None
+_global_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """
+    获取全局响应缓存实例
+
+    Returns:
+        ResponseCache or None: 缓存实例，未启用时返回 None
+    """
+    global _global_cache
+
+    if not CACHE_ENABLED:
+        return None
+
+    with _global_cache_lock:
+        if _global_cache is None:
+            _global_cache = ResponseCache()
+
+    return _global_cache
@@ -0,0 +1,278 @@
+"""
+模型调用错误分类与重试策略模块
+
+将SDK/HTTP异常归类为带类型的错误，并提供指数退避+抖动的重试策略：
+- RateLimitedError: 429 限流（可重试，优先遵循 Retry-After）
+- ModelTimeoutError: 超时或连接失败（可重试）
+- ServerError: 5xx 服务端错误（可重试）
+- AuthError: 401/403 鉴权失败（不可重试）
+- BadRequestError: 其他 4xx 请求错误（不可重试）
+- CircuitOpenError: 服务端点已熔断，未发出请求（不可重试，见 circuit_breaker）
+
+每个用例有独立的重试预算（RetryBudget），避免单个用例无限重试拖慢整个任务
+"""
+import math
+import random
+import threading
+import httpx
+
+# ==================== 默认重试配置 ====================
+DEFAULT_MAX_RETRIES = 3  # 单次调用最大重试次数
+DEFAULT_BASE_DELAY = 1.0  # 首次重试的基础等待时间（秒）
+DEFAULT_MAX_DELAY = 30.0  # 单次重试最大等待时间（秒）
+DEFAULT_CASE_RETRY_BUDGET = 6  # 单个用例所有节点累计的最大重试次数
+
+
+# ==================== 错误类型 ====================
+
+class ModelCallError(Exception):
+    """模型调用错误基类"""
+
+    kind = "unknown"
+    retryable = False
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        """
+        初始化错误
+
+        Args:
+            message: 错误信息
+            status_code: HTTP 状态码（如有）
+            retry_after: 服务端建议的重试等待秒数（如有）
+        """
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RateLimitedError(ModelCallError):
+    """429 限流"""
+
+    kind = "rate_limited"
+    retryable = True
+
+
+class ModelTimeoutError(ModelCallError):
+    """请求超时或连接失败"""
+
+    kind = "timeout"
+    retryable = True
+
+
+class ServerError(ModelCallError):
+    """5xx 服务端错误"""
+
+    kind = "server_error"
+    retryable = True
+
+
+class AuthError(ModelCallError):
+    """401/403 鉴权失败"""
+
+    kind = "auth"
+    retryable = False
+
+
+class BadRequestError(ModelCallError):
+    """其他 4xx 请求错误"""
+
+    kind = "bad_request"
+    retryable = False
+
+
+class CircuitOpenError(ModelCallError):
+    """服务端点已熔断，请求被快速拒绝"""
+
+    kind = "circuit_open"
+    retryable = False
+
+
+def _get_status_code(exc):
+    """从异常中读取 HTTP 状态码（兼容 Ark SDK 和 httpx 异常）"""
+    status_code = getattr(exc, "status_code", None)
+    if status_code is None:
+        response = getattr(exc, "response", None)
+        status_code = getattr(response, "status_code", None)
+    return status_code if isinstance(status_code, int) else None
+
+
+def _get_retry_after(exc):
+    """从异常响应头中读取 Retry-After 秒数"""
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        value = float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+    return value if value >= 0 and not math.isnan(value) else None
+
+
+def classify_error(exc):
+    """
+    将任意异常归类为 ModelCallError
+
+    Args:
+        exc: 原始异常
+
+    Returns:
+        ModelCallError: 带类型的错误
+    """
+    if isinstance(exc, ModelCallError):
+        return exc
+
+    message = f"{type(exc).__name__}: {exc}"
+    status_code = _get_status_code(exc)
+
+    if status_code is not None:
+        if status_code == 429:
+            return RateLimitedError(message, status_code, _get_retry_after(exc))
+        if status_code in (401, 403):
+            return AuthError(message, status_code)
+        if status_code == 408:
+            return ModelTimeoutError(message, status_code)
+        if status_code >= 500:
+            return ServerError(message, status_code, _get_retry_after(exc))
+        if status_code >= 400:
+            return BadRequestError(message, status_code)
+
+    # 无状态码：根据异常类型判断超时/连接错误（Ark SDK 异常与 httpx 异常命名一致）
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError, TimeoutError, ConnectionError)):
+        return ModelTimeoutError(message)
+    type_name = type(exc).__name__
+    if "Timeout" in type_name or "Connection" in type_name:
+        return ModelTimeoutError(message)
+
+    return ModelCallError(message, status_code)
+
+
+# ==================== 重试策略 ====================
+
+def _config_number(config, key, default, cast=float):
+    """读取配置中的数值字段，空值或非法值使用默认值"""
+    try:
+        value = float(config.get(key))
+    except (TypeError, ValueError):
+        return default
+    if math.isnan(value) or value < 0:
+        return default
+    return cast(value)
+
+
+class RetryPolicy:
+    """指数退避 + 全抖动（full jitter）重试策略"""
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, multiplier=2.0):
+        """
+        初始化重试策略
+
+        Args:
+            max_retries: 单次调用最大重试次数
+            base_delay: 首次重试的基础等待时间（秒）
+            max_delay: 单次重试最大等待时间（秒）
+            multiplier: 退避倍数
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        从模型配置创建重试策略
+
+        Args:
+            config: 模型配置字典（可包含 max_retries、retry_base_delay、retry_max_delay）
+
+        Returns:
+            RetryPolicy: 重试策略
+        """
+        return cls(
+            max_retries=_config_number(config, "max_retries", DEFAULT_MAX_RETRIES, int),
+            base_delay=_config_number(config, "retry_base_delay", DEFAULT_BASE_DELAY),
+            max_delay=_config_number(config, "retry_max_delay", DEFAULT_MAX_DELAY)
+        )
+
+    def should_retry(self, error, attempt):
+        """
+        判断是否应该重试
+
+        Args:
+            error: ModelCallError
+            attempt: 已重试次数（从0开始）
+
+        Returns:
+            bool: 是否重试
+        """
+        return error.retryable and attempt < self.max_retries
+
+    def compute_delay(self, attempt, error=None):
+        """
+        计算第 attempt 次重试前的等待时间
+
+        在 [0, min(max_delay, base_delay * multiplier^attempt)] 区间内随机取值；
+        服务端给出 Retry-After 时以其为下限
+
+        Args:
+            attempt: 已重试次数（从0开始）
+            error: 触发重试的错误
+
+        Returns:
+            float: 等待秒数
+        """
+        cap = min(self.max_delay, self.base_delay * (self.multiplier ** attempt))
+        delay = random.uniform(0, cap)
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class RetryBudget:
+    """单个用例的重试预算（线程安全）"""
+
+    def __init__(self, max_retries=DEFAULT_CASE_RETRY_BUDGET):
+        """
+        初始化重试预算
+
+        Args:
+            max_retries: 用例内所有节点累计允许的重试次数
+        """
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        从模型配置创建重试预算
+
+        Args:
+            config: 模型配置字典（可包含 case_retry_budget）
+
+        Returns:
+            RetryBudget: 重试预算
+        """
+        return cls(_config_number(config, "case_retry_budget", DEFAULT_CASE_RETRY_BUDGET, int))
+
+    def try_consume(self):
+        """
+        尝试消耗一次重试机会
+
+        Returns:
+            bool: 预算充足返回 True
+        """
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self):
+        """剩余重试次数"""
+        with self._lock:
+            return self.max_retries - self.used
@@ -0,0 +1,140 @@
+"""
+请求合并模块（single-flight）
+
+多个任务同时测试同一批用例、或用例表中同一 case_url 出现多次时，会同时发出完全相同的请求
+（同一模型、思考模式、提示词和图片）。响应缓存只能在第一个请求返回后才命中，
+进行中的相同请求仍会各自调用模型。按请求键（与响应缓存键相同）维护进程级的进行中请求表：
+- 第一个请求（leader）实际调用模型，结果或异常写入共享的 Future
+- 之后到达的相同请求（follower）不再调用模型，等待并共享 leader 的结果或异常
+
+leader 被取消（如任务取消、投机调用被丢弃）时不把取消传给 follower，
+follower 收到 FlightAbandoned 后重新发起（其中一个成为新的 leader）。
+线程和协程的请求可以互相合并
+"""
+import asyncio
+import threading
+from concurrent import futures
+
+
+class FlightAbandoned(Exception):
+    """leader 被取消，follower 需要重新发起请求"""
+
+
+# ==================== 进程级进行中请求表 ====================
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _join(key):
+    """
+    加入进行中的请求，不存在时登记为 leader
+
+    Returns:
+        tuple: (Future, 是否为 leader)
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = futures.Future()
+        # 标记为运行中：follower 被取消时不会连带取消共享的 Future
+        flight.set_running_or_notify_cancel()
+        _flights[key] = flight
+        return flight, True
+
+
+def _land(key, flight, result=None, error=None):
+    """leader 结束：移出进行中请求表并通知 follower"""
+    with _flights_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    if error is not None:
+        flight.set_exception(error)
+    else:
+        flight.set_result(result)
+
+
+def do(key, fn, on_shared=None):
+    """
+    执行请求，相同键的进行中请求只执行一次
+
+    Args:
+        key: 请求键
+        fn: 实际发起请求的函数（无参数）
+        on_shared: 共享他人结果时的回调（无参数，用于记录合并统计）
+
+    Returns:
+        fn 的返回值（follower 得到 leader 的返回值）
+
+    Raises:
+        fn 抛出的异常（follower 得到 leader 的异常）
+    """
+    shared = False
+    while True:
+        flight, leader = _join(key)
+        if leader:
+            break
+        if on_shared is not None and not shared:
+            on_shared()
+            shared = True
+        try:
+            return flight.result()
+        except FlightAbandoned:
+            continue
+    try:
+        result = fn()
+    except Exception as e:
+        _land(key, flight, error=e)
+        raise
+    except BaseException:
+        _land(key, flight, error=FlightAbandoned(key))
+        raise
+    _land(key, flight, result)
+    return result
+
+
+async def do_async(key, coro_fn, on_shared=None):
+    """
+    异步执行请求（逻辑与 do 一致，等待时不阻塞事件循环）
+
+    Args:
+        key: 请求键
+        coro_fn: 返回协程的函数（无参数）
+        on_shared: 共享他人结果时的回调
+
+    Returns:
+        协程的返回值
+    """
+    shared = False
+    while True:
+        flight, leader = _join(key)
+        if leader:
+            break
+        if on_shared is not None and not shared:
+            on_shared()
+            shared = True
+        try:
+            return await asyncio.wrap_future(flight)
+        except FlightAbandoned:
+            continue
+    try:
+        result = await coro_fn()
+    except Exception as e:
+        _land(key, flight, error=e)
+        raise
+    except BaseException:
+        _land(key, flight, error=FlightAbandoned(key))
+        raise
+    _land(key, flight, result)
+    return result
+
+
+def in_flight():
+    """
+    当前进行中的请求数
+
+    Returns:
+        int: 进行中请求表的大小
+    """
+    with _flights_lock:
+        return len(_flights)
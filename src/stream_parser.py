@@ -0,0 +1,90 @@
+"""
+流式输出解析模块
+
+流式调用时模型输出逐段到达，JsonObjectScanner 增量扫描文本，
+在第一个顶层 JSON 对象闭合时立即返回该对象，不需要等待后续的说明文字
+
+扫描按字符维护括号深度和字符串/转义状态，每段文本只扫描一次；
+JSON 之前的内容（如 ```json 代码块标记、前置说明）会被跳过
+"""
+import json
+
+
+class JsonObjectScanner:
+    """增量查找完整的顶层 JSON 对象"""
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        """
+        追加一段输出并继续扫描
+
+        Args:
+            chunk: 新到达的文本
+
+        Returns:
+            str or None: 下一个完整 JSON 对象的文本，尚未闭合时返回 None
+                （已到达的文本中可能还有更多对象，可用 feed("") 继续查找）
+        """
+        self.text += chunk
+        text = self.text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if ch == "{":
+                    self._start = self._pos - 1
+                    self._depth = 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = text[self._start:self._pos]
+                    if _is_object(candidate):
+                        # 之后继续 feed 时从该对象之后查找下一个对象
+                        self._start = None
+                        return candidate
+                    # 不是合法 JSON（如说明文字中的花括号），从下一个 { 重新开始
+                    self._pos = self._start + 1
+                    self._start = None
+        return None
+
+
+def _is_object(text):
+    """文本是否为合法的 JSON 对象"""
+    try:
+        return isinstance(json.loads(text), dict)
+    except ValueError:
+        return False
+
+
+def has_verdict(obj_text, verdict_keys):
+    """
+    判断 JSON 对象是否包含判定所需的全部字段
+
+    Args:
+        obj_text: JSON 对象文本
+        verdict_keys: 判定字段
+
+    Returns:
+        bool: 是否包含全部字段
+    """
+    obj = json.loads(obj_text)
+    return all(key in obj for key in verdict_keys)
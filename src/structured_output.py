@@ -0,0 +1,337 @@
+"""
+结构化输出模块
+
+模型输出原先按代码块标记切分后直接 json.loads，多一个逗号、少一个引号或夹杂说明文字都会让整个用例记为 error。
+每个节点声明输出的 JSON 结构（NodeSchema：必填字段和取值范围），模型输出按以下步骤解析：
+- extract_json: 容错提取，先直接解析，失败时查找第一个括号配对的合法对象（见 stream_parser），
+  仍失败时修复常见缺陷（尾随逗号、单引号/中文引号、Python 字面量、缺失的逗号、被截断的结尾）后再解析
+- NodeSchema.validate: 校验必填字段和取值范围（取值忽略大小写和首尾空白，并规范化）
+- 只有仍不符合结构的输出才针对性重问（reask_prompt）：在原对话后追加模型的回复和具体问题，
+  要求只返回修正后的 JSON；原对话前缀可命中服务端前缀缓存，代价远小于整个用例重新执行
+
+配置 json_mode 开启模型服务的结构化输出模式（response_format）：
+- json_object: 要求模型只输出一个 JSON 对象
+- json_schema: 同时传入节点的 JSON Schema（非严格模式，允许提示词要求的其他字段）
+"""
+import re
+import json
+from . import stream_parser as sp
+
+# ==================== 结构化输出配置 ====================
+JSON_OBJECT = "json_object"
+JSON_SCHEMA = "json_schema"
+JSON_MODES = (JSON_OBJECT, JSON_SCHEMA)
+MAX_REASKS = 1  # 单个节点输出不符合结构时最多重问的次数
+
+PARSE_FAILED = "输出中没有可解析的 JSON 对象"
+REASK_TEMPLATE = """你上一条回复不符合输出格式要求：
+{problems}
+
+请基于同样的图片和判定规则重新回答。**只输出一个 JSON 对象，禁止输出任何其他文字、解释或代码块标记。**
+{requirements}"""
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.S | re.I)
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class NodeSchema:
+    """节点输出的 JSON 结构：必填字段、字段取值范围和嵌套的成员结构"""
+
+    def __init__(self, name, required=(), enums=None, members=None):
+        """
+        Args:
+            name: 结构名称（只含字母、数字、下划线，用于 json_schema 模式）
+            required: 必填字段
+            enums: {字段: 允许的取值}，字段存在时校验
+            members: {字段: NodeSchema}，值为嵌套 JSON 对象的必填字段（合并节点）
+        """
+        self.name = name
+        self.members = dict(members or {})
+        self.required = tuple(required) + tuple(k for k in self.members if k not in required)
+        self.enums = {key: tuple(values) for key, values in (enums or {}).items()}
+
+    def validate(self, obj, prefix=""):
+        """
+        校验输出，并把大小写/空白不同的取值规范化为声明的取值（原地修改）
+
+        Args:
+            obj: 解析后的 JSON 对象
+            prefix: 问题描述中字段名的前缀（嵌套结构）
+
+        Returns:
+            list: 问题描述，为空表示符合结构
+        """
+        problems = []
+        for key in self.required:
+            if key not in obj or obj[key] is None:
+                problems.append(f'缺少字段 "{prefix}{key}"')
+        for key, values in self.enums.items():
+            if obj.get(key) is None:
+                continue
+            normalized = str(obj[key]).strip().lower()
+            matched = [v for v in values if v.lower() == normalized]
+            if matched:
+                obj[key] = matched[0]
+            else:
+                problems.append(f'字段 "{prefix}{key}" 的值 {json.dumps(obj[key], ensure_ascii=False)} '
+                                f'不是 {"/".join(values)} 之一')
+        for key, schema in self.members.items():
+            if key not in obj or obj[key] is None:
+                continue
+            if not isinstance(obj[key], dict):
+                problems.append(f'字段 "{prefix}{key}" 应为 JSON 对象')
+                continue
+            problems.extend(schema.validate(obj[key], prefix=f"{prefix}{key}."))
+        return problems
+
+    def to_json_schema(self):
+        """
+        转换为 JSON Schema（允许额外字段）
+
+        Returns:
+            dict: JSON Schema 对象
+        """
+        properties = {key: {"type": "string", "enum": list(values)} for key, values in self.enums.items()}
+        properties.update({key: schema.to_json_schema() for key, schema in self.members.items()})
+        return {"type": "object", "properties": properties, "required": list(self.required)}
+
+    def describe(self, prefix=""):
+        """
+        结构要求的文字说明（用于重问）
+
+        Returns:
+            list: 每个字段一行说明
+        """
+        lines = []
+        for key in self.required:
+            if key in self.members:
+                lines.extend(self.members[key].describe(prefix=f"{prefix}{key}."))
+            elif key in self.enums:
+                lines.append(f'- "{prefix}{key}": {" / ".join(self.enums[key])}')
+            else:
+                lines.append(f'- "{prefix}{key}": 必填')
+        return lines
+
+
+# ==================== 容错提取 ====================
+
+def _loads(text):
+    """解析 JSON 对象，失败或不是对象时返回 None"""
+    try:
+        obj = json.loads(text, strict=False)
+    except (ValueError, TypeError):
+        return None
+    return obj if isinstance(obj, dict) else None
+
+
+def _last_significant(out):
+    """已输出内容中最后一个非空白字符"""
+    for part in reversed(out):
+        stripped = part.rstrip()
+        if stripped:
+            return stripped[-1]
+    return ""
+
+
+def _after_value(out):
+    """上一个记号是否为完整的值（此时开始新的值说明缺少逗号）"""
+    last = _last_significant(out)
+    return bool(last) and (last in '"}]' or last.isalnum())
+
+
+def repair_json(text):
+    """
+    修复 JSON 对象文本中的常见缺陷
+
+    - 单引号或中文引号（“”）作为字符串边界时替换为双引号（字符串内容中的中文引号保留）
+    - 字符串外的中文逗号/冒号、Python 字面量（True/False/None）、缺少引号的键和取值
+    - 尾随逗号、值之间缺失的逗号
+    - 被截断的结尾：补齐未闭合的字符串和括号
+    - 第一个对象闭合后的内容被丢弃
+
+    Args:
+        text: 以 { 开始的文本
+
+    Returns:
+        str: 修复后的文本（不保证可以解析）
+    """
+    out = []
+    stack = []
+    quote = None  # 当前字符串的结束引号
+    i = 0
+    while i < len(text):
+        ch = text[i]
+        if quote is not None:
+            if ch == "\\" and i + 1 < len(text):
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                # 单引号/中文引号字符串中的双引号需要转义
+                out.append('\\"')
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in "\"'“":
+            if _after_value(out):
+                out.append(",")
+            quote = '"' if ch == '"' else ("'" if ch == "'" else "”")
+            out.append('"')
+        elif ch in "{[":
+            if _after_value(out):
+                out.append(",")
+            stack.append(ch)
+            out.append(ch)
+        elif ch in "}]":
+            if _last_significant(out) == ",":
+                while out[-1].strip() != ",":
+                    out.pop()
+                out.pop()
+            if stack:
+                stack.pop()
+            out.append(ch)
+            if not stack:
+                break
+        elif ch in ",，":
+            out.append(",")
+        elif ch in ":：":
+            out.append(":")
+        elif ch.isalpha():
+            j = i
+            while j < len(text) and (text[j].isalnum() or text[j] == "_"):
+                j += 1
+            word = text[i:j]
+            if _after_value(out):
+                out.append(",")
+            if word in _LITERALS.values():
+                out.append(word)
+            elif word in _LITERALS:
+                out.append(_LITERALS[word])
+            else:
+                # 缺少引号的键或取值
+                out.append(json.dumps(word, ensure_ascii=False))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    if quote is not None:
+        out.append('"')
+    if _last_significant(out) == ",":
+        while out[-1].strip() != ",":
+            out.pop()
+        out.pop()
+    if _last_significant(out) == ":":
+        out.append("null")
+    out.extend(_CLOSERS[opener] for opener in reversed(stack))
+    return "".join(out)
+
+
+def extract_json(text):
+    """
+    从模型输出中容错提取第一个 JSON 对象
+
+    Args:
+        text: 模型返回的原始文本
+
+    Returns:
+        dict or None: 解析后的 JSON 对象，无法提取时返回 None
+    """
+    if not isinstance(text, str):
+        return None
+    fence = _FENCE.search(text)
+    obj = _loads((fence.group(1) if fence else text).strip())
+    if obj is not None:
+        return obj
+    candidate = sp.JsonObjectScanner().feed(text)
+    if candidate is not None:
+        return _loads(candidate)
+    start = text.find("{")
+    if start < 0:
+        return None
+    return _loads(repair_json(text[start:]))
+
+
+def parse(text, schema=None):
+    """
+    提取并校验模型输出
+
+    Args:
+        text: 模型返回的原始文本
+        schema: 节点输出结构（NodeSchema），None 时只要求是非空 JSON 对象
+
+    Returns:
+        tuple: (JSON 对象或 None, 问题描述列表)，问题列表为空表示可以使用
+    """
+    output = extract_json(text)
+    if not output:
+        return None, [PARSE_FAILED]
+    if schema is None:
+        return output, []
+    return output, schema.validate(output)
+
+
+def reask_prompt(problems, schema=None):
+    """
+    构建针对性重问的提示词
+
+    Args:
+        problems: 上一次输出的问题描述
+        schema: 节点输出结构（用于列出字段要求）
+
+    Returns:
+        str: 追加在原对话之后的用户消息
+    """
+    requirements = ""
+    if schema is not None and schema.required:
+        requirements = "必须包含以下字段：\n" + "\n".join(schema.describe())
+    return REASK_TEMPLATE.format(
+        problems="\n".join(f"- {problem}" for problem in problems), requirements=requirements
+    ).rstrip()
+
+
+# ==================== 模型服务结构化输出模式 ====================
+
+def get_json_mode(config):
+    """
+    读取配置的结构化输出模式
+
+    Args:
+        config: 模型配置字典
+
+    Returns:
+        str or None: JSON_OBJECT / JSON_SCHEMA，未开启或取值无效时返回 None
+    """
+    mode = config.get('json_mode')
+    if not isinstance(mode, str):
+        return None
+    mode = mode.strip().lower()
+    return mode if mode in JSON_MODES else None
+
+
+def response_format(mode, schema=None):
+    """
+    构建请求的 response_format 参数
+
+    Args:
+        mode: 结构化输出模式（get_json_mode 的返回值）
+        schema: 节点输出结构，json_schema 模式下没有结构时退化为 json_object
+
+    Returns:
+        dict or None: response_format 参数，未开启时返回 None
+    """
+    if mode is None:
+        return None
+    if mode == JSON_SCHEMA and schema is not None:
+        return {
+            "type": JSON_SCHEMA,
+            "json_schema": {"name": schema.name, "schema": schema.to_json_schema(), "strict": False}
+        }
+    return {"type": JSON_OBJECT}
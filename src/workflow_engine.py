@@ -7,315 +7,505 @@
 - final_pass="yes": 生成图通过所有审核，质量合格
 - final_pass="no": 生成图在某个节点被明确判定为不合格
 - final_pass="unknown": 无法判定（如节点4找不到匹配视角，或节点5返回unknown）
+
+5个节点以声明式 NodeSpec 定义在 WORKFLOW_NODES 中，由 pipeline.Pipeline 统一执行
+（提示词查找、调用、解析、分支、提前返回），新增或调整节点顺序只需修改节点声明：
+- run_workflow_for_case: 同步执行，使用 call_single 等阻塞调用
+- run_workflow_for_case_async: 异步执行，使用 call_single_async 等协程调用
+
+模型调用最终失败（ModelCallError）时返回 final_pass="error" 的结果；每个结果附带 call_stats
+（用例级调用/重试次数、耗时、令牌用量）和 node_metrics（各节点的耗时、限流等待、重试次数、令牌用量）
+
+传入 ImageProfile 时按节点缩放/重新编码图片并调整 detail（见 image_preprocess）；
+传入 NodeMemo 时，执行器在调用前先查询历史运行中上游一致的节点输出，命中则直接复用；
+结果中的 node_outputs / prompt_hashes / ref_hash 会写入历史记录供后续运行复用
+
+节点1-3只依赖生成图，precheck_mode 控制其调用方式（见 PRECHECK_MODES）：
+- sequential: 按顺序逐个调用，前面的节点未通过时不再调用后续节点（调用数最少）
+- speculative: 同时发起节点1-3，仍按节点顺序判定，前面的节点未通过时丢弃/取消后续调用
+  （延迟最低，代价是多出的调用，见 call_stats 中的投机统计）
+- fused: 一次调用同时回答节点1-3（提示词见 _build_fused_prompt），输出拆分回各节点后按顺序判定，
+  finish_at_step 与逐个调用一致；节点指标中合并调用记在节点1
+
+每个节点声明输出结构（NODE_SCHEMAS：判定字段及其取值），模型输出容错解析后按结构校验，
+不符合时针对性重问一次（见 structured_output），仍不符合才返回 final_pass="error"
 """
+import json
 from . import model_client as mc
 from . import config_manager as cm
+from . import retry_policy as rp
+from . import node_memo as nm
+from . import metrics
+from . import image_preprocess as ip
+from . import image_cache as ic
+from . import ref_registry as rr
+from .structured_output import NodeSchema
+from .call_context import CallContext
+from .pipeline import NodeSpec, NodeOutcome, Pipeline, PipelineHook, TimingHook, NodeExecutor, RunState
 
+# ==================== 节点1-3调用方式 ====================
+PRECHECK_SEQUENTIAL = "sequential"
+PRECHECK_SPECULATIVE = "speculative"
+PRECHECK_FUSED = "fused"
+PRECHECK_MODES = (PRECHECK_SEQUENTIAL, PRECHECK_SPECULATIVE, PRECHECK_FUSED)
 
-def run_workflow_for_case(case_data, ref_data, prompts):
-    """
-    执行5节点审图工作流
+FUSED_NODES = (1, 2, 3)  # 合并调用的节点
+FUSED_PROMPT_KEY = "fused"  # prompts 中专用合并提示词的键（见 data_manager.get_fused_prompt）
+FUSED_PROMPT_TEMPLATE = """你需要对同一张图片完成以下{count}项相互独立的检查，每项检查的判定规则见对应部分。
+
+## 合并输出格式
+**严格要求：必须且仅能返回一个 JSON 对象，禁止输出任何其他文字、解释或说明**
+各检查中的"输出格式"只说明该项检查的 JSON 字段，不要分别输出；
+请把每项检查的 JSON 对象放在对应的键下（所有检查都必须给出结果）：
 
-    工作流逻辑：
-    1. Node1: 判断是否有车且可用 -> car="yes"才继续
-    2. Node2: 判断是否裁切 -> cropping="no"才继续
-    3. Node3: 判断车牌有字/无人驾驶 -> match="yes"才继续
-    4. Node4: 判断视角一致 -> match="yes"才继续到Node5，match="no"返回unknown
-    5. Node5: 判断细节一致 -> match="yes"返回yes，match="no"返回no，match="unknown"返回unknown
+{example}
+
+{sections}"""
+
+
+def get_model_config(config=None):
+    """
+    获取模型配置摘要
 
     Args:
-        case_data: 测试用例数据（dict）
-        ref_data: 参考图数据（dict）
-        prompts: 提示词字典 {1: {...}, 2: {...}, ...}
+        config: 配置字典，None 时使用当前激活的配置
 
     Returns:
-        dict: {
-            "final_pass": "yes" | "no" | "unknown" | "error",
-            "finish_at_step": 1-5,
-            "parse_output": {...},
-            "reason": "失败原因或成功信息",
-            "prompt_versions": {"p1": "v1.0.0", ...},
-            "model_config": {"model_id": "...", "thinking_mode": "..."}
-        }
+        dict: {"config_id": "...", "model_id": "...", "thinking_mode": "..."}
     """
-    case_url = case_data['case_url']
+    if config is None:
+        config = cm.get_active_config()
+    return {
+        "config_id": str(config.get('config_id', 'unknown')),
+        "model_id": config.get('model_id', 'unknown'),
+        "thinking_mode": config.get('thinking_mode', 'unknown')
+    }
 
-    # 获取模型客户端（使用激活的配置）
-    client = mc.get_client()
 
-    # 获取当前激活的模型配置
-    active_config = cm.get_active_config()
-    model_config = {
-        "model_id": active_config.get('model_id', 'unknown'),
-        "thinking_mode": active_config.get('thinking_mode', 'unknown')
-    }
+def _get_ordered_ref_urls(ref_data):
+    """
+    按顺序提取有效的参考图URL
 
-    # 收集提示词版本信息
-    prompt_versions = {}
-
-    # ==================== Node 1: 判断是否存在汽车 ====================
-    p1_data = prompts.get(1, {})
-    p1 = p1_data.get('prompt_content', "")
-    prompt_versions["p1"] = p1_data.get('prompt_version', "unknown")
-
-    if not p1:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 1,
-            "parse_output": {"error": "Prompt 1 not found"},
-            "reason": "缺少Node1提示词",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+    Args:
+        ref_data: 参考图数据（dict）
 
-    resp1_text = client.call_single(p1, case_url)
-    resp1_json = client.parse_json_response(resp1_text)
-
-    if not resp1_json:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 1,
-            "parse_output": {"error": "Failed to parse JSON", "raw_response": resp1_text[:200]},
-            "reason": "Node1 JSON解析失败",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+    Returns:
+        list: 参考图URL列表（ref_url_1 ~ ref_url_5 中以 http 开头的）
+    """
+    return rr.ordered_ref_urls(ref_data)
 
-    if resp1_json.get('car') != 'yes':
-        return {
-            "final_pass": "no",
-            "finish_at_step": 1,
-            "parse_output": resp1_json,
-            "reason": "图片中未检测到可用汽车",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
 
-    # ==================== Node 2: 判断车身是否被裁切 ====================
-    p2_data = prompts.get(2, {})
-    p2 = p2_data.get('prompt_content', "")
-    prompt_versions["p2"] = p2_data.get('prompt_version', "unknown")
-
-    if not p2:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 2,
-            "parse_output": {"error": "Prompt 2 not found"},
-            "reason": "缺少Node2提示词",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+def _get_ref_set(case_data, ref_data):
+    """
+    获取用例的参考图集合
 
-    resp2_text = client.call_single(p2, case_url)
-    resp2_json = client.parse_json_response(resp2_text)
-
-    if not resp2_json:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 2,
-            "parse_output": {"error": "Failed to parse JSON", "raw_response": resp2_text[:200]},
-            "reason": "Node2 JSON解析失败",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+    Args:
+        case_data: 测试用例数据
+        ref_data: 参考图数据（dict），或任务内已准备好的 RefSet
 
-    if resp2_json.get('cropping') == 'yes':
-        return {
-            "final_pass": "no",
-            "finish_at_step": 2,
-            "parse_output": resp2_json,
-            "reason": "车身被裁切，不完整",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+    Returns:
+        RefSet: 参考图集合
+    """
+    if isinstance(ref_data, rr.RefSet):
+        return ref_data
+    return rr.RefSet.from_ref_data(case_data.get('car'), ref_data)
 
-    # ==================== Node 3: 判断车牌有字/无人驾驶 ====================
-    p3_data = prompts.get(3, {})
-    p3 = p3_data.get('prompt_content', "")
-    prompt_versions["p3"] = p3_data.get('prompt_version', "unknown")
-
-    if not p3:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 3,
-            "parse_output": {"error": "Prompt 3 not found"},
-            "reason": "缺少Node3提示词",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
 
-    resp3_text = client.call_single(p3, case_url)
-    resp3_json = client.parse_json_response(resp3_text)
-
-    if not resp3_json:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 3,
-            "parse_output": {"error": "Failed to parse JSON", "raw_response": resp3_text[:200]},
-            "reason": "Node3 JSON解析失败",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+def _case_images(case_url, ref_set):
+    """
+    用例各节点发送的图片
 
-    if resp3_json.get('match') == 'no':
-        return {
-            "final_pass": "no",
-            "finish_at_step": 3,
-            "parse_output": resp3_json,
-            "reason": resp3_json.get('reason', '检测到车牌有字或无人驾驶'),
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+    Returns:
+        list: [(url, node, role)]，role 为 gen（生成图）或 ref（参考图）
+    """
+    images = []
+    for node in WORKFLOW_NODES:
+        images.append((case_url, node.index, "gen"))
+        if node.call_kind != "single":
+            images.extend((url, node.index, "ref") for url in ref_set)
+    return images
 
-    # ==================== Node 4: 判断视角是否一致 ====================
-    ordered_ref_urls = []
-    for i in range(1, 6):
-        u = ref_data.get(f'ref_url_{i}')
-        if u and str(u).strip() and str(u).startswith('http'):
-            ordered_ref_urls.append(u)
-
-    if not ordered_ref_urls:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 4,
-            "parse_output": {"error": "No valid reference images"},
-            "reason": f"缺少{case_data.get('car', 'unknown')}的参考图",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
 
-    p4_data = prompts.get(4, {})
-    p4 = p4_data.get('prompt_content', "")
-    prompt_versions["p4"] = p4_data.get('prompt_version', "unknown")
-
-    if not p4:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 4,
-            "parse_output": {"error": "Prompt 4 not found"},
-            "reason": "缺少Node4提示词",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+# ==================== 节点4/5 的辅助逻辑 ====================
 
-    # 使用call_multi_ref：参考图在前，生成图在后
-    resp4_text = client.call_multi_ref(p4, ordered_ref_urls, case_url)
-    resp4_json = client.parse_json_response(resp4_text)
-
-    if not resp4_json:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 4,
-            "parse_output": {"error": "Failed to parse JSON", "raw_response": resp4_text[:200]},
-            "reason": "Node4 JSON解析失败",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+def _require_ref_urls(state):
+    """节点4前置检查：必须存在有效参考图"""
+    state.ref_urls = state.ref_set
+    if not state.ref_urls:
+        return NodeOutcome(
+            "error",
+            f"缺少{state.case_data.get('car', 'unknown')}的参考图",
+            {"error": "No valid reference images"}
+        )
+    return None
 
-    # 节点4的match="no"表示没有找到匹配的参考图视角，返回unknown
-    if resp4_json.get('match') == 'no':
-        return {
-            "final_pass": "unknown",
-            "finish_at_step": 4,
-            "parse_output": resp4_json,
-            "reason": "未找到与生成图视角匹配的参考图，无法判定",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
 
-    # 解析匹配的参考图索引
-    # 图片传递顺序：[参考图1, 参考图2, ..., 参考图N, 生成图]
-    # 模型返回的match_image应该是参考图的顺序值（1-N）
-    matched_ref_url = None
-    match_image_value = resp4_json.get('match_image', '')
+def _resolve_match_image(output, state):
+    """
+    节点4通过后解析匹配的参考图
+
+    图片传递顺序：[参考图1, 参考图2, ..., 参考图N, 生成图]
+    模型返回的match_image应该是参考图的顺序值（1-N）
+    """
+    match_image_value = output.get('match_image', '')
 
     try:
         idx = int(match_image_value)
-        # 模型返回1-N，对应ordered_ref_urls[0-(N-1)]
-        if 1 <= idx <= len(ordered_ref_urls):
-            matched_ref_url = ordered_ref_urls[idx - 1]
+        # 模型返回1-N，对应ref_urls[0-(N-1)]
+        if 1 <= idx <= len(state.ref_urls):
+            state.matched_ref_url = state.ref_urls[idx - 1]
         else:
-            return {
-                "final_pass": "error",
-                "finish_at_step": 4,
-                "parse_output": resp4_json,
-                "reason": f"match_image索引超出范围: {idx} (期望1-{len(ordered_ref_urls)})",
-                "prompt_versions": prompt_versions,
-                "model_config": model_config
-            }
+            return NodeOutcome(
+                "error", f"match_image索引超出范围: {idx} (期望1-{len(state.ref_urls)})"
+            )
     except (ValueError, TypeError):
         # 尝试作为URL处理（兼容性）
         if str(match_image_value).startswith('http'):
-            matched_ref_url = match_image_value
+            state.matched_ref_url = match_image_value
         else:
-            return {
-                "final_pass": "error",
-                "finish_at_step": 4,
-                "parse_output": resp4_json,
-                "reason": f"无法解析match_image: {match_image_value}",
-                "prompt_versions": prompt_versions,
-                "model_config": model_config
-            }
-
-    description = resp4_json.get('reference_vehicle_description', '')
-
-    # ==================== Node 5: 判断细节是否一致 ====================
-    p5_data = prompts.get(5, {})
-    p5 = p5_data.get('prompt_content', "")
-    prompt_versions["p5"] = p5_data.get('prompt_version', "unknown")
-
-    if not p5:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 5,
-            "parse_output": {"error": "Prompt 5 not found"},
-            "reason": "缺少Node5提示词",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+            return NodeOutcome("error", f"无法解析match_image: {match_image_value}")
 
-    # 使用call_compare：参考图+描述+生成图
-    resp5_text = client.call_compare(p5, matched_ref_url, case_url, description)
-    resp5_json = client.parse_json_response(resp5_text)
-
-    if not resp5_json:
-        return {
-            "final_pass": "error",
-            "finish_at_step": 5,
-            "parse_output": {"error": "Failed to parse JSON", "raw_response": resp5_text[:200]},
-            "reason": "Node5 JSON解析失败",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
+    state.description = output.get('reference_vehicle_description', '')
+    return None
 
-    # 节点5的match结果直接映射到final_pass
-    match_result = resp5_json.get('match', 'unknown')
-    
-    if match_result == 'yes':
-        return {
-            "final_pass": "yes",
-            "finish_at_step": 5,
-            "parse_output": resp5_json,
-            "reason": "所有审核节点通过",
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
-    elif match_result == 'no':
-        return {
-            "final_pass": "no",
-            "finish_at_step": 5,
-            "parse_output": resp5_json,
-            "reason": resp5_json.get('reason', '细节不一致'),
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
-        }
-    else:
-        # match="unknown" 或其他情况
-        return {
-            "final_pass": "unknown",
-            "finish_at_step": 5,
-            "parse_output": resp5_json,
-            "reason": resp5_json.get('reason', '无法判定细节是否一致'),
-            "prompt_versions": prompt_versions,
-            "model_config": model_config
+
+def _node5_outcome(output):
+    """节点5未通过时的结果：match="no"返回no，其他情况返回unknown"""
+    if output.get('match') == 'no':
+        return NodeOutcome("no", output.get('reason', '细节不一致'))
+    return NodeOutcome("unknown", output.get('reason', '无法判定细节是否一致'))
+
+
+# ==================== 节点1-3合并调用 ====================
+
+def _fused_key(index):
+    """合并输出中节点的键"""
+    return f"node{index}"
+
+
+def _split_fused_output(output):
+    """合并输出拆分为 {节点序号: 节点输出}"""
+    return {i: output.get(_fused_key(i)) for i in FUSED_NODES}
+
+
+def _join_fused_output(outputs):
+    """各节点输出合并为合并输出（复用历史输出时使用）"""
+    return {_fused_key(i): outputs[i] for i in FUSED_NODES}
+
+
+def _build_fused_prompt(state):
+    """
+    构建节点1-3的合并提示词
+
+    优先使用专用合并提示词（prompts[FUSED_PROMPT_KEY]），否则拼接激活的 prompt_01 ~ prompt_03：
+    每个节点的提示词原样作为一个检查部分，合并输出格式放在最前面
+
+    Returns:
+        tuple: (提示词，任一节点提示词缺失时为空字符串, {版本键: 版本})
+    """
+    fused = state.prompts.get(FUSED_PROMPT_KEY) or {}
+    if fused.get('prompt_content'):
+        return fused['prompt_content'], {"fused": fused.get('prompt_version', "unknown")}
+
+    versions = {"fused": "composed"}
+    sections = []
+    for i in FUSED_NODES:
+        p_data = state.prompts.get(i, {})
+        versions[f"p{i}"] = p_data.get('prompt_version', "unknown")
+        if not p_data.get('prompt_content'):
+            return "", versions
+        sections.append(f"# 检查{i}（结果放在 \"{_fused_key(i)}\" 键下）\n\n{p_data['prompt_content']}")
+    example = "{\n" + ",\n".join(f'  "{_fused_key(i)}": {{...检查{i}的JSON...}}' for i in FUSED_NODES) + "\n}"
+    return FUSED_PROMPT_TEMPLATE.format(
+        count=len(FUSED_NODES), example=example, sections="\n\n".join(sections)
+    ), versions
+
+
+# ==================== 节点输出结构 ====================
+YES_NO = ("yes", "no")
+NODE_SCHEMAS = {
+    1: NodeSchema("node1", required=("car",), enums={"car": YES_NO}),
+    2: NodeSchema("node2", required=("cropping",), enums={"cropping": YES_NO}),
+    3: NodeSchema("node3", required=("match",), enums={"match": YES_NO}),
+    4: NodeSchema("node4", required=("match",), enums={"match": YES_NO}),
+    5: NodeSchema("node5", required=("match",), enums={"match": YES_NO + ("unknown",)}),
+}
+FUSED_SCHEMA = NodeSchema("fused", members={_fused_key(i): NODE_SCHEMAS[i] for i in FUSED_NODES})
+
+
+# ==================== 节点声明 ====================
+# 1. Node1: 判断是否有车且可用 -> car="yes"才继续
+# 2. Node2: 判断是否裁切 -> cropping="no"才继续
+# 3. Node3: 判断车牌有字/无人驾驶 -> match="yes"才继续
+# 4. Node4: 判断视角一致 -> match="yes"才继续到Node5，match="no"返回unknown
+# 5. Node5: 判断细节一致 -> match="yes"返回yes，match="no"返回no，match="unknown"返回unknown
+WORKFLOW_NODES = [
+    NodeSpec(
+        1, "判断是否存在汽车", "single",
+        build_args=lambda st: (st.case_url,),
+        passes=lambda out: out.get('car') == 'yes',
+        on_fail=lambda out: NodeOutcome("no", "图片中未检测到可用汽车"),
+        verdict_keys=("car",),
+        independent=True,
+        schema=NODE_SCHEMAS[1]
+    ),
+    NodeSpec(
+        2, "判断车身是否被裁切", "single",
+        build_args=lambda st: (st.case_url,),
+        passes=lambda out: out.get('cropping') != 'yes',
+        on_fail=lambda out: NodeOutcome("no", "车身被裁切，不完整"),
+        verdict_keys=("cropping",),
+        independent=True,
+        schema=NODE_SCHEMAS[2]
+    ),
+    NodeSpec(
+        3, "判断车牌有字/无人驾驶", "single",
+        build_args=lambda st: (st.case_url,),
+        passes=lambda out: out.get('match') != 'no',
+        on_fail=lambda out: NodeOutcome("no", out.get('reason', '检测到车牌有字或无人驾驶')),
+        verdict_keys=("match",),
+        independent=True,
+        schema=NODE_SCHEMAS[3]
+    ),
+    NodeSpec(
+        # 使用call_multi_ref：参考图在前，生成图在后（参考图前缀由 RefSet 预先构建）
+        4, "判断视角是否一致", "multi_ref",
+        precheck=_require_ref_urls,
+        build_args=lambda st: (st.ref_urls, st.case_url),
+        passes=lambda out: out.get('match') != 'no',
+        on_fail=lambda out: NodeOutcome("unknown", "未找到与生成图视角匹配的参考图，无法判定"),
+        on_pass=_resolve_match_image,
+        schema=NODE_SCHEMAS[4]
+    ),
+    NodeSpec(
+        # 使用call_compare：参考图+描述+生成图
+        5, "判断细节是否一致", "compare",
+        build_args=lambda st: (st.matched_ref_url, st.case_url, st.description),
+        passes=lambda out: out.get('match') == 'yes',
+        on_fail=_node5_outcome,
+        schema=NODE_SCHEMAS[5]
+    ),
+]
+
+WORKFLOW_PIPELINE = Pipeline(WORKFLOW_NODES, success_reason="所有审核节点通过")
+
+# 节点1-3合并为一次调用（precheck_mode="fused"），判定仍由各成员节点完成
+FUSED_NODE = NodeSpec(
+    1, "判断汽车/裁切/车牌（合并调用）", "single",
+    build_args=lambda st: (st.case_url,),
+    passes=None,
+    on_fail=None,
+    verdict_keys=tuple(_fused_key(i) for i in FUSED_NODES),
+    members=WORKFLOW_NODES[:len(FUSED_NODES)],
+    split_output=_split_fused_output,
+    build_prompt=_build_fused_prompt,
+    schema=FUSED_SCHEMA
+)
+
+WORKFLOW_PIPELINE_FUSED = Pipeline(
+    [FUSED_NODE] + WORKFLOW_NODES[len(FUSED_NODES):], success_reason="所有审核节点通过"
+)
+
+
+# ==================== 执行器钩子 ====================
+
+class MemoHook(PipelineHook):
+    """历史节点输出复用钩子：命中时跳过模型调用（合并节点需所有成员都命中）"""
+
+    def __init__(self, memo, prompt_hashes, refs_hash, image_key=None):
+        """
+        Args:
+            memo: NodeMemo
+            prompt_hashes: 当前提示词内容哈希
+            refs_hash: 当前参考图集合哈希
+            image_key: 当前图片预处理方案哈希
+        """
+        self.memo = memo
+        self.prompt_hashes = prompt_hashes
+        self.refs_hash = refs_hash
+        self.image_key = image_key
+
+    def before_call(self, call, state):
+        if call.reask is not None:
+            return None
+        outputs = {}
+        for node in call.node.members or [call.node]:
+            key = nm.make_memo_key(
+                state.case_url, node.index, self.prompt_hashes, state.model_config, self.refs_hash,
+                self.image_key
+            )
+            outputs[node.index] = self.memo.get(key)
+            if outputs[node.index] is None:
+                return None
+        output = _join_fused_output(outputs) if call.node.members else outputs[call.index]
+        call.node_ctx(state).record_memo_hit()
+        metrics.VLM_MEMO_HITS.inc(node=call.index)
+        # 序列化为JSON文本，按模型输出同样的方式交给流水线解析
+        return json.dumps(output, ensure_ascii=False)
+
+
+def _prepare_run(case_data, ref_data, prompts, bypass_cache, memo, client, inline_images, image_profile,
+                 precheck_mode):
+    """
+    创建执行器和运行状态（同步/异步共用）
+
+    Returns:
+        tuple: (NodeExecutor, RunState)
+    """
+    # 未指定客户端时使用激活配置的全局客户端
+    if client is None:
+        client = mc.get_client()
+    ref_set = _get_ref_set(case_data, ref_data)
+    ctx = CallContext(
+        rp.RetryBudget.from_config(client.config),
+        bypass_cache=bypass_cache,
+        inline_images=inline_images,
+        image_profile=image_profile,
+        case_url=case_data['case_url'],
+        ref_set=ref_set
+    )
+    state = RunState(case_data, ref_data, prompts, get_model_config(client.config), ctx)
+    state.prompt_hashes = nm.get_prompt_hashes(prompts)
+    state.ref_set = ref_set
+    state.ref_hash = ref_set.hash
+    state.image_profile = image_profile.name if image_profile is not None else ip.DEFAULT_PROFILE
+    # 复用键按实际发送的图片计算（预处理失败的图片按原图发送）
+    state.image_profile_key = ip.effective_key(
+        image_profile, _case_images(case_data['case_url'], ref_set),
+        ic.get_image_cache() if inline_images else None
+    )
+    if precheck_mode == PRECHECK_FUSED:
+        # 合并调用的输出与逐个调用不同，复用键改用合并提示词的哈希，两种方式的历史输出互不复用
+        fused_hash = nm.prompt_hash(_build_fused_prompt(state)[0])
+        state.prompt_hashes.update({f"p{i}": fused_hash for i in FUSED_NODES})
+
+    hooks = [TimingHook()]
+    # 跳过缓存时同时跳过历史输出复用
+    if memo is not None and not bypass_cache:
+        hooks.append(MemoHook(memo, state.prompt_hashes, state.ref_hash, state.image_profile_key))
+
+    if precheck_mode not in PRECHECK_MODES:
+        raise ValueError(f"未知的节点1-3调用方式: {precheck_mode}")
+    speculative = precheck_mode == PRECHECK_SPECULATIVE
+    return NodeExecutor(client, hooks, speculative=speculative), state
+
+
+def _pipeline(precheck_mode):
+    """节点1-3调用方式对应的流水线"""
+    return WORKFLOW_PIPELINE_FUSED if precheck_mode == PRECHECK_FUSED else WORKFLOW_PIPELINE
+
+
+def _finish_run(result, state):
+    """补充调用统计和复用所需字段"""
+    result["call_stats"] = state.ctx.to_dict()
+    result["node_metrics"] = state.ctx.node_metrics_dict()
+    result["node_outputs"] = state.node_outputs
+    result["prompt_hashes"] = state.prompt_hashes
+    result["ref_hash"] = state.ref_hash
+    result["image_profile"] = state.image_profile
+    result["image_profile_key"] = state.image_profile_key
+    return result
+
+
+def image_unavailable_result(reason, client=None, image_profile=None):
+    """
+    构建生成图无法访问时的结果（不调用模型）
+
+    Args:
+        reason: 图片下载失败原因
+        client: 模型客户端（用于记录模型配置），None 时使用激活配置的全局客户端
+        image_profile: 图片预处理方案（ImageProfile），None 表示原图
+
+    Returns:
+        dict: 工作流结果，格式同 run_workflow_for_case，final_pass="error"，finish_at_step=0
+    """
+    if client is None:
+        client = mc.get_client()
+    return {
+        "final_pass": "error",
+        "finish_at_step": 0,
+        "parse_output": {"error": reason, "error_type": "image_unavailable"},
+        "reason": f"生成图无法访问（{reason}）",
+        "prompt_versions": {},
+        "model_config": get_model_config(client.config),
+        "call_stats": CallContext().to_dict(),
+        "node_metrics": {},
+        "node_outputs": {},
+        "prompt_hashes": {},
+        "ref_hash": None,
+        "image_profile": image_profile.name if image_profile is not None else ip.DEFAULT_PROFILE,
+        "image_profile_key": image_profile.key if image_profile is not None else None
+    }
+
+
+def run_workflow_for_case(case_data, ref_data, prompts, bypass_cache=False, memo=None, client=None,
+                          inline_images=False, image_profile=None, precheck_mode=PRECHECK_SEQUENTIAL):
+    """
+    执行5节点审图工作流（同步版本）
+
+    Args:
+        case_data: 测试用例数据（dict）
+        ref_data: 参考图数据（dict），或任务内已准备好的参考图集合（RefSet）
+        prompts: 提示词字典 {1: {...}, 2: {...}, ...}，合并调用时可含专用合并提示词 {"fused": {...}}
+        bypass_cache: 是否跳过响应缓存和历史输出复用（强制重新调用模型）
+        memo: 节点输出复用索引（NodeMemo），None 表示不复用
+        client: 模型客户端（ModelClient），None 时使用激活配置的全局客户端
+        inline_images: 是否以本地缓存图片的 data URL 发送图片（需先预取，见 image_cache）
+        image_profile: 图片预处理方案（ImageProfile），None 表示原图发送
+        precheck_mode: 节点1-3调用方式（PRECHECK_MODES），默认顺序调用
+
+    Returns:
+        dict: {
+            "final_pass": "yes" | "no" | "unknown" | "error",
+            "finish_at_step": 1-5,
+            "parse_output": {...},
+            "reason": "失败原因或成功信息",
+            "prompt_versions": {"p1": "v1.0.0", ...},
+            "model_config": {"config_id": "...", "model_id": "...", "thinking_mode": "..."},
+            "call_stats": {...},
+            "node_metrics": {"1": {"wall_ms", "latency_ms", "queue_wait_ms", "retries",
+                                   "prompt_tokens", "completion_tokens", "reasoning_tokens", ...}, ...},
+            "node_outputs": {"1": {...}, ...},
+            "prompt_hashes": {"p1": "...", ...},
+            "ref_hash": "...",
+            "image_profile": "original",
+            "image_profile_key": None
         }
+    """
+    executor, state = _prepare_run(
+        case_data, ref_data, prompts, bypass_cache, memo, client, inline_images, image_profile,
+        precheck_mode
+    )
+    result = executor.run(_pipeline(precheck_mode), state)
+    return _finish_run(result, state)
+
+
+async def run_workflow_for_case_async(case_data, ref_data, prompts, bypass_cache=False, memo=None,
+                                      client=None, inline_images=False, image_profile=None,
+                                      precheck_mode=PRECHECK_SEQUENTIAL):
+    """
+    执行5节点审图工作流（异步版本）
+
+    与 run_workflow_for_case 逻辑完全一致，模型调用使用共享连接池的异步客户端，
+    适合在单个事件循环中并发执行大量用例
+
+    Args:
+        case_data: 测试用例数据（dict）
+        ref_data: 参考图数据（dict），或任务内已准备好的参考图集合（RefSet）
+        prompts: 提示词字典 {1: {...}, 2: {...}, ...}，合并调用时可含专用合并提示词 {"fused": {...}}
+        bypass_cache: 是否跳过响应缓存和历史输出复用（强制重新调用模型）
+        memo: 节点输出复用索引（NodeMemo），None 表示不复用
+        client: 模型客户端（ModelClient），None 时使用激活配置的全局客户端
+        inline_images: 是否以本地缓存图片的 data URL 发送图片（需先预取，见 image_cache）
+        image_profile: 图片预处理方案（ImageProfile），None 表示原图发送
+        precheck_mode: 节点1-3调用方式（PRECHECK_MODES），默认顺序调用
+
+    Returns:
+        dict: 工作流结果，格式同 run_workflow_for_case
+    """
+    executor, state = _prepare_run(
+        case_data, ref_data, prompts, bypass_cache, memo, client, inline_images, image_profile,
+        precheck_mode
+    )
+    result = await executor.run_async(_pipeline(precheck_mode), state)
+    return _finish_run(result, state)